@@ -1,9 +1,8 @@
 import streamlit as st
 import pandas as pd
-import os
 import io
+import time
 from datetime import datetime
-import tempfile
 import sys
 
 # Importar el módulo de archivo plano
@@ -13,6 +12,24 @@ except ImportError:
     st.error("❌ No se pudo importar archivo_plano.py. Asegúrate de que esté en el mismo directorio.")
     st.stop()
 
+import cache_archivos
+import diferencias
+import encabezados
+import historial
+import maestro
+import manifiesto
+import procesamiento
+import salida
+import trabajos
+import validacion
+
+# Segundos entre consultas al avance del trabajo en segundo plano
+INTERVALO_CONSULTA = 0.5
+# Filas del detalle de validación que se muestran en pantalla
+FILAS_DETALLE_VALIDACION = 200
+# Filas de una consulta al historial que se muestran en pantalla
+FILAS_CONSULTA_HISTORIAL = 500
+
 def main():
     # Configuración de la página
     st.set_page_config(
@@ -71,12 +88,73 @@ def main():
         st.session_state.archivo_caja = None
     if 'archivo_big_pass' not in st.session_state:
         st.session_state.archivo_big_pass = None
+    if 'cache_archivos' not in st.session_state:
+        st.session_state.cache_archivos = cache_archivos.CacheLRU()
+    if 'hashes_archivos' not in st.session_state:
+        st.session_state.hashes_archivos = {}
+    if 'resultado_previo' not in st.session_state:
+        st.session_state.resultado_previo = None
+        st.session_state.clave_resultado_previo = None
+    if 'trabajo_actual' not in st.session_state:
+        st.session_state.trabajo_actual = None
+    if 'resultado_trabajo' not in st.session_state:
+        st.session_state.resultado_trabajo = None
+        st.session_state.vista_resultado = {}
     
     # Navegación
     if st.session_state.pagina_actual == 'inicio':
         mostrar_landing_page()
     elif st.session_state.pagina_actual == 'archivo_plano':
         mostrar_pagina_archivo_plano()
+    elif st.session_state.pagina_actual == 'historial':
+        mostrar_pagina_historial()
+
+def bytes_subidos(archivo):
+    """
+    Bytes del archivo subido sin copiarlos. El UploadedFile de Streamlit es
+    un BytesIO creado sobre los bytes de la subida, y CPython los comparte
+    hasta que alguien pide un buffer escribible: getvalue() retorna ese
+    mismo objeto, mientras que getbuffer() obliga a copiar el archivo
+    entero. Los bytes son inmutables, así que el trabajo en segundo plano
+    puede usarlos aunque la página se vuelva a ejecutar.
+    """
+    return archivo.getvalue()
+
+def hash_archivo(archivo):
+    """SHA-256 del archivo subido, calculado una sola vez por carga"""
+    file_id = getattr(archivo, 'file_id', None)
+    hashes = st.session_state.hashes_archivos
+    if file_id is not None and file_id in hashes:
+        return hashes[file_id]
+    
+    valor = cache_archivos.hash_contenido(bytes_subidos(archivo))
+    if file_id is not None:
+        hashes[file_id] = valor
+    return valor
+
+def leer_preview(archivo, columnas):
+    """
+    Primeras filas del archivo subido y columnas requeridas que le faltan,
+    leídas una sola vez por contenido (ver archivo_plano.vista_previa)
+    """
+    return st.session_state.cache_archivos.obtener_o_calcular(
+        ('preview', hash_archivo(archivo), tuple(columnas)),
+        lambda: archivo_plano.vista_previa(archivo, columnas)
+    )
+
+def mostrar_preview(archivo, columnas):
+    """Aviso inmediato de columnas faltantes y vista previa de las primeras filas"""
+    try:
+        df_preview, _, faltantes = leer_preview(archivo, columnas)
+    except Exception as e:
+        st.error(f"Error: {e}")
+        return
+    if faltantes:
+        st.error(f"❌ **Faltan columnas:** {', '.join(faltantes)}")
+    else:
+        st.caption("✅ Columnas requeridas presentes")
+    with st.expander("👀 Vista previa"):
+        st.dataframe(df_preview, use_container_width=True)
 
 def mostrar_landing_page():
     """Landing page limpia y funcional"""
@@ -98,6 +176,10 @@ def mostrar_landing_page():
             st.session_state.pagina_actual = 'archivo_plano'
             st.rerun()
         
+        if st.button("🗃️ Consultar historial", use_container_width=True):
+            st.session_state.pagina_actual = 'historial'
+            st.rerun()
+        
         st.markdown("""
         <div style='text-align: center; margin-top: 1rem;'>
             <small>✨ Procesa CAJA y BIG PASS en segundos</small>
@@ -291,12 +373,7 @@ def mostrar_pagina_archivo_plano():
             st.success(f"✅ **{archivo_caja.name}**")
             st.caption(f"📏 Tamaño: {archivo_caja.size:,} bytes")
             
-            with st.expander("👀 Vista previa"):
-                try:
-                    df_preview = pd.read_excel(archivo_caja, nrows=3)
-                    st.dataframe(df_preview, use_container_width=True)
-                except Exception as e:
-                    st.error(f"Error: {e}")
+            mostrar_preview(archivo_caja, archivo_plano.COLUMNAS_CAJA)
         else:
             st.info("📁 Archivo CAJA pendiente")
     
@@ -314,15 +391,16 @@ def mostrar_pagina_archivo_plano():
             st.success(f"✅ **{archivo_big_pass.name}**")
             st.caption(f"📏 Tamaño: {archivo_big_pass.size:,} bytes")
             
-            with st.expander("👀 Vista previa"):
-                try:
-                    df_preview = pd.read_excel(archivo_big_pass, nrows=3)
-                    st.dataframe(df_preview, use_container_width=True)
-                except Exception as e:
-                    st.error(f"Error: {e}")
+            mostrar_preview(archivo_big_pass, archivo_plano.COLUMNAS_BIG_PASS)
         else:
             st.info("📁 Archivo BIG PASS pendiente")
     
+    # Maestro de empleados para validar y completar los SAP
+    mostrar_maestro_empleados()
+    
+    # Resultado de una corrida anterior, sin volver a procesar los Excel
+    mostrar_resultado_previo()
+    
     # Continuar solo si ambos archivos están listos
     if not archivo_caja or not archivo_big_pass:
         st.warning("⚠️ **Carga ambos archivos para continuar**")
@@ -339,13 +417,56 @@ def mostrar_pagina_archivo_plano():
     with col1:
         formato_salida = st.selectbox(
             "📄 Formato de salida:",
-            ["Excel (.xlsx)", "CSV (.csv)"]
+            list(salida.FORMATOS),
+            help="Parquet y Arrow conservan los tipos (fechas, enteros) y se cargan en milisegundos"
         )
         
         incluir_timestamp = st.checkbox(
             "🕒 Timestamp en nombre",
             value=True
         )
+        
+        modo_streaming = st.checkbox(
+            "🌊 Modo streaming (archivos muy grandes)",
+            value=False,
+            help="Lee las filas en bloques y descarta de inmediato las que no aplican; memoria constante"
+        )
+        
+        modo_incremental = st.checkbox(
+            "♻️ Modo incremental (solo registros nuevos)",
+            value=False,
+            help="Omite los registros ya emitidos en corridas anteriores según el manifiesto local"
+        )
+        
+        modo_consolidar = st.checkbox(
+            "🧮 Consolidar por SAP, fecha y concepto",
+            value=False,
+            help="Suma en un solo registro las filas del mismo empleado, fecha y concepto"
+        )
+        
+        filas_por_parte = st.number_input(
+            "✂️ Registros por parte (0 = un solo archivo)",
+            min_value=0,
+            value=0,
+            step=10_000,
+            help="Además del archivo completo, genera un ZIP con partes de a lo sumo esta cantidad de registros, "
+                 "sin repartir un empleado entre dos partes"
+        )
+        
+        parte_por_concepto = st.checkbox(
+            "🗂️ Una parte por concepto",
+            value=False,
+            disabled=not filas_por_parte
+        )
+        
+        hay_maestro = len(maestro.obtener()) > 0
+        modo_enriquecer = st.checkbox(
+            "👤 Agregar nombre y centro de costo",
+            value=False,
+            disabled=not hay_maestro,
+            help="Completa cada registro con los datos del maestro de empleados" if hay_maestro
+            else "Carga primero un maestro de empleados"
+        ) and hay_maestro
     
     with col2:
         mostrar_estadisticas = st.checkbox(
@@ -357,236 +478,530 @@ def mostrar_pagina_archivo_plano():
             "👀 Vista previa resultado",
             value=True
         )
+        
+        mostrar_rendimiento = st.checkbox(
+            "⏱️ Panel de rendimiento",
+            value=False,
+            help="Tiempo, filas y memoria de cada etapa, exportable en JSON"
+        )
+        
+        modo_historial = st.checkbox(
+            "🗃️ Guardar en el historial",
+            value=True,
+            help="Registra cada registro generado en la base local para consultarlo después por SAP, concepto o fecha"
+        )
     
     st.markdown("---")
     
     # Procesamiento
     st.markdown("## 🚀 Procesamiento")
     
-    if st.button("⚡ **PROCESAR ARCHIVOS AHORA**", type="primary", use_container_width=True):
-        ejecutar_procesamiento(archivo_caja, archivo_big_pass, formato_salida, incluir_timestamp, mostrar_estadisticas, mostrar_preview)
+    trabajo = trabajos.obtener(st.session_state.trabajo_actual) if st.session_state.trabajo_actual else None
+    en_curso = trabajo is not None and not trabajo.terminado
+    if st.button("⚡ **PROCESAR ARCHIVOS AHORA**", type="primary", use_container_width=True, disabled=en_curso):
+        ejecutar_procesamiento(archivo_caja, archivo_big_pass, formato_salida, modo_streaming, modo_incremental, modo_enriquecer,
+                               modo_consolidar, modo_historial, filas_por_parte, parte_por_concepto)
+    
+    resumen_cache = st.session_state.cache_archivos.resumen()
+    st.caption(
+        f"🗄️ Caché: {resumen_cache['aciertos']:,} aciertos · {resumen_cache['fallos']:,} fallos · "
+        f"{resumen_cache['entradas']} entradas · {resumen_cache['tamano_mb']:.1f} MB"
+    )
+    
+    # El trabajo sigue en el servidor aunque la página se vuelva a ejecutar
+    if st.session_state.trabajo_actual:
+        mostrar_trabajo(st.session_state.trabajo_actual, incluir_timestamp, mostrar_estadisticas, mostrar_preview, mostrar_rendimiento)
 
-def ejecutar_procesamiento(archivo_caja, archivo_big_pass, formato_salida, incluir_timestamp, mostrar_estadisticas, mostrar_preview):
-    """Procesamiento optimizado"""
+def mostrar_pagina_historial():
+    """Consulta de los registros generados en corridas anteriores"""
     
-    progress_bar = st.progress(0)
-    status_text = st.empty()
+    col1, col2 = st.columns([1, 5])
+    with col1:
+        if st.button("⬅️ Inicio"):
+            st.session_state.pagina_actual = 'inicio'
+            st.rerun()
     
-    try:
-        status_text.text("⏳ Inicializando...")
-        progress_bar.progress(10)
+    with col2:
+        st.markdown("# 🗃️ Historial de Archivos Planos")
+    
+    registro = historial.Historial()
+    corridas = registro.corridas()
+    if corridas.empty:
+        st.info("📭 **Aún no hay corridas en el historial.** Procesa archivos con la opción de historial activa.")
+        return
+    
+    # Filtros
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        sap = st.number_input("👤 SAP", min_value=0, value=None, step=1, placeholder="Todos")
+    with col2:
+        conceptos = st.multiselect("🎯 Conceptos", list(archivo_plano.TIPO_CONCEPTO.categories), placeholder="Todos")
+    with col3:
+        fechas_corrida = pd.to_datetime(corridas['fecha_corrida'])
+        rango = st.date_input(
+            "📅 Fecha de corrida",
+            value=(fechas_corrida.min().date(), fechas_corrida.max().date()),
+            format="DD/MM/YYYY"
+        )
+    # Mientras se elige el rango el selector entrega una sola fecha
+    desde = rango[0] if rango else None
+    hasta = rango[-1] if rango else None
+    
+    # Consulta por índices; el límite evita traer millones de filas a la página
+    df = registro.consultar(sap, conceptos, desde, hasta)
+    if df.empty:
+        st.warning("⚠️ **No hay registros con esos filtros**")
+    else:
+        totales = df.groupby('CONCEPTO', observed=True)['VALOR'].agg(['count', 'sum'])
+        columnas = st.columns(len(totales))
+        for columna, (concepto, fila) in zip(columnas, totales.iterrows()):
+            with columna:
+                st.metric(f"🎯 {concepto}", f"{fila['count']:,}", f"${fila['sum']:,}")
         
-        # Crear archivos temporales
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.xlsx') as tmp_caja:
-            tmp_caja.write(archivo_caja.getvalue())
-            ruta_caja = tmp_caja.name
+        if len(df) == historial.LIMITE_CONSULTA:
+            st.caption(f"Se muestran los {historial.LIMITE_CONSULTA:,} registros más recientes; acota los filtros para ver el resto")
+        st.dataframe(salida.formatear_bloque(df.head(FILAS_CONSULTA_HISTORIAL)), use_container_width=True)
+        st.download_button(
+            label="📥 Descargar consulta (CSV)",
+            data=df.to_csv(index=False, sep=';', encoding='utf-8-sig', date_format=archivo_plano.FORMATO_FECHA_SAP),
+            file_name=f"historial_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
+            mime="text/csv"
+        )
+    
+    with st.expander(f"📋 Corridas registradas ({len(corridas):,})"):
+        st.dataframe(corridas, use_container_width=True, hide_index=True)
+
+def ejecutar_procesamiento(archivo_caja, archivo_big_pass, formato_salida, modo_streaming, modo_incremental=False,
+                           modo_enriquecer=False, modo_consolidar=False, modo_historial=False, filas_por_parte=0,
+                           parte_por_concepto=False):
+    """Envía el procesamiento como trabajo en segundo plano y guarda su id en la sesión"""
+    # Los hashes se calculan aquí: el trabajo no tiene acceso a la sesión
+    claves = (hash_archivo(archivo_caja), hash_archivo(archivo_big_pass))
+    maestro_empleados = maestro.obtener()
+    st.session_state.trabajo_actual = trabajos.enviar(
+        procesamiento.calcular_procesamiento,
+        # Los bytes de la subida, sin copia (ver bytes_subidos)
+        bytes_subidos(archivo_caja), bytes_subidos(archivo_big_pass), claves,
+        formato_salida, modo_streaming, modo_incremental, st.session_state.cache_archivos,
+        maestro_empleados if len(maestro_empleados) else None, modo_enriquecer, modo_consolidar, modo_historial,
+        filas_por_parte, parte_por_concepto,
+        clave=claves + (formato_salida, modo_streaming, modo_incremental, maestro_empleados.version, modo_enriquecer,
+                        modo_consolidar, modo_historial, filas_por_parte, parte_por_concepto),
+        descripcion=f"{archivo_caja.name} + {archivo_big_pass.name}"
+    )
+
+def mostrar_trabajo(id_trabajo, incluir_timestamp, mostrar_estadisticas, mostrar_preview, mostrar_rendimiento):
+    """
+    Avance del trabajo en curso (se consulta en cada rerun) o su resultado
+    si ya terminó. El resultado terminado se copia a la sesión, así no se
+    pierde aunque el registro de trabajos descarte el trabajo.
+    """
+    guardado = st.session_state.get('resultado_trabajo')
+    if guardado is None or guardado['id'] != id_trabajo:
+        guardado = copiar_trabajo_terminado(id_trabajo)
+        if guardado is None:
+            return
+    
+    if guardado['estado'] == trabajos.CANCELADO:
+        st.warning("⛔ **Procesamiento cancelado**")
+        return
+    if guardado['estado'] == trabajos.ERROR:
+        st.error(f"❌ **Error:** {guardado['error']}")
+        return
+    
+    mostrar_resultado(guardado['resultado'], incluir_timestamp, mostrar_estadisticas, mostrar_preview, mostrar_rendimiento)
+
+def copiar_trabajo_terminado(id_trabajo):
+    """
+    Muestra el avance del trabajo mientras corre; al terminar copia su
+    estado y resultado a la sesión y los retorna. Lo que se arma al mostrar
+    el resultado (nombre del archivo, CSV de descarga) queda en
+    st.session_state.vista_resultado, propio de esta sesión.
+    """
+    trabajo = trabajos.obtener(id_trabajo)
+    if trabajo is None:
+        st.session_state.trabajo_actual = None
+        st.warning("⚠️ **El resultado ya no está disponible; procesa de nuevo los archivos**")
+        return None
+    
+    if not trabajo.terminado:
+        col1, col2 = st.columns([4, 1])
+        with col1:
+            st.progress(10 + int(trabajo.progreso * 85))
+            if trabajo.estado == trabajos.EN_COLA:
+                st.text("⏳ En cola, esperando un procesador libre...")
+            else:
+                st.text(f"📊 {trabajo.texto}... ({trabajo.segundos():.0f} s)")
+        with col2:
+            if st.button("⛔ Cancelar", use_container_width=True):
+                trabajos.cancelar(id_trabajo)
+                st.rerun()
+        # Consulta periódica: la página sigue respondiendo mientras tanto
+        time.sleep(INTERVALO_CONSULTA)
+        st.rerun()
+    
+    guardado = {'id': id_trabajo, 'estado': trabajo.estado, 'error': trabajo.error, 'resultado': trabajo.resultado}
+    st.session_state.resultado_trabajo = guardado
+    st.session_state.vista_resultado = {}
+    return guardado
+
+def mostrar_resultado(resultado, incluir_timestamp, mostrar_estadisticas, mostrar_preview, mostrar_rendimiento):
+    """Estadísticas, vista previa y descarga de un procesamiento terminado"""
+    df_resultado = resultado['df_resultado']
+    estadisticas = resultado['estadisticas']
+    resumen_incremental = resultado['resumen_incremental']
+    
+    # Las filas sin SAP válido se emiten con el SAP vacío: SAP no las puede cargar así
+    sin_sap = sum(valores['sin_sap'] for valores in estadisticas.values()) if estadisticas else 0
+    if sin_sap:
+        st.warning(
+            f"⚠️ **{sin_sap:,} registros con SAP vacío o inválido** "
+            "(quedan en el archivo con el SAP vacío; el detalle está en el reporte de validación, salvo en modo streaming)"
+        )
+    
+    if resumen_incremental is not None:
+        st.info(
+            f"♻️ **Incremental:** {resumen_incremental['nuevos']:,} nuevos · "
+            f"{resumen_incremental['modificados']:,} con valor modificado · "
+            f"{resumen_incremental['omitidos']:,} ya emitidos omitidos"
+            + (" · archivos sin cambios omitidos" if resultado['archivos_omitidos'] else "")
+        )
+        if df_resultado is None or df_resultado.empty:
+            st.info("✅ **No hay registros nuevos para emitir**")
+            return
+    
+    vista = st.session_state.vista_resultado
+    
+    if df_resultado is None or df_resultado.empty:
+        st.error("❌ **No se generaron datos válidos**")
+        return
+    
+    st.success("🎉 **¡Procesamiento completado exitosamente!**")
+    
+    # El nombre se fija al terminar para que no cambie en cada rerun
+    if 'nombre_base' not in vista:
+        timestamp = datetime.now().strftime("_%Y%m%d_%H%M%S") if incluir_timestamp else ""
+        vista['nombre_base'] = f"nomina_2025{timestamp}"
+    
+    # Estadísticas
+    if mostrar_estadisticas:
+        st.markdown("### 📊 Estadísticas")
+        col1, col2, col3, col4 = st.columns(4)
         
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.xlsx') as tmp_big_pass:
-            tmp_big_pass.write(archivo_big_pass.getvalue())
-            ruta_big_pass = tmp_big_pass.name
+        with col1:
+            st.metric("📊 CAJA (Z498)", f"{estadisticas['caja']['registros']:,}", f"${estadisticas['caja']['total']:,}")
         
-        progress_bar.progress(25)
-        status_text.text("📊 Procesando datos...")
+        with col2:
+            st.metric("⬇️ Descontar (Z609)", f"{estadisticas['descontar']['registros']:,}", f"${estadisticas['descontar']['total']:,}")
         
-        # Procesamiento principal
-        df_resultado, estadisticas = procesar_con_archivo_plano(ruta_caja, ruta_big_pass)
-        progress_bar.progress(75)
+        with col3:
+            st.metric("⬆️ Pagar (Y602)", f"{estadisticas['pagar']['registros']:,}", f"${estadisticas['pagar']['total']:,}")
         
-        if df_resultado is not None and not df_resultado.empty:
-            status_text.text("✅ Completado!")
-            progress_bar.progress(100)
-            
-            # Limpiar progress
-            progress_bar.empty()
-            status_text.empty()
-            
-            st.success("🎉 **¡Procesamiento completado exitosamente!**")
-            
-            # Estadísticas
-            if mostrar_estadisticas:
-                st.markdown("### 📊 Estadísticas")
-                col1, col2, col3, col4 = st.columns(4)
-                
-                with col1:
-                    st.metric("📊 CAJA (Z498)", f"{estadisticas['caja']['registros']:,}", f"${estadisticas['caja']['total']:,}")
-                
-                with col2:
-                    st.metric("⬇️ Descontar (Z609)", f"{estadisticas['descontar']['registros']:,}", f"${estadisticas['descontar']['total']:,}")
-                
-                with col3:
-                    st.metric("⬆️ Pagar (Y602)", f"{estadisticas['pagar']['registros']:,}", f"${estadisticas['pagar']['total']:,}")
-                
-                with col4:
-                    st.metric("👥 People (Y608)", f"{estadisticas['people']['registros']:,}", f"${estadisticas['people']['total']:,}")
-            
-            # Preview
-            if mostrar_preview:
-                st.markdown("### 👀 Vista Previa")
-                col1, col2 = st.columns([4, 1])
-                with col1:
-                    st.dataframe(df_resultado.head(8), use_container_width=True)
-                with col2:
-                    st.metric("📊 Total", f"{len(df_resultado):,}")
-                    st.metric("🎯 Conceptos", len(df_resultado['CONCEPTO'].unique()))
-            
-            # Descarga
-            st.markdown("### 📥 Descarga")
-            
-            timestamp = datetime.now().strftime("_%Y%m%d_%H%M%S") if incluir_timestamp else ""
-            
-            col1, col2 = st.columns(2)
-            
-            if formato_salida == "Excel (.xlsx)":
-                output = io.BytesIO()
-                df_resultado.to_excel(output, index=False, engine='openpyxl')
-                output.seek(0)
-                
-                nombre_archivo = f"nomina_2025{timestamp}.xlsx"
-                
-                with col1:
-                    st.download_button(
-                        label="📥 **Descargar Excel**",
-                        data=output.getvalue(),
-                        file_name=nombre_archivo,
-                        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                        use_container_width=True,
-                        type="primary"
-                    )
-                
-                with col2:
-                    st.info(f"📁 **{nombre_archivo}**")
-                    st.caption(f"📊 {len(df_resultado):,} registros")
-            
-            else:
-                csv_data = df_resultado.to_csv(index=False, encoding='utf-8-sig', sep=';')
-                nombre_archivo = f"nomina_2025{timestamp}.csv"
-                
-                with col1:
-                    st.download_button(
-                        label="📥 **Descargar CSV**",
-                        data=csv_data,
-                        file_name=nombre_archivo,
-                        mime="text/csv",
-                        use_container_width=True,
-                        type="primary"
-                    )
-                
-                with col2:
-                    st.info(f"📁 **{nombre_archivo}**")
-                    st.caption(f"📊 {len(df_resultado):,} registros")
-            
-            # Opciones adicionales
-            st.markdown("---")
-            col1, col2 = st.columns(2)
-            
-            with col1:
-                if st.button("🔄 **Procesar Más Archivos**", use_container_width=True):
-                    st.session_state.archivo_caja = None
-                    st.session_state.archivo_big_pass = None
-                    st.rerun()
-            
-            with col2:
-                if st.button("🏠 **Volver al Inicio**", use_container_width=True):
-                    st.session_state.pagina_actual = 'inicio'
-                    st.rerun()
+        with col4:
+            st.metric("👥 People (Y608)", f"{estadisticas['people']['registros']:,}", f"${estadisticas['people']['total']:,}")
+    
+    # Encabezados que no venían con el nombre esperado
+    mostrar_encabezados(resultado['encabezados'])
+    
+    # Comparación con el archivo plano anterior
+    if st.session_state.get('resultado_previo') is not None:
+        mostrar_diferencias(resultado, st.session_state.resultado_previo, st.session_state.clave_resultado_previo)
+    
+    # Consolidación
+    if resultado['consolidacion'] is not None:
+        mostrar_consolidacion(resultado)
+    
+    # Validación
+    if resultado['validacion'] is not None:
+        mostrar_validacion(resultado)
+    
+    # Preview
+    if mostrar_preview:
+        st.markdown("### 👀 Vista Previa")
+        col1, col2 = st.columns([4, 1])
+        with col1:
+            st.dataframe(salida.formatear_bloque(df_resultado.head(8)), use_container_width=True)
+        with col2:
+            st.metric("📊 Total", f"{len(df_resultado):,}")
+            st.metric("🎯 Conceptos", len(df_resultado['CONCEPTO'].unique()))
+    
+    # Descarga
+    st.markdown("### 📥 Descarga")
+    
+    formato = salida.FORMATOS[resultado['formato_salida']]
+    nombre_archivo = f"{vista['nombre_base']}.{formato['extension']}"
+    
+    col1, col2 = st.columns(2)
+    
+    with col1:
+        st.download_button(
+            label=f"📥 **Descargar {formato['etiqueta']}**",
+            data=resultado['datos_salida'],
+            file_name=nombre_archivo,
+            mime=formato['mime'],
+            use_container_width=True,
+            type="primary"
+        )
         
-        else:
-            progress_bar.empty()
-            status_text.empty()
-            st.error("❌ **No se generaron datos válidos**")
+        partes = resultado['partes']
+        if partes is not None and partes['error']:
+            st.warning(f"✂️ **No se pudo dividir en partes:** {partes['error']}")
+        elif partes is not None:
+            st.download_button(
+                label=f"📦 Descargar {partes['cantidad']} partes (ZIP)",
+                # El ZIP se arma recién al pulsar el botón y no queda en la sesión
+                data=lambda: b''.join(procesamiento.empaquetar_partes(
+                    df_resultado, resultado['formato_salida'], partes['filas_por_parte'], partes['parte_por_concepto']
+                )),
+                file_name=f"{vista['nombre_base']}_partes.zip",
+                mime="application/zip",
+                use_container_width=True
+            )
     
-    except Exception as e:
-        progress_bar.empty()
-        status_text.empty()
-        st.error(f"❌ **Error:** {str(e)}")
+    with col2:
+        st.info(f"📁 **{nombre_archivo}**")
+        st.caption(f"📊 {len(df_resultado):,} registros")
+        if resultado['corrida_historial'] is not None:
+            st.caption(f"🗃️ Guardado en el historial (corrida {resultado['corrida_historial']})")
+        if resultado['archivos_incremental'] is not None:
+            if vista.get('enviado'):
+                st.caption("♻️ Registrado en el manifiesto: no se volverá a emitir")
+            elif st.button("✅ Marcar como enviado", use_container_width=True,
+                           help="Registra estos registros en el manifiesto para omitirlos en las próximas corridas"):
+                marcar_enviado(resultado)
+                st.rerun()
+    
+    # Rendimiento
+    if mostrar_rendimiento:
+        mostrar_panel_rendimiento(resultado['medicion'])
+    
+    # Opciones adicionales
+    st.markdown("---")
+    col1, col2 = st.columns(2)
     
-    finally:
-        # Limpiar archivos temporales
-        try:
-            os.unlink(ruta_caja)
-            os.unlink(ruta_big_pass)
-        except:
-            pass
+    with col1:
+        if st.button("🔄 **Procesar Más Archivos**", use_container_width=True):
+            st.session_state.archivo_caja = None
+            st.session_state.archivo_big_pass = None
+            st.session_state.trabajo_actual = None
+            st.session_state.resultado_trabajo = None
+            st.rerun()
+    
+    with col2:
+        if st.button("🏠 **Volver al Inicio**", use_container_width=True):
+            st.session_state.pagina_actual = 'inicio'
+            st.rerun()
 
-def procesar_con_archivo_plano(ruta_caja, ruta_big_pass):
-    """Función de procesamiento - FORMATO DE FECHA CORREGIDO"""
-    try:
-        todos_los_registros = []
-        estadisticas = {
-            'caja': {'registros': 0, 'total': 0},
-            'descontar': {'registros': 0, 'total': 0},
-            'pagar': {'registros': 0, 'total': 0},
-            'people': {'registros': 0, 'total': 0}
-        }
+def marcar_enviado(resultado):
+    """Registra en el manifiesto los registros del resultado, ya enviados a SAP"""
+    manifiesto.Manifiesto().registrar(resultado['df_resultado'], resultado['archivos_incremental'])
+    st.session_state.vista_resultado['enviado'] = True
+
+def mostrar_encabezados(mapeo_encabezados):
+    """
+    Columnas reconocidas por alias o con otra escritura (tildes, mayúsculas,
+    espacios), por archivo y, si el libro trae varias hojas, por hoja
+    """
+    lineas = [
+        f"{'CAJA' if fuente == 'caja' else 'BIG PASS'}{f' ({hoja})' if len(hojas) > 1 else ''}: '{original}' → '{columna}'"
+        for fuente, hojas in mapeo_encabezados.items()
+        for hoja, mapeo in hojas.items()
+        for columna, original in encabezados.renombrados(mapeo).items()
+    ]
+    if lineas:
+        st.info("🔤 **Encabezados reconocidos:** " + " · ".join(lineas))
+
+def mostrar_diferencias(resultado, df_previo, clave_previo):
+    """Registros agregados, eliminados y con valor distinto frente al resultado previo"""
+    # Se compara una sola vez por resultado y archivo previo, no en cada rerun
+    comparaciones = resultado.setdefault('diferencias', {})
+    if clave_previo not in comparaciones:
+        comparaciones[clave_previo] = diferencias.comparar(df_previo, resultado['df_resultado'])
+    tabla, cambios = comparaciones[clave_previo]
+    
+    st.markdown("### 🔁 Comparación con el resultado previo")
+    conteo = cambios['ESTADO'].value_counts()
+    col1, col2, col3, col4 = st.columns(4)
+    
+    with col1:
+        st.metric("➕ Agregados", f"{conteo[diferencias.AGREGADO]:,}")
+    
+    with col2:
+        st.metric("➖ Eliminados", f"{conteo[diferencias.ELIMINADO]:,}")
+    
+    with col3:
+        st.metric("✏️ Valor modificado", f"{conteo[diferencias.MODIFICADO]:,}")
+    
+    with col4:
+        st.metric(
+            "💰 Total", f"${int(tabla['total_actual'].sum()):,}",
+            f"${int(tabla['diferencia'].sum()):,}"
+        )
+    
+    if cambios.empty:
+        st.success("🔁 **Sin cambios frente al resultado previo**")
+        return
+    
+    with st.expander(f"🔁 {len(cambios):,} registros con cambios"):
+        st.dataframe(tabla, use_container_width=True, hide_index=True)
+        st.dataframe(salida.formatear_bloque(cambios.head(FILAS_DETALLE_VALIDACION)), use_container_width=True, hide_index=True)
         
-        # Procesar CAJA
-        df_caja = pd.read_excel(ruta_caja)
-        columna_descuadres = 'DESCUADRES DE CAJA PARA DESCONTAR'
+        vista = st.session_state.vista_resultado
+        archivos_csv = vista.setdefault('diferencias_csv', {})
+        if clave_previo not in archivos_csv:
+            archivos_csv[clave_previo] = salida.codificar(cambios, "CSV (.csv)")
+        st.download_button(
+            label="📥 Descargar cambios (CSV)",
+            data=archivos_csv[clave_previo],
+            file_name=f"{vista['nombre_base']}_cambios.csv",
+            mime="text/csv"
+        )
+
+def mostrar_consolidacion(resultado):
+    """Registros combinados al consolidar, con el mapa a los registros originales descargable"""
+    consolidacion = resultado['consolidacion']
+    combinados = consolidacion['originales'] - consolidacion['consolidados']
+    st.info(
+        f"🧮 **Consolidación:** {consolidacion['originales']:,} registros → {consolidacion['consolidados']:,} "
+        f"({combinados:,} combinados)"
+    )
+    if combinados == 0:
+        return
+    
+    # El CSV se arma una sola vez por resultado, no en cada rerun
+    vista = st.session_state.vista_resultado
+    if 'consolidacion_csv' not in vista:
+        vista['consolidacion_csv'] = salida.codificar(consolidacion['mapa'], "CSV (.csv)")
+    st.download_button(
+        label="📥 Descargar mapa de consolidación (CSV)",
+        data=vista['consolidacion_csv'],
+        file_name=f"{vista['nombre_base']}_consolidacion.csv",
+        mime="text/csv",
+        help="Una fila por registro original con el número de registro consolidado en que quedó"
+    )
+
+def mostrar_validacion(resultado):
+    """Resumen de incidencias por regla y concepto, con el detalle descargable"""
+    detalle = resultado['validacion']
+    if detalle.empty:
+        st.success("🔎 **Validación:** sin incidencias")
+        return
+    
+    with st.expander(f"🔎 Validación: {len(detalle):,} incidencias", expanded=True):
+        st.dataframe(validacion.resumen(detalle), use_container_width=True, hide_index=True)
+        st.caption(f"Primeras {min(len(detalle), FILAS_DETALLE_VALIDACION):,} filas del detalle")
+        st.dataframe(detalle.head(FILAS_DETALLE_VALIDACION).astype({'valor': str}), use_container_width=True, hide_index=True)
         
-        if columna_descuadres in df_caja.columns:
-            mask = (df_caja[columna_descuadres].notna()) & \
-                   (pd.to_numeric(df_caja[columna_descuadres], errors='coerce') > 0)
-            df_caja_filtrado = df_caja[mask]
-            
-            for _, row in df_caja_filtrado.iterrows():
-                fecha_str = ''
-                if 'Fecha Terminación. (Digite)' in row and pd.notna(row['Fecha Terminación. (Digite)']):
-                    fecha_dt = pd.to_datetime(row['Fecha Terminación. (Digite)'], errors='coerce')
-                    if pd.notna(fecha_dt):
-                        fecha_str = fecha_dt.strftime('%d.%m.%Y')  # CAMBIADO: puntos en lugar de barras
-                
-                valor = int(pd.to_numeric(row[columna_descuadres], errors='coerce'))
-                registro = {
-                    'SAP': row['SAP'] if 'SAP' in row else '',
-                    'FECHA': fecha_str,
-                    'CONCEPTO': 'Z498',
-                    'VALOR': valor
-                }
-                todos_los_registros.append(registro)
-                estadisticas['caja']['registros'] += 1
-                estadisticas['caja']['total'] += valor
-        
-        # Procesar BIG PASS
-        df_big_pass = pd.read_excel(ruta_big_pass)
-        
-        for concepto, columna, estadistica_key in [
-            ('Z609', 'Descontar', 'descontar'),
-            ('Y602', 'Pagar', 'pagar'), 
-            ('Y608', 'PEOPLE', 'people')
-        ]:
-            if columna in df_big_pass.columns:
-                mask = (df_big_pass[columna].notna()) & \
-                       (pd.to_numeric(df_big_pass[columna], errors='coerce') > 0)
-                df_filtrado = df_big_pass[mask]
-                
-                for _, row in df_filtrado.iterrows():
-                    fecha_str = ''
-                    if 'Terminación' in row and pd.notna(row['Terminación']):
-                        fecha_dt = pd.to_datetime(row['Terminación'], errors='coerce')
-                        if pd.notna(fecha_dt):
-                            fecha_str = fecha_dt.strftime('%d.%m.%Y')  # CAMBIADO: puntos en lugar de barras
-                    
-                    valor = int(pd.to_numeric(row[columna], errors='coerce'))
-                    registro = {
-                        'SAP': str(row['N° Sap ']).strip() if 'N° Sap ' in row else '',
-                        'FECHA': fecha_str,
-                        'CONCEPTO': concepto,
-                        'VALOR': valor
-                    }
-                    todos_los_registros.append(registro)
-                    estadisticas[estadistica_key]['registros'] += 1
-                    estadisticas[estadistica_key]['total'] += valor
-        
-        # Crear DataFrame final
-        if todos_los_registros:
-            df_final = pd.DataFrame(todos_los_registros)
-            return df_final, estadisticas
+        # El CSV se arma una sola vez por resultado, no en cada rerun
+        vista = st.session_state.vista_resultado
+        if 'validacion_csv' not in vista:
+            vista['validacion_csv'] = validacion.a_csv(detalle)
+        st.download_button(
+            label="📥 Descargar detalle (CSV)",
+            data=vista['validacion_csv'],
+            file_name=f"{vista['nombre_base']}_validacion.csv",
+            mime="text/csv"
+        )
+
+def mostrar_maestro_empleados():
+    """Carga del maestro de empleados; queda guardado en disco para las siguientes corridas"""
+    maestro_empleados = maestro.obtener()
+    titulo = f"👤 Maestro de empleados ({len(maestro_empleados):,})" if len(maestro_empleados) else "👤 Maestro de empleados"
+    with st.expander(titulo):
+        if maestro_empleados.info:
+            info = maestro_empleados.info
+            st.caption(
+                f"📋 {info['empleados']:,} empleados · {info.get('archivo') or 'sin nombre'} · cargado {info['fecha']}"
+                + ("" if maestro_empleados.tiene_retiro else " · sin fecha de retiro")
+            )
         else:
-            return None, estadisticas
+            st.info("Sin maestro: los SAP no se validan contra la planta de empleados")
+        
+        archivo_maestro = st.file_uploader(
+            "Selecciona el maestro (SAP, nombre, centro de costo, fecha de retiro)",
+            type=['csv', 'xlsx', 'parquet'],
+            key="maestro_uploader"
+        )
+        if archivo_maestro and st.button("💾 Guardar maestro", use_container_width=True):
+            try:
+                with st.spinner("Indexando maestro..."):
+                    info = maestro_empleados.cargar(bytes_subidos(archivo_maestro), archivo_maestro.name)
+            except Exception as e:
+                st.error(f"❌ No se pudo cargar el maestro: {e}")
+                return
+            st.success(f"✅ Maestro guardado: {info['empleados']:,} empleados")
+
+def mostrar_resultado_previo():
+    """
+    Carga un archivo plano generado antes para revisarlo, convertirlo a otro
+    formato o compararlo con el resultado actual
+    """
+    with st.expander("📦 Resultado previo (comparar o convertir)"):
+        archivo_previo = st.file_uploader(
+            "Selecciona un archivo plano generado antes",
+            type=['xlsx', 'csv', 'parquet', 'arrow'],
+            key="resultado_previo_uploader",
+            help="Se compara con el resultado actual; Parquet y Arrow se cargan en milisegundos"
+        )
+        if not archivo_previo:
+            st.session_state.resultado_previo = None
+            st.session_state.clave_resultado_previo = None
+            return
+        
+        clave_previo = hash_archivo(archivo_previo)
+        try:
+            df_previo = st.session_state.cache_archivos.obtener_o_calcular(
+                ('resultado_previo', clave_previo),
+                lambda: archivo_plano.leer_resultado(bytes_subidos(archivo_previo))
+            )
+        except Exception as e:
+            st.error(f"❌ No se pudo leer el resultado: {e}")
+            return
+        st.session_state.resultado_previo = df_previo
+        st.session_state.clave_resultado_previo = clave_previo
+        
+        estadisticas = archivo_plano.calcular_estadisticas(df_previo)
+        st.caption(
+            f"📊 {len(df_previo):,} registros · "
+            + " · ".join(f"{clave}: {valores['registros']:,}" for clave, valores in estadisticas.items())
+        )
+        st.dataframe(salida.formatear_bloque(df_previo.head(8)), use_container_width=True)
+        
+        col1, col2 = st.columns([2, 1])
+        with col1:
+            formato_previo = st.selectbox("Convertir a:", list(salida.FORMATOS), key="formato_previo")
+        formato = salida.FORMATOS[formato_previo]
+        with col2:
+            st.download_button(
+                label=f"📥 Descargar {formato['etiqueta']}",
+                data=salida.codificar(archivo_plano.para_exportar(df_previo), formato_previo),
+                file_name=f"{archivo_previo.name.rsplit('.', 1)[0]}.{formato['extension']}",
+                mime=formato['mime'],
+                use_container_width=True
+            )
+
+
+def mostrar_panel_rendimiento(medicion):
+    """Tabla de etapas medidas y exportación JSON"""
+    st.markdown("### ⏱️ Rendimiento")
+    df_etapas = medicion.resumen()
     
-    except Exception as e:
-        st.error(f"Error en procesamiento: {str(e)}")
-        return None, None
+    col1, col2 = st.columns([4, 1])
+    with col1:
+        st.dataframe(df_etapas, use_container_width=True)
+    with col2:
+        st.metric("⏱️ Total", f"{medicion.total_segundos():.2f} s")
+        principales = df_etapas[df_etapas['nivel'] == 0]
+        if not principales.empty:
+            mas_lenta = principales.loc[principales['segundos'].idxmax()]
+            st.metric("🐢 Etapa más lenta", f"{mas_lenta['etapa']}", f"{mas_lenta['segundos']:.2f} s", delta_color="off")
+        st.download_button(
+            label="📥 JSON",
+            data=medicion.a_json(),
+            file_name=f"rendimiento_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
+            mime="application/json",
+            use_container_width=True
+        )
 
 if __name__ == "__main__":
     main()
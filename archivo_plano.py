@@ -1,7 +1,1131 @@
 
+import numpy as np
 import pandas as pd
+import openpyxl
+import argparse
+import collections
+import contextlib
+import functools
+import io
+import itertools
+import multiprocessing
 import os
+import posixpath
+import re
+import threading
+import time
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, as_completed, wait
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime
+from multiprocessing import shared_memory
+from xml.etree import ElementTree
+
+from openpyxl.styles.numbers import BUILTIN_FORMATS, is_date_format
+from openpyxl.utils.cell import column_index_from_string
+from openpyxl.utils.datetime import CALENDAR_MAC_1904, CALENDAR_WINDOWS_1900, from_excel
+from pandas.io.parsers import TextParser
+
+import encabezados
+import fechas
+import salida
+from ejecutor_etapas import GrafoEtapas
+from instrumentacion import etapa
+
+# ============ DEFINICIÓN DE CONCEPTOS ============
+COLUMNA_SAP_CAJA = 'SAP'
+COLUMNA_FECHA_CAJA = 'Fecha Terminación. (Digite)'
+COLUMNA_DESCUADRES = 'DESCUADRES DE CAJA PARA DESCONTAR'
+
+COLUMNA_SAP_BIG_PASS = 'N° Sap '
+COLUMNA_FECHA_BIG_PASS = 'Terminación'
+
+# (concepto, columna de valor, clave de estadística)
+CONCEPTOS_CAJA = [
+    ('Z498', COLUMNA_DESCUADRES, 'caja')
+]
+CONCEPTOS_BIG_PASS = [
+    ('Z609', 'Descontar', 'descontar'),
+    ('Y602', 'Pagar', 'pagar'),
+    ('Y608', 'PEOPLE', 'people')
+]
+
+# fuente -> (conceptos, columna SAP, columna fecha)
+FUENTES = {
+    'caja': (CONCEPTOS_CAJA, COLUMNA_SAP_CAJA, COLUMNA_FECHA_CAJA),
+    'big_pass': (CONCEPTOS_BIG_PASS, COLUMNA_SAP_BIG_PASS, COLUMNA_FECHA_BIG_PASS)
+}
+# Archivo de origen de cada concepto
+ARCHIVO_CONCEPTO = {concepto: fuente for fuente, (conceptos, _, _) in FUENTES.items() for concepto, _, _ in conceptos}
+
+# Esquema del resultado: SAP entero (nulo si no es válido), FECHA como
+# fecha (se formatea al escribir), CONCEPTO categórico y VALOR int64
+COLUMNAS_SALIDA = ['SAP', 'FECHA', 'CONCEPTO', 'VALOR']
+TIPO_CONCEPTO = pd.CategoricalDtype([c for c, _, _ in CONCEPTOS_CAJA + CONCEPTOS_BIG_PASS])
+FORMATO_FECHA_SAP = salida.FORMATO_FECHA_SAP
+
+# Hoja de origen de cada registro, solo cuando el libro trae varias hojas con
+# datos. Queda en el resultado en memoria, el reporte de validación y el mapa
+# de consolidación, pero no en el archivo plano (ver para_exportar)
+COLUMNA_HOJA = 'HOJA'
+# Fila del Excel de origen de cada registro (encabezado en la fila 1), para
+# el reporte de validación y el mapa de consolidación; tampoco se exporta
+COLUMNA_FILA = 'FILA'
+# Clave de los registros que se suman en el modo consolidado
+COLUMNAS_CONSOLIDACION = ['SAP', 'FECHA', 'CONCEPTO']
+# Columnas del mapa de consolidación: registro consolidado y origen de cada registro
+COLUMNAS_MAPA = ['registro', 'ARCHIVO', COLUMNA_HOJA, COLUMNA_FILA] + COLUMNAS_SALIDA
+
+# Filas por bloque en el modo streaming
+TAMANO_BLOQUE_STREAMING = 50_000
+# Filas de datos que muestra la vista previa de un archivo subido
+FILAS_VISTA_PREVIA = 3
+# Inicio de los procesos de lectura: forkserver no hereda los hilos ni la
+# memoria del proceso principal (spawn donde no existe, p. ej. Windows)
+METODO_PROCESOS = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+# Procesos del pool de lectura, compartido por todas las corridas
+PROCESOS_LECTURA = int(os.environ.get('NOMINA_PROCESOS', str(os.cpu_count() or 1)))
+
+# Únicas columnas que usan las reglas de cada archivo
+COLUMNAS_CAJA = [COLUMNA_SAP_CAJA, COLUMNA_FECHA_CAJA] + [c for _, c, _ in CONCEPTOS_CAJA]
+COLUMNAS_BIG_PASS = [COLUMNA_SAP_BIG_PASS, COLUMNA_FECHA_BIG_PASS] + [c for _, c, _ in CONCEPTOS_BIG_PASS]
+
+
+def preparar_origen(origen):
+    """
+    Normaliza el origen de un Excel: ruta, bytes/memoryview o archivo en
+    memoria (p. ej. el UploadedFile de Streamlit). Los archivos en memoria
+    se rebobinan y se leen tal cual, sin copiarlos ni escribirlos a disco.
+    """
+    if isinstance(origen, (bytes, bytearray, memoryview)):
+        return io.BytesIO(origen)
+    if hasattr(origen, 'read'):
+        origen.seek(0)
+    return origen
+
+
+def es_xlsx(origen):
+    """True si el contenido es un libro xlsx (zip), legible por openpyxl"""
+    if hasattr(origen, 'read'):
+        origen.seek(0)
+        firma = origen.read(4)
+        origen.seek(0)
+    else:
+        with open(origen, 'rb') as archivo:
+            firma = archivo.read(4)
+    return firma == b'PK\x03\x04'
+
+
+def _encabezados_libro(libro):
+    return {
+        hoja.title: list(next(hoja.iter_rows(max_row=1, values_only=True), ()))
+        for hoja in libro.worksheets
+    }
+
+
+def encabezados_hojas(origen):
+    """
+    Encabezado (primera fila) de cada hoja del libro, en orden. En xlsx se
+    lee solo esa fila del XML de cada hoja (ver primeras_filas_xlsx).
+    """
+    origen = preparar_origen(origen)
+    if es_xlsx(origen):
+        return {hoja: (filas or [[]])[0] for hoja, filas in primeras_filas_xlsx(origen, 0).items()}
+    libro = pd.ExcelFile(origen)
+    return {hoja: list(libro.parse(hoja, nrows=0).columns) for hoja in libro.sheet_names}
+
+
+def _nombre_local(etiqueta):
+    """Nombre de un elemento o atributo XML sin el espacio de nombres"""
+    return etiqueta.rsplit('}', 1)[-1]
+
+
+def _texto_xlsx(elemento):
+    """Texto de un <si> de sharedStrings o de un <is> en línea (sin la guía fonética)"""
+    partes = []
+    for hijo in elemento:
+        if _nombre_local(hijo.tag) == 't':
+            partes.append(hijo.text or '')
+        elif _nombre_local(hijo.tag) == 'r':
+            partes.extend(nieto.text or '' for nieto in hijo if _nombre_local(nieto.tag) == 't')
+    return ''.join(partes)
+
+
+def _partes_xlsx(libro):
+    """Rutas dentro del zip: {hoja: XML de la hoja}, textos compartidos, estilos y si usa fechas 1904"""
+    rutas = {}
+    por_tipo = {}
+    for relacion in ElementTree.fromstring(libro.read('xl/_rels/workbook.xml.rels')):
+        destino = relacion.get('Target', '')
+        ruta = destino.lstrip('/') if destino.startswith('/') else posixpath.normpath(posixpath.join('xl', destino))
+        rutas[relacion.get('Id')] = ruta
+        por_tipo[relacion.get('Type', '').rsplit('/', 1)[-1]] = ruta
+    hojas = {}
+    fechas_1904 = False
+    for elemento in ElementTree.fromstring(libro.read('xl/workbook.xml')).iter():
+        nombre = _nombre_local(elemento.tag)
+        if nombre == 'sheet':
+            id_relacion = next(valor for clave, valor in elemento.attrib.items() if _nombre_local(clave) == 'id')
+            hojas[elemento.get('name')] = rutas[id_relacion]
+        elif nombre == 'workbookPr':
+            fechas_1904 = elemento.get('date1904') in ('1', 'true')
+    return hojas, por_tipo.get('sharedStrings'), por_tipo.get('styles'), fechas_1904
+
+
+def _estilos_fecha(libro, ruta):
+    """Índices de estilo de celda (cellXfs) cuyo formato numérico es de fecha"""
+    if ruta is None:
+        return set()
+    raiz = ElementTree.fromstring(libro.read(ruta))
+    formatos = dict(BUILTIN_FORMATS)
+    estilos = []
+    for elemento in raiz.iter():
+        if _nombre_local(elemento.tag) == 'numFmt':
+            formatos[int(elemento.get('numFmtId'))] = elemento.get('formatCode')
+        elif _nombre_local(elemento.tag) == 'cellXfs':
+            estilos = [int(xf.get('numFmtId', 0)) for xf in elemento]
+    return {i for i, formato in enumerate(estilos) if is_date_format(formatos.get(formato) or '')}
+
+
+def _celdas_fila(fila):
+    """{columna (0..n): (tipo, valor crudo, estilo)} de un elemento <row>"""
+    celdas = {}
+    for posicion, celda in enumerate(fila):
+        referencia = celda.get('r')
+        columna = column_index_from_string(referencia.rstrip('0123456789')) - 1 if referencia else posicion
+        valor = None
+        for hijo in celda:
+            if _nombre_local(hijo.tag) == 'v':
+                valor = hijo.text
+            elif _nombre_local(hijo.tag) == 'is':
+                valor = _texto_xlsx(hijo)
+        celdas[columna] = (celda.get('t', 'n'), valor, int(celda.get('s', 0)))
+    return celdas
+
+
+def _filas_xml(libro, ruta, filas):
+    """
+    Celdas del encabezado (fila 1) y de las primeras filas de datos de la
+    hoja; las filas en blanco se saltan hasta juntar las pedidas y ahí se
+    deja de leer el XML
+    """
+    encabezado = {}
+    datos = []
+    numero = 0
+    with libro.open(ruta) as xml:
+        for _, elemento in ElementTree.iterparse(xml):
+            if _nombre_local(elemento.tag) != 'row':
+                continue
+            numero = int(elemento.get('r', numero + 1))
+            if numero > 1 and len(datos) >= filas:
+                break
+            celdas = _celdas_fila(elemento)
+            elemento.clear()
+            if numero == 1:
+                encabezado = celdas
+            elif any(valor is not None and tipo != 'e' for tipo, valor, _ in celdas.values()):
+                datos.append(celdas)
+    return [encabezado] + datos
+
+
+def _textos_compartidos(libro, ruta, indices):
+    """Textos de sharedStrings.xml con los índices pedidos, leyendo solo hasta el mayor"""
+    textos = {}
+    if ruta is None or not indices:
+        return textos
+    maximo = max(indices)
+    posicion = 0
+    with libro.open(ruta) as xml:
+        for _, elemento in ElementTree.iterparse(xml):
+            if _nombre_local(elemento.tag) != 'si':
+                continue
+            if posicion in indices:
+                textos[posicion] = _texto_xlsx(elemento)
+            elemento.clear()
+            if posicion >= maximo:
+                break
+            posicion += 1
+    return textos
+
+
+def _valor_xlsx(tipo, valor, estilo, textos, fechas, calendario):
+    """Valor de una celda como lo entrega openpyxl (las fechas según su formato)"""
+    if valor is None or tipo == 'e':
+        return None
+    if tipo == 's':
+        return textos.get(int(valor))
+    if tipo in ('str', 'inlineStr'):
+        return valor
+    if tipo == 'b':
+        return valor == '1'
+    if tipo == 'd':
+        return datetime.fromisoformat(valor)
+    numero = float(valor)
+    if estilo in fechas:
+        return from_excel(numero, calendario)
+    return int(numero) if numero.is_integer() else numero
+
+
+def primeras_filas_xlsx(origen, filas, hojas=None):
+    """
+    {hoja: [encabezado, fila 1, ..., fila n]} con el encabezado y las
+    primeras filas con datos (sin las filas en blanco) de las hojas
+    indicadas (todas por defecto) de un xlsx. Cada hoja se recorre como
+    flujo de XML y se deja de leer al juntar las filas; de
+    sharedStrings.xml se lee solo hasta el mayor índice usado, así que el
+    costo no depende del tamaño del libro.
+    """
+    origen = preparar_origen(origen)
+    with zipfile.ZipFile(origen) as libro:
+        rutas, ruta_textos, ruta_estilos, fechas_1904 = _partes_xlsx(libro)
+        celdas = {hoja: _filas_xml(libro, rutas[hoja], filas) for hoja in (hojas or rutas)}
+        indices = {
+            int(valor)
+            for leidas in celdas.values() for fila in leidas
+            for tipo, valor, _ in fila.values() if tipo == 's' and valor is not None
+        }
+        textos = _textos_compartidos(libro, ruta_textos, indices)
+        fechas = _estilos_fecha(libro, ruta_estilos)
+    if hasattr(origen, 'read'):
+        origen.seek(0)
+
+    calendario = CALENDAR_MAC_1904 if fechas_1904 else CALENDAR_WINDOWS_1900
+    resultado = {}
+    for hoja, leidas in celdas.items():
+        filas_hoja = []
+        for fila in leidas:
+            valores = [None] * (max(fila, default=-1) + 1)
+            for columna, celda in fila.items():
+                valores[columna] = _valor_xlsx(*celda, textos, fechas, calendario)
+            # Sin las celdas vacías del final (p. ej. solo con formato), como pd.read_excel
+            while valores and valores[-1] is None:
+                valores.pop()
+            filas_hoja.append(valores)
+        ancho = max(map(len, filas_hoja), default=0)
+        resultado[hoja] = [valores + [None] * (ancho - len(valores)) for valores in filas_hoja]
+    return resultado
+
+
+def nombres_hojas_xlsx(origen):
+    """Nombres de las hojas de un xlsx leyendo solo xl/workbook.xml (sin cargar el libro)"""
+    origen = preparar_origen(origen)
+    with zipfile.ZipFile(origen) as libro:
+        raiz = ElementTree.fromstring(libro.read('xl/workbook.xml'))
+    if hasattr(origen, 'read'):
+        origen.seek(0)
+    return [hoja.get('name') for hoja in raiz.iter() if hoja.tag.endswith('}sheet')]
+
+
+def hojas_con_columnas(origen, columnas):
+    """
+    Hojas cuyo encabezado tiene todas las columnas indicadas. Si ninguna las
+    tiene se usa la primera hoja, como cuando se leía solo esa.
+    """
+    origen = preparar_origen(origen)
+    if es_xlsx(origen):
+        # Un libro de una sola hoja no necesita revisar encabezados
+        nombres = nombres_hojas_xlsx(origen)
+        if len(nombres) <= 1:
+            return nombres
+    return _seleccionar_hojas(encabezados_hojas(origen), columnas)
+
+
+def _seleccionar_hojas(encabezados_libro, columnas):
+    requeridas = len(set(columnas))
+    hojas = [
+        hoja for hoja, encabezado in encabezados_libro.items()
+        if len(encabezados.resolver(encabezado, columnas)) == requeridas
+    ]
+    return hojas or list(encabezados_libro)[:1]
+
+
+def vista_previa(origen, columnas, filas=FILAS_VISTA_PREVIA):
+    """
+    Encabezado y primeras filas de la hoja que tiene las columnas esperadas
+    (la primera si ninguna las tiene completas). En xlsx solo se lee el
+    comienzo del XML de cada hoja (ver primeras_filas_xlsx), sin parsear el
+    resto del libro; los tipos quedan como los deja pd.read_excel.
+    Retorna (df, mapeo de encabezados, columnas faltantes).
+    """
+    origen = preparar_origen(origen)
+    if es_xlsx(origen):
+        primeras = primeras_filas_xlsx(origen, filas)
+        hoja = _seleccionar_hojas({hoja: (filas_hoja or [[]])[0] for hoja, filas_hoja in primeras.items()}, columnas)[0]
+        encabezado, *datos = primeras[hoja] or [[]]
+        # Filas de datos en blanco (p. ej. con solo textos vacíos) no se muestran
+        filas_hoja = [encabezado] + [fila for fila in datos if any(valor not in (None, '') for valor in fila)]
+        # Mismo armado que pd.read_excel: vacíos como '' y tipos inferidos por columna
+        df = TextParser(
+            [['' if valor is None else valor for valor in fila] for fila in filas_hoja], header=0
+        ).read()
+    else:
+        hoja = _seleccionar_hojas(encabezados_hojas(origen), columnas)[0]
+        df = pd.read_excel(preparar_origen(origen), sheet_name=hoja, nrows=filas)
+    mapeo = encabezados.resolver(df.columns, columnas)
+    faltantes = [columna for columna in dict.fromkeys(columnas) if columna not in mapeo]
+    return df, mapeo, faltantes
+
+
+# Libro en memoria compartida: lo que reciben los procesos en lugar de los bytes
+_LibroCompartido = collections.namedtuple('_LibroCompartido', ['nombre', 'tamano'])
+
+
+class _VistaMemoria(io.RawIOBase):
+    """Archivo de solo lectura sobre un memoryview, sin copiar los bytes"""
+
+    def __init__(self, vista):
+        self._vista = vista
+        self._posicion = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, destino):
+        cantidad = max(min(len(destino), len(self._vista) - self._posicion), 0)
+        destino[:cantidad] = self._vista[self._posicion:self._posicion + cantidad]
+        self._posicion += cantidad
+        return cantidad
+
+    def seek(self, desplazamiento, desde=io.SEEK_SET):
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._posicion, io.SEEK_END: len(self._vista)}[desde]
+        self._posicion = max(base + desplazamiento, 0)
+        return self._posicion
+
+    def tell(self):
+        return self._posicion
+
+
+@contextlib.contextmanager
+def _compartir(origen):
+    """
+    Origen que se envía a los procesos sin repetir los bytes en cada envío:
+    una ruta va tal cual y un archivo en memoria se copia una sola vez a un
+    bloque de memoria compartida (nunca a disco), que se libera al salir.
+    """
+    if not hasattr(origen, 'read'):
+        yield origen
+        return
+    if isinstance(origen, io.BytesIO):
+        # getvalue() retorna los bytes con que se creó el BytesIO sin copiarlos;
+        # getbuffer() los copiaría antes de exponerlos
+        vista = memoryview(origen.getvalue())
+    else:
+        vista = memoryview(preparar_origen(origen).read())
+    tamano = len(vista)
+    bloque = shared_memory.SharedMemory(create=True, size=max(tamano, 1))
+    try:
+        bloque.buf[:tamano] = vista
+        vista.release()
+        yield _LibroCompartido(bloque.name, tamano)
+    finally:
+        bloque.close()
+        bloque.unlink()
+
+
+@contextlib.contextmanager
+def _abrir_compartido(origen):
+    """En el proceso que lee: archivo sobre el bloque compartido (o el origen tal cual)"""
+    if not isinstance(origen, _LibroCompartido):
+        yield origen
+        return
+    bloque = shared_memory.SharedMemory(name=origen.nombre)
+    vista = bloque.buf[:origen.tamano]
+    archivo = io.BufferedReader(_VistaMemoria(vista))
+    try:
+        yield archivo
+    finally:
+        archivo.close()
+        vista.release()
+        bloque.close()
+
+
+def _leer_hoja(origen, hoja, columnas):
+    """
+    Lee una hoja con solo las columnas indicadas (se ejecuta en un proceso
+    del pool). Los encabezados se reconocen aunque cambien tildes,
+    mayúsculas, espacios o usen un alias conocido; las columnas quedan con
+    el nombre esperado y df.attrs['encabezados'] guarda el encabezado
+    original de cada una.
+    """
+    with _abrir_compartido(origen) as archivo:
+        df = pd.read_excel(
+            preparar_origen(archivo), sheet_name=hoja,
+            usecols=lambda encabezado: encabezados.es_candidato(encabezado, columnas)
+        )
+    mapeo = encabezados.resolver(df.columns, columnas)
+    df = df[list(mapeo.values())].rename(columns={original: columna for columna, original in mapeo.items()})
+    df.attrs['encabezados'] = mapeo
+    return df
+
+
+_pool_procesos = None
+_candado_pool = threading.Lock()
+
+
+def pool_procesos():
+    """
+    Pool de procesos del módulo: se crea la primera vez y lo reutilizan
+    todas las corridas, sin volver a levantar procesos ni importar pandas
+    en cada una. Dentro de un proceso hijo retorna None (ahí se lee en el
+    mismo proceso en lugar de anidar otro pool).
+    """
+    global _pool_procesos
+    if multiprocessing.parent_process() is not None:
+        return None
+    with _candado_pool:
+        if _pool_procesos is None:
+            contexto = multiprocessing.get_context(METODO_PROCESOS)
+            if METODO_PROCESOS == 'forkserver':
+                # Los procesos nacen con este módulo (y pandas) ya importado
+                contexto.set_forkserver_preload([__name__])
+            _pool_procesos = ProcessPoolExecutor(max_workers=PROCESOS_LECTURA, mp_context=contexto)
+        return _pool_procesos
+
+
+def _en_proceso(funcion, *argumentos):
+    """Envía la función al pool compartido; si el pool se rompió (murió un proceso) se crea otro"""
+    global _pool_procesos
+    pool = pool_procesos()
+    try:
+        return pool.submit(funcion, *argumentos)
+    except BrokenProcessPool:
+        with _candado_pool:
+            if _pool_procesos is pool:
+                _pool_procesos = None
+        return pool_procesos().submit(funcion, *argumentos)
+
+
+def _leer_hojas_en_procesos(origen, hojas, columnas, trabajadores):
+    """
+    Lee cada hoja en un proceso del pool compartido, con a lo sumo
+    trabajadores hojas a la vez. Un archivo en memoria se pasa una sola vez
+    a memoria compartida y cada proceso lo lee desde ahí (ver _compartir).
+    """
+    with _compartir(origen) as compartido:
+        partes = {}
+        pendientes = iter(hojas)
+        en_curso = {}
+        try:
+            while True:
+                for hoja in itertools.islice(pendientes, trabajadores - len(en_curso)):
+                    en_curso[_en_proceso(_leer_hoja, compartido, hoja, columnas)] = hoja
+                if not en_curso:
+                    break
+                listos, _ = wait(en_curso, return_when=FIRST_COMPLETED)
+                for futuro in listos:
+                    partes[en_curso.pop(futuro)] = futuro.result()
+        finally:
+            # El bloque se libera recién cuando ningún proceso lo está leyendo
+            for futuro in en_curso:
+                futuro.cancel()
+            wait(en_curso)
+    return [partes[hoja] for hoja in hojas]
+
+
+def leer_archivo(origen, columnas, trabajadores=None, en_pool=False):
+    """
+    Lee el Excel una sola vez, materializando solo las columnas indicadas
+    (las demás columnas del reporte se descartan al parsear). Si varias
+    hojas tienen el encabezado esperado se leen todas en el pool de
+    procesos compartido, a lo sumo trabajadores a la vez (por defecto
+    PROCESOS_LECTURA; con 1 se leen en este proceso, una tras otra), y cada
+    fila queda marcada con su hoja en la columna HOJA. Con en_pool también
+    un libro de una sola hoja se lee en el pool, para que varios archivos
+    leídos a la vez no compitan por el mismo proceso.
+    df.attrs['encabezados'] queda por hoja: {hoja: {columna: encabezado}}.
+    """
+    origen = preparar_origen(origen)
+    hojas = hojas_con_columnas(origen, columnas) or [0]
+    trabajadores = min(len(hojas), trabajadores or PROCESOS_LECTURA)
+    if (trabajadores > 1 or en_pool) and pool_procesos() is not None:
+        partes = _leer_hojas_en_procesos(origen, hojas, columnas, trabajadores)
+    else:
+        partes = [_leer_hoja(origen, hoja, columnas) for hoja in hojas]
+    mapeo = {hoja: parte.attrs['encabezados'] for parte, hoja in zip(partes, hojas)}
+    if len(partes) == 1:
+        df = partes[0]
+    else:
+        df = pd.concat(
+            [parte.assign(**{COLUMNA_HOJA: hoja}) for parte, hoja in zip(partes, hojas)],
+            ignore_index=True
+        )
+    df.attrs['encabezados'] = mapeo
+    return df
+
+
+def leer_caja(origen, trabajadores=None, en_pool=False):
+    """Lee el archivo CAJA con las columnas de la regla Z498"""
+    return leer_archivo(origen, COLUMNAS_CAJA, trabajadores, en_pool)
+
+
+def leer_big_pass(origen, trabajadores=None, en_pool=False):
+    """Lee el archivo BIG PASS con las columnas de Z609, Y602 y Y608"""
+    return leer_archivo(origen, COLUMNAS_BIG_PASS, trabajadores, en_pool)
+
+
+LECTORES = {'caja': leer_caja, 'big_pass': leer_big_pass}
+
+
+def estadisticas_vacias():
+    """
+    Diccionario de estadísticas con todos los conceptos en cero; 'sin_sap'
+    cuenta los registros emitidos sin un SAP válido
+    """
+    return {
+        clave: {'registros': 0, 'total': 0, 'sin_sap': 0}
+        for _, _, clave in CONCEPTOS_CAJA + CONCEPTOS_BIG_PASS
+    }
+
+
+def acumular_estadisticas(estadisticas, estadistica_key, bloque):
+    """Suma a estadisticas los registros de un bloque y los que no tienen SAP válido"""
+    estadisticas[estadistica_key]['registros'] += len(bloque)
+    estadisticas[estadistica_key]['total'] += int(bloque['VALOR'].sum())
+    estadisticas[estadistica_key]['sin_sap'] += int(bloque['SAP'].isna().sum())
+
+
+def calcular_estadisticas(df):
+    """Estadísticas por concepto recalculadas desde un DataFrame de salida"""
+    estadisticas = estadisticas_vacias()
+    if df is None or df.empty:
+        return estadisticas
+    claves = {concepto: clave for concepto, _, clave in CONCEPTOS_CAJA + CONCEPTOS_BIG_PASS}
+    resumen = df.assign(sin_sap=df['SAP'].isna()).groupby('CONCEPTO', observed=True).agg(
+        size=('VALOR', 'size'), sum=('VALOR', 'sum'), sin_sap=('sin_sap', 'sum')
+    )
+    for concepto, fila in resumen.iterrows():
+        if concepto in claves:
+            estadisticas[claves[concepto]].update(
+                registros=int(fila['size']), total=int(fila['sum']), sin_sap=int(fila['sin_sap'])
+            )
+    return estadisticas
+
+
+def para_exportar(df):
+    """El resultado con las columnas del archivo plano: sin HOJA ni FILA, que no son parte del formato de carga"""
+    internas = [columna for columna in (COLUMNA_HOJA, COLUMNA_FILA) if columna in df.columns]
+    if internas:
+        return df.drop(columns=internas)
+    return df
+
+
+def convertir_fechas(serie):
+    """
+    Convierte una columna de fechas a datetime64 (ver fechas.convertir).
+    Los valores vacíos o no interpretables quedan como NaT.
+    """
+    return fechas.convertir(serie)[0]
+
+
+def normalizar_sap(serie):
+    """
+    Número SAP como entero: acepta números y texto con espacios
+    ('12345678', ' 12345678 ', 12345678.0); lo demás queda nulo.
+    """
+    numeros = pd.to_numeric(serie, errors='coerce')
+    numeros = numeros.where(numeros % 1 == 0)
+    return numeros.astype('Int64')
+
+
+def registros_concepto(df, concepto, columna_valor, columna_sap, columna_fecha,
+                       instrumentacion=None, reporte=None, formatos_fecha=None):
+    """
+    Genera los registros SAP/FECHA/CONCEPTO/VALOR de un concepto con
+    operaciones sobre columnas completas (filas con valor > 0). Con reporte
+    (ReporteValidacion) se registran además las incidencias del concepto.
+    formatos_fecha es el formato de fecha inferido en la lectura en curso
+    (ver fechas.convertir), para los bloques de un mismo archivo.
+    Las filas sin SAP válido se emiten igual, con el SAP vacío: el reporte
+    de validación las marca y las estadísticas las cuentan en 'sin_sap'.
+    """
+    with etapa(instrumentacion, 'filtro', concepto, len(df)) as medicion:
+        valores = pd.to_numeric(df[columna_valor], errors='coerce')
+        mask = df[columna_valor].notna() & (valores > 0)
+        df_filtrado = df[mask]
+        medicion['filas_salida'] = len(df_filtrado)
+
+    if columna_sap in df_filtrado.columns:
+        sap = normalizar_sap(df_filtrado[columna_sap])
+    else:
+        sap = pd.Series(pd.NA, index=df_filtrado.index, dtype='Int64')
+
+    if columna_fecha in df_filtrado.columns:
+        with etapa(instrumentacion, 'fechas', concepto, len(df_filtrado)) as medicion:
+            fecha, medicion['rechazadas'] = fechas.convertir(df_filtrado[columna_fecha], formatos_fecha)
+            medicion['filas_salida'] = int(fecha.notna().sum())
+    else:
+        fecha = pd.Series(pd.NaT, index=df_filtrado.index, dtype='datetime64[ns]')
+
+    registros = pd.DataFrame({
+        'SAP': sap,
+        'FECHA': fecha,
+        'CONCEPTO': pd.Categorical([concepto] * len(df_filtrado), dtype=TIPO_CONCEPTO),
+        'VALOR': valores[mask].astype('int64')
+    }, index=df_filtrado.index, columns=COLUMNAS_SALIDA)
+    filas, hojas = _filas_excel(df, df_filtrado.index)
+    if hojas is not None:
+        registros[COLUMNA_HOJA] = hojas
+    registros[COLUMNA_FILA] = np.asarray(filas, dtype='int64')
+
+    if reporte is not None:
+        with etapa(instrumentacion, 'validacion', concepto, len(df)):
+            validar_concepto(reporte, df, registros, concepto, columna_valor, columna_sap, columna_fecha, valores, mask)
+    return registros
+
+
+# ============ VALIDACIÓN ============
+def _texto_vacio(serie):
+    """True donde el valor es nulo o texto en blanco"""
+    return serie.isna() | (serie.astype(str).str.strip() == '')
+
+
+def _filas_excel(df, indices):
+    """
+    Número de fila en el Excel (encabezado en la fila 1) y hoja de cada
+    índice. Si la lectura ya anotó la fila (modo streaming, columna FILA)
+    se usa esa. Si no, en libros de varias hojas el índice corre seguido
+    entre hojas, así que se descuenta el inicio de la hoja de cada fila.
+    """
+    hojas_filas = df.loc[indices, COLUMNA_HOJA].to_numpy() if COLUMNA_HOJA in df.columns else None
+    if COLUMNA_FILA in df.columns:
+        return df.loc[indices, COLUMNA_FILA].to_numpy(), hojas_filas
+    if COLUMNA_HOJA not in df.columns:
+        return indices + 2, None
+    hojas = df[COLUMNA_HOJA]
+    inicios = pd.Series(df.index, index=df.index).groupby(hojas, sort=False).min()
+    hojas_filas = hojas.loc[indices]
+    return indices - inicios.loc[hojas_filas].to_numpy() + 2, hojas_filas.to_numpy()
+
+
+def _agregar_incidencias(reporte, regla, concepto, df, mascara, columna):
+    """Agrega al reporte las filas de df marcadas en mascara (índices de df)"""
+    indices = mascara.index[mascara.to_numpy(dtype=bool)]
+    if len(indices) == 0:
+        return
+    filas, hojas = _filas_excel(df, indices)
+    valores = df.loc[indices, columna].to_numpy() if columna in df.columns else None
+    reporte.agregar(regla, concepto, columna, filas, valores, hojas)
+
+
+def validar_concepto(reporte, df, registros, concepto, columna_valor, columna_sap, columna_fecha, valores, mask):
+    """
+    Reglas de validación de un concepto con operaciones sobre columnas. Se
+    reutilizan los valores numéricos y la máscara de registros_concepto; el
+    trabajo extra sobre las columnas completas son unas pocas comparaciones.
+    """
+    # Valores escritos que no son número: la fila se descarta sin aviso
+    no_numerico = df[columna_valor].notna() & valores.isna()
+    if no_numerico.any():
+        no_numerico[no_numerico] = ~_texto_vacio(df.loc[no_numerico, columna_valor])
+    _agregar_incidencias(reporte, 'valor_no_numerico', concepto, df, no_numerico, columna_valor)
+    numeros = valores.to_numpy(dtype=float)
+    con_decimales = pd.Series(numeros != np.trunc(numeros), index=valores.index)
+    _agregar_incidencias(reporte, 'valor_no_entero', concepto, df, mask & con_decimales, columna_valor)
+
+    for columna, resultado, regla_vacio, regla_invalido in [
+        (columna_sap, registros['SAP'], 'sap_vacio', 'sap_invalido'),
+        (columna_fecha, registros['FECHA'], 'fecha_vacia', 'fecha_invalida')
+    ]:
+        if columna not in df.columns:
+            continue
+        sin_valor = resultado.isna()
+        if not sin_valor.any():
+            continue
+        vacio = _texto_vacio(df.loc[sin_valor[sin_valor].index, columna])
+        _agregar_incidencias(reporte, regla_vacio, concepto, df, vacio, columna)
+        _agregar_incidencias(reporte, regla_invalido, concepto, df, ~vacio, columna)
+
+    sap = registros['SAP']
+    duplicado = sap.duplicated(keep=False) & sap.notna()
+    _agregar_incidencias(reporte, 'duplicado', concepto, df, duplicado, columna_sap)
+
+    maestro = reporte.maestro
+    if maestro is None or not len(maestro):
+        return
+    # Una búsqueda hash por concepto sobre los SAP válidos
+    sap = sap.dropna()
+    datos = maestro.buscar(sap)
+    _agregar_incidencias(reporte, 'sap_desconocido', concepto, df, ~datos['EXISTE'], columna_sap)
+    if maestro.tiene_retiro:
+        retiro = datos['FECHA_RETIRO']
+        _agregar_incidencias(reporte, 'sin_retiro', concepto, df, datos['EXISTE'] & retiro.isna(), columna_sap)
+        fecha = registros.loc[sap.index, 'FECHA']
+        distinta = retiro.notna() & fecha.notna() & (fecha != retiro)
+        _agregar_incidencias(reporte, 'fecha_retiro_distinta', concepto, df, distinta, columna_fecha)
+
+
+def bloques_fuente(df, fuente, estadisticas, instrumentacion=None, reporte=None, por_bloques=False,
+                   formatos_fecha=None):
+    """
+    Genera los bloques de registros de todos los conceptos de una fuente
+    ('caja' o 'big_pass') y acumula sus totales en estadisticas. Con
+    por_bloques (modo streaming) las etapas no cuentan para el avance: lo
+    lleva la lectura, por filas leídas; formatos_fecha lleva el formato de
+    fecha inferido de un bloque al siguiente.
+    """
+    conceptos, columna_sap, columna_fecha = FUENTES[fuente]
+    for concepto, columna_valor, estadistica_key in conceptos:
+        if columna_valor not in df.columns:
+            continue
+        with etapa(instrumentacion, 'registros', concepto, len(df)) as medicion:
+            bloque = registros_concepto(
+                df, concepto, columna_valor, columna_sap, columna_fecha, instrumentacion, reporte, formatos_fecha
+            )
+            medicion['filas_salida'] = len(bloque)
+            if por_bloques:
+                medicion['avance'] = 0
+        acumular_estadisticas(estadisticas, estadistica_key, bloque)
+        if not bloque.empty:
+            yield bloque
+
+
+def generar_archivo_plano(df_caja, df_big_pass, instrumentacion=None, reporte=None):
+    """
+    Construye el archivo plano a partir de los DataFrames de CAJA y BIG PASS.
+    Retorna (df_final, estadisticas); df_final es None si no hay registros.
+    Con reporte (ReporteValidacion) se registran las incidencias encontradas.
+    """
+    estadisticas = estadisticas_vacias()
+    bloques = []
+
+    for df, fuente in [(df_caja, 'caja'), (df_big_pass, 'big_pass')]:
+        if df is not None:
+            bloques.extend(bloques_fuente(df, fuente, estadisticas, instrumentacion, reporte))
+
+    if not bloques:
+        return None, estadisticas
+    return pd.concat(bloques, ignore_index=True), estadisticas
+
+
+# ============ CONSOLIDACIÓN ============
+def consolidar(df):
+    """
+    Suma VALOR por (SAP, FECHA, CONCEPTO) con una sola agrupación.
+    Retorna (df_consolidado, mapa): el consolidado conserva el orden de la
+    primera aparición de cada clave y mapa tiene una fila por registro
+    original con su origen (ARCHIVO, HOJA y FILA del Excel; HOJA vacía si
+    el libro tenía una sola hoja) y el registro consolidado (registro) en
+    que quedó. Las filas sin SAP no se combinan, porque no se sabe si son
+    del mismo empleado.
+    """
+    if df is None or df.empty:
+        return df, pd.DataFrame(columns=COLUMNAS_MAPA)
+
+    codigos = df.groupby(COLUMNAS_CONSOLIDACION, observed=True, dropna=False, sort=False).ngroup().to_numpy(copy=True)
+    sin_sap = df['SAP'].isna().to_numpy()
+    if sin_sap.any():
+        codigos[sin_sap] = codigos.max() + 1 + np.arange(sin_sap.sum())
+        # Renumera en orden de primera aparición
+        codigos = pd.factorize(codigos)[0]
+
+    _, primeras = np.unique(codigos, return_index=True)
+    consolidado = df.iloc[primeras][COLUMNAS_SALIDA].reset_index(drop=True)
+    consolidado['VALOR'] = df['VALOR'].groupby(codigos).sum().to_numpy()
+
+    mapa = df.reset_index(drop=True).assign(
+        registro=codigos,
+        ARCHIVO=df['CONCEPTO'].map(ARCHIVO_CONCEPTO).astype(str).to_numpy()
+    )
+    if COLUMNA_HOJA not in mapa.columns:
+        mapa[COLUMNA_HOJA] = None
+    if COLUMNA_FILA not in mapa.columns:
+        mapa[COLUMNA_FILA] = pd.NA
+    return consolidado, mapa[COLUMNAS_MAPA]
+
+
+# ============ MODO CONCURRENTE (GRAFO DE ETAPAS) ============
+def _etapa_lectura(fuente, origen, lector, leer_con, instrumentacion):
+    with etapa(instrumentacion, 'lectura', fuente) as medicion:
+        df = leer_con(fuente, origen, lector)
+        medicion['filas_salida'] = len(df)
+    return df
+
+
+def _etapa_registros(concepto, columna_valor, columna_sap, columna_fecha, instrumentacion, reporte, df):
+    if columna_valor not in df.columns:
+        return None
+    with etapa(instrumentacion, 'registros', concepto, len(df)) as medicion:
+        bloque = registros_concepto(df, concepto, columna_valor, columna_sap, columna_fecha, instrumentacion, reporte)
+        medicion['filas_salida'] = len(bloque)
+    return bloque
+
+
+def _etapa_codificacion(formato, formato_fecha, instrumentacion, *argumentos):
+    """
+    Codifica los bloques de los conceptos a medida que llegan, con las
+    columnas del archivo plano (sin HOJA, ver para_exportar); el resultado
+    es idéntico a codificar el DataFrame concatenado.
+    """
+    *_, bloques = argumentos
+    filas = 0
+
+    def _bloques():
+        nonlocal filas
+        for bloque in bloques:
+            if bloque is None or bloque.empty:
+                continue
+            filas += len(bloque)
+            yield bloque[COLUMNAS_SALIDA]
+
+    with etapa(instrumentacion, 'codificacion', formato) as medicion:
+        datos = salida.codificar(_bloques(), formato, formato_fecha)
+        medicion['filas_salida'] = filas
+    return datos if filas else None
+
+
+def generar_archivo_plano_concurrente(origen_caja, origen_big_pass, formato=None, instrumentacion=None,
+                                      leer_con=None, formato_fecha=FORMATO_FECHA_SAP, reporte=None,
+                                      mapeo_encabezados=None):
+    """
+    Mismo resultado que leer ambos archivos y llamar a generar_archivo_plano,
+    pero como grafo de etapas:
+    - CAJA y BIG PASS se leen a la vez, en procesos aparte si hay más de un núcleo.
+    - Las reglas de cada concepto corren apenas su archivo está leído.
+    - Con formato, la salida se codifica a medida que terminan los conceptos,
+      en el orden Z498, Z609, Y602, Y608.
+
+    leer_con(fuente, origen, lector) permite envolver la lectura (p. ej. con
+    un caché); por defecto se llama lector(origen). Con reporte
+    (ReporteValidacion) se registran las incidencias de cada concepto. Con
+    mapeo_encabezados (dict) se guarda en él, por fuente y hoja, el
+    encabezado del archivo que se usó para cada columna esperada.
+    Retorna (df_final, estadisticas, datos): datos son los bytes del archivo
+    en ese formato (None sin formato o si no hay registros).
+    """
+    if leer_con is None:
+        leer_con = lambda fuente, origen, lector: lector(origen)
+    fuentes = [
+        (origen, fuente)
+        for origen, fuente in [(origen_caja, 'caja'), (origen_big_pass, 'big_pass')]
+        if origen is not None
+    ]
+    # Los procesos del pool compartido ya están levantados desde corridas anteriores
+    en_procesos = len(fuentes) > 1 and PROCESOS_LECTURA > 1 and pool_procesos() is not None
+
+    grafo = GrafoEtapas()
+    conceptos = []
+    for origen, fuente in fuentes:
+        lector = LECTORES[fuente]
+        if en_procesos:
+            # Cada hoja se parsea en el pool; la etapa solo espera sus resultados
+            lector = functools.partial(lector, en_pool=True)
+        grafo.agregar(fuente, functools.partial(_etapa_lectura, fuente, origen, lector, leer_con, instrumentacion))
+
+        conceptos_fuente, columna_sap, columna_fecha = FUENTES[fuente]
+        for concepto, columna_valor, _ in conceptos_fuente:
+            grafo.agregar(
+                concepto,
+                functools.partial(_etapa_registros, concepto, columna_valor, columna_sap, columna_fecha, instrumentacion, reporte),
+                dependencias=[fuente]
+            )
+            conceptos.append(concepto)
+
+    if formato is not None:
+        grafo.agregar(
+            'codificacion',
+            functools.partial(_etapa_codificacion, formato, formato_fecha, instrumentacion),
+            dependencias=[fuente for _, fuente in fuentes],
+            flujo=conceptos
+        )
+    resultados = grafo.ejecutar()
+
+    if mapeo_encabezados is not None:
+        for _, fuente in fuentes:
+            mapeo_encabezados[fuente] = resultados[fuente].attrs.get('encabezados', {})
+
+    estadisticas = estadisticas_vacias()
+    bloques = []
+    for concepto, _, estadistica_key in CONCEPTOS_CAJA + CONCEPTOS_BIG_PASS:
+        bloque = resultados.get(concepto)
+        if bloque is None:
+            continue
+        acumular_estadisticas(estadisticas, estadistica_key, bloque)
+        if not bloque.empty:
+            bloques.append(bloque)
+
+    if not bloques:
+        return None, estadisticas, None
+    return pd.concat(bloques, ignore_index=True), estadisticas, resultados.get('codificacion')
+
+
+# ============ MODO STREAMING (ARCHIVOS MUY GRANDES) ============
+def _puede_calificar(valor):
+    """Descarta solo lo que seguro no es > 0; el filtro exacto se hace por bloque"""
+    if valor is None or isinstance(valor, bool):
+        return valor is True
+    if isinstance(valor, (int, float)):
+        return valor > 0
+    return not (isinstance(valor, str) and valor.strip() == '')
+
+
+def leer_archivo_streaming(origen, columnas, columnas_valor, tamano_bloque=TAMANO_BLOQUE_STREAMING):
+    """
+    Recorre fila a fila, con un libro de solo lectura, las hojas que tienen
+    el encabezado esperado (o la primera si ninguna lo tiene) y entrega
+    DataFrames de a lo sumo tamano_bloque filas, conservando únicamente las
+    filas con algún valor candidato a ser > 0. Cada bloque lleva en attrs
+    'filas_leidas' (filas recorridas hasta él) y 'filas_totales' (filas de
+    datos de las hojas según su dimensión; None si alguna no la declara).
+    """
+    origen = preparar_origen(origen)
+    if not es_xlsx(origen):
+        # openpyxl no lee .xls: se usa el lector normal partido en bloques
+        df = leer_archivo(origen, columnas)
+        for inicio in range(0, len(df), tamano_bloque):
+            bloque = df.iloc[inicio:inicio + tamano_bloque]
+            bloque.attrs = {**df.attrs, 'filas_leidas': inicio + len(bloque), 'filas_totales': len(df)}
+            yield bloque
+        return
+
+    libro = openpyxl.load_workbook(origen, read_only=True, data_only=True)
+    try:
+        encabezados_libro = _encabezados_libro(libro)
+        hojas = _seleccionar_hojas(encabezados_libro, columnas)
+        # Sin <dimension> en alguna hoja no se conoce el total sin recorrerla
+        filas_hojas = [libro[hoja].max_row for hoja in hojas]
+        filas_totales = None if None in filas_hojas else sum(max(filas - 1, 0) for filas in filas_hojas)
+        filas_previas = 0
+        for hoja, filas_hoja in zip(hojas, filas_hojas):
+            filas = libro[hoja].iter_rows(values_only=True)
+            next(filas, None)
+            for bloque in _bloques_hoja(
+                filas, encabezados_libro[hoja], columnas, columnas_valor, tamano_bloque,
+                hoja if len(hojas) > 1 else None
+            ):
+                bloque.attrs['filas_leidas'] += filas_previas
+                bloque.attrs['filas_totales'] = filas_totales
+                bloque.attrs['encabezados'] = {hoja: bloque.attrs['encabezados']}
+                yield bloque
+            filas_previas += max((filas_hoja or 1) - 1, 0)
+    finally:
+        libro.close()
+
+
+def _bloques_hoja(filas, encabezado, columnas, columnas_valor, tamano_bloque, hoja=None):
+    """
+    Bloques de filas candidatas de una hoja, con las columnas ya con el
+    nombre esperado (ver encabezados.resolver) y la columna FILA con la
+    fila de cada una en el Excel; con hoja, se agrega la columna HOJA
+    """
+    mapeo = encabezados.resolver(encabezado, columnas)
+    indices = {columna: encabezado.index(original) for columna, original in mapeo.items()}
+    nombres = list(indices)
+    posiciones = list(indices.values())
+    posiciones_valor = [indices[c] for c in columnas_valor if c in indices]
+    if not posiciones_valor:
+        return
+
+    def _bloque(filas_bloque, numeros, filas_leidas):
+        df = pd.DataFrame(filas_bloque, columns=nombres)
+        # El encabezado ocupa la fila 1
+        df[COLUMNA_FILA] = np.asarray(numeros, dtype='int64') + 1
+        if hoja is not None:
+            df[COLUMNA_HOJA] = hoja
+        df.attrs['encabezados'] = mapeo
+        df.attrs['filas_leidas'] = filas_leidas
+        return df
+
+    bloque = []
+    numeros = []
+    numero = 0
+    for numero, fila in enumerate(filas, 1):
+        if not any(i < len(fila) and _puede_calificar(fila[i]) for i in posiciones_valor):
+            continue
+        bloque.append([
+            fila[i] if i < len(fila) and fila[i] != '' else None
+            for i in posiciones
+        ])
+        numeros.append(numero)
+        if len(bloque) >= tamano_bloque:
+            yield _bloque(bloque, numeros, numero)
+            bloque = []
+            numeros = []
+    if bloque:
+        yield _bloque(bloque, numeros, numero)
+
+
+def generar_archivo_plano_streaming(origen_caja, origen_big_pass, estadisticas,
+                                    tamano_bloque=TAMANO_BLOQUE_STREAMING,
+                                    instrumentacion=None, mapeo_encabezados=None):
+    """
+    Versión en streaming de generar_archivo_plano: entrega los registros
+    en bloques de tamaño acotado y acumula los totales en estadisticas
+    (y en mapeo_encabezados, si se indica, los encabezados usados por fuente y hoja).
+    Los bloques salen en orden de lectura; usar ordenar_por_concepto
+    para obtener el mismo orden que el modo normal. Para el avance, cada
+    fuente cuenta como una etapa prevista, completada según las filas
+    leídas sobre las de sus hojas (entera al terminar si no se conoce el total).
+    """
+    for origen, fuente in [(origen_caja, 'caja'), (origen_big_pass, 'big_pass')]:
+        if origen is None:
+            continue
+        conceptos, columna_sap, columna_fecha = FUENTES[fuente]
+        columnas_valor = [columna for _, columna, _ in conceptos]
+        columnas = [columna_sap, columna_fecha] + columnas_valor
+        lector = leer_archivo_streaming(origen, columnas, columnas_valor, tamano_bloque)
+        # Formato de fecha inferido en esta lectura, compartido por sus bloques
+        formatos_fecha = {}
+        avance = 0.0
+        while True:
+            with etapa(instrumentacion, 'lectura', fuente) as medicion:
+                df = next(lector, None)
+                medicion['filas_salida'] = 0 if df is None else len(df)
+                fraccion = 1.0
+                if df is not None:
+                    filas_totales = df.attrs.get('filas_totales')
+                    fraccion = min(1.0, df.attrs['filas_leidas'] / filas_totales) if filas_totales else avance
+                medicion['avance'] = max(fraccion - avance, 0.0)
+                avance = max(avance, fraccion)
+            if df is None:
+                break
+            if mapeo_encabezados is not None:
+                mapeo_encabezados.setdefault(fuente, {}).update(df.attrs.get('encabezados', {}))
+            yield from bloques_fuente(df, fuente, estadisticas, instrumentacion, por_bloques=True,
+                                      formatos_fecha=formatos_fecha)
+
+
+def leer_resultado(origen):
+    """
+    Carga un resultado exportado antes con los tipos del archivo plano (SAP
+    Int64, FECHA fecha, CONCEPTO categórico, VALOR int64), sin volver a
+    procesar los Excel de origen. Parquet y Arrow IPC conservan los tipos;
+    en xlsx y CSV la fecha viene como texto ('31.07.2025' de la aplicación,
+    '31/07/2025' de la línea de comandos) y se interpreta con
+    fechas.convertir. Si alguna fecha escrita no se puede interpretar se
+    lanza ValueError en lugar de cargarla vacía.
+    """
+    origen = preparar_origen(origen)
+    if es_xlsx(origen):
+        df = pd.read_excel(origen, dtype={'FECHA': str})
+    else:
+        try:
+            df = salida.leer_tabla(origen).to_pandas(date_as_object=False)
+        except ValueError:
+            # CSV exportado por la aplicación: utf-8 con BOM y separado por ';'
+            df = pd.read_csv(preparar_origen(origen), sep=';', encoding='utf-8-sig', dtype={'FECHA': str})
+    faltantes = [columna for columna in COLUMNAS_SALIDA if columna not in df.columns]
+    if faltantes:
+        raise ValueError(f"El resultado no tiene las columnas {', '.join(faltantes)}")
+    fecha = df['FECHA']
+    if not pd.api.types.is_datetime64_any_dtype(fecha):
+        fecha, rechazadas = fechas.convertir(fecha)
+        if rechazadas:
+            raise ValueError(f"El resultado tiene {rechazadas} fechas que no se pudieron interpretar")
+    return df.assign(
+        SAP=normalizar_sap(df['SAP']),
+        FECHA=fecha.astype('datetime64[us]'),
+        CONCEPTO=df['CONCEPTO'].astype(TIPO_CONCEPTO),
+        VALOR=df['VALOR'].astype('int64')
+    )
+
+
+def ordenar_por_concepto(df):
+    """Orden estable por concepto (Z498, Z609, Y602, Y608) conservando el orden de filas"""
+    return df.sort_values('CONCEPTO', kind='stable').reset_index(drop=True)
+
 
 def procesar_todo_simple():
     """
@@ -14,72 +1138,43 @@ def procesar_todo_simple():
     ruta_salida = r"C:\Users\jjbustos\OneDrive - Grupo Jerónimo Martins\Documents\liquidacion_validacion_nomina\archivos_salida"
     os.makedirs(ruta_salida, exist_ok=True)
     
-    # Lista para todos los registros
-    todos_los_registros = []
+    archivo_caja = r"C:\Users\jjbustos\OneDrive - Grupo Jerónimo Martins\Documents\liquidacion_validacion_nomina\archivos_busqueda_planos\PAZ Y SALVOS PQT_08 JULIO 2025_caja.xlsx"
+    archivo_big_pass = r"C:\Users\jjbustos\OneDrive - Grupo Jerónimo Martins\Documents\liquidacion_validacion_nomina\archivos_busqueda_planos\PAZ Y SALVOS PQT_08_Julio 2025_big_pass.xlsx"
+    
+    # Bloques de registros por concepto
+    bloques = []
+    formato_fecha = '%d/%m/%Y'
     
     # ============ PROCESAR CAJA ============
     print("PROCESANDO ARCHIVO CAJA...")
     try:
-        archivo_caja = r"C:\Users\jjbustos\OneDrive - Grupo Jerónimo Martins\Documents\liquidacion_validacion_nomina\archivos_busqueda_planos\PAZ Y SALVOS PQT_08 JULIO 2025_caja.xlsx"
-        df_caja = pd.read_excel(archivo_caja)
+        df_caja = leer_caja(archivo_caja)
         
         # Filtrar descuadres de caja > 0
-        columna_descuadres = 'DESCUADRES DE CAJA PARA DESCONTAR'
-        df_caja_filtrado = df_caja[
-            (df_caja[columna_descuadres].notna()) & 
-            (pd.to_numeric(df_caja[columna_descuadres], errors='coerce') > 0)
-        ]
-        
-        print(f"Registros CAJA procesados: {len(df_caja_filtrado)}")
-        
-        # Agregar registros de caja
-        for _, row in df_caja_filtrado.iterrows():
-            fecha_str = ''
-            if pd.notna(row['Fecha Terminación. (Digite)']):
-                fecha_dt = pd.to_datetime(row['Fecha Terminación. (Digite)'], errors='coerce')
-                if pd.notna(fecha_dt):
-                    fecha_str = fecha_dt.strftime('%d/%m/%Y')
-            
-            registro = {
-                'SAP': row['SAP'],
-                'FECHA': fecha_str,
-                'CONCEPTO': 'Z498',
-                'VALOR': int(pd.to_numeric(row[columna_descuadres], errors='coerce'))
-            }
-            todos_los_registros.append(registro)
+        df_z498 = registros_concepto(
+            df_caja, 'Z498', COLUMNA_DESCUADRES, COLUMNA_SAP_CAJA, COLUMNA_FECHA_CAJA
+        )
+        print(f"Registros CAJA procesados: {len(df_z498)}")
+        bloques.append(df_z498)
             
     except Exception as e:
         print(f"Error procesando CAJA: {e}")
     
     # ============ PROCESAR BIG PASS ============
     print("\nPROCESANDO ARCHIVO BIG PASS...")
+    df_big_pass = None
     try:
-        archivo_big_pass = r"C:\Users\jjbustos\OneDrive - Grupo Jerónimo Martins\Documents\liquidacion_validacion_nomina\archivos_busqueda_planos\PAZ Y SALVOS PQT_08_Julio 2025_big_pass.xlsx"
-        df_big_pass = pd.read_excel(archivo_big_pass)
+        # Se lee una sola vez; PEOPLE reutiliza el mismo DataFrame
+        df_big_pass = leer_big_pass(archivo_big_pass)
         
         print(f"Columnas Big Pass: {list(df_big_pass.columns)}")
         
         # Procesar DESCONTAR
-        df_descontar = df_big_pass[
-            (df_big_pass['Descontar'].notna()) & 
-            (pd.to_numeric(df_big_pass['Descontar'], errors='coerce') > 0)
-        ]
-        print(f"Registros DESCONTAR procesados: {len(df_descontar)}")
-        
-        for _, row in df_descontar.iterrows():
-            fecha_str = ''
-            if pd.notna(row['Terminación']):
-                fecha_dt = pd.to_datetime(row['Terminación'], errors='coerce')
-                if pd.notna(fecha_dt):
-                    fecha_str = fecha_dt.strftime('%d/%m/%Y')
-            
-            registro = {
-                'SAP': str(row['N° Sap ']).strip(),
-                'FECHA': fecha_str,
-                'CONCEPTO': 'Z609',
-                'VALOR': int(pd.to_numeric(row['Descontar'], errors='coerce'))
-            }
-            todos_los_registros.append(registro)
+        df_z609 = registros_concepto(
+            df_big_pass, 'Z609', 'Descontar', COLUMNA_SAP_BIG_PASS, COLUMNA_FECHA_BIG_PASS
+        )
+        print(f"Registros DESCONTAR procesados: {len(df_z609)}")
+        bloques.append(df_z609)
         
         # Procesar PAGAR
         print("\nAnalizando columna PAGAR:")
@@ -91,28 +1186,11 @@ def procesar_todo_simple():
         print(f"Valores = 0: {(valores_numericos == 0).sum()}")
         print(f"Valores NaN: {valores_numericos.isna().sum()}")
         
-        df_pagar = df_big_pass[
-            (df_big_pass['Pagar'].notna()) & 
-            (pd.to_numeric(df_big_pass['Pagar'], errors='coerce') > 0)
-        ]
-        print(f"Registros PAGAR procesados: {len(df_pagar)}")
-        
-        for _, row in df_pagar.iterrows():
-            fecha_str = ''
-            if pd.notna(row['Terminación']):
-                fecha_dt = pd.to_datetime(row['Terminación'], errors='coerce')
-                if pd.notna(fecha_dt):
-                    fecha_str = fecha_dt.strftime('%d/%m/%Y')
-            
-            valor_pagar = pd.to_numeric(row['Pagar'], errors='coerce')
-            if valor_pagar > 0:
-                registro = {
-                    'SAP': str(row['N° Sap ']).strip(),
-                    'FECHA': fecha_str,
-                    'CONCEPTO': 'Y602',
-                    'VALOR': int(valor_pagar)
-                }
-                todos_los_registros.append(registro)
+        df_y602 = registros_concepto(
+            df_big_pass, 'Y602', 'Pagar', COLUMNA_SAP_BIG_PASS, COLUMNA_FECHA_BIG_PASS
+        )
+        print(f"Registros PAGAR procesados: {len(df_y602)}")
+        bloques.append(df_y602)
             
     except Exception as e:
         print(f"Error procesando BIG PASS: {e}")
@@ -120,13 +1198,14 @@ def procesar_todo_simple():
     # ============ PROCESAR PEOPLE SEPARADAMENTE ============
     print("\n=== PROCESANDO PEOPLE POR SEPARADO ===")
     try:
-        archivo_big_pass = r"C:\Users\jjbustos\OneDrive - Grupo Jerónimo Martins\Documents\liquidacion_validacion_nomina\archivos_busqueda_planos\PAZ Y SALVOS PQT_08_Julio 2025_big_pass.xlsx"
-        df_people_check = pd.read_excel(archivo_big_pass)
+        df_people_check = df_big_pass
         
         print("--- PROCESANDO PEOPLE ---")
         print("Iniciando procesamiento de columna PEOPLE...")
         
-        if 'PEOPLE' not in df_people_check.columns:
+        if df_people_check is None:
+            print("ERROR: Archivo BIG PASS no disponible")
+        elif 'PEOPLE' not in df_people_check.columns:
             print("ERROR: Columna PEOPLE no encontrada")
         else:
             print("Columna PEOPLE encontrada correctamente")
@@ -140,32 +1219,13 @@ def procesar_todo_simple():
             print(f"Valores = 0: {(valores_numericos_people == 0).sum()}")
             print(f"Valores NaN: {valores_numericos_people.isna().sum()}")
             
-            df_people = df_people_check[
-                (df_people_check['PEOPLE'].notna()) & 
-                (pd.to_numeric(df_people_check['PEOPLE'], errors='coerce') > 0)
-            ]
-            print(f"Registros PEOPLE filtrados: {len(df_people)}")
-            
-            registros_people_agregados = 0
-            for _, row in df_people.iterrows():
-                fecha_str = ''
-                if pd.notna(row['Terminación']):
-                    fecha_dt = pd.to_datetime(row['Terminación'], errors='coerce')
-                    if pd.notna(fecha_dt):
-                        fecha_str = fecha_dt.strftime('%d/%m/%Y')
-                
-                valor_people = pd.to_numeric(row['PEOPLE'], errors='coerce')
-                if valor_people > 0:
-                    registro = {
-                        'SAP': str(row['N° Sap ']).strip(),
-                        'FECHA': fecha_str,
-                        'CONCEPTO': 'Y608',
-                        'VALOR': int(valor_people)
-                    }
-                    todos_los_registros.append(registro)
-                    registros_people_agregados += 1
+            df_y608 = registros_concepto(
+                df_people_check, 'Y608', 'PEOPLE', COLUMNA_SAP_BIG_PASS, COLUMNA_FECHA_BIG_PASS
+            )
+            print(f"Registros PEOPLE filtrados: {len(df_y608)}")
+            bloques.append(df_y608)
             
-            print(f"Registros PEOPLE agregados al archivo: {registros_people_agregados}")
+            print(f"Registros PEOPLE agregados al archivo: {len(df_y608)}")
         
         print("Procesamiento de PEOPLE completado.")
         
@@ -173,16 +1233,21 @@ def procesar_todo_simple():
         print(f"Error procesando PEOPLE por separado: {e}")
     
     # ============ CREAR ARCHIVO FINAL ============
-    if not todos_los_registros:
+    bloques = [bloque for bloque in bloques if not bloque.empty]
+    if not bloques:
         print("No hay registros para procesar")
         return
     
-    df_final = pd.DataFrame(todos_los_registros)
+    df_final = pd.concat(bloques, ignore_index=True)
     print(f"\nTOTAL REGISTROS: {len(df_final)}")
+    sin_sap = int(df_final['SAP'].isna().sum())
+    if sin_sap:
+        print(f"Registros con SAP vacío o inválido (revisar antes de cargar): {sin_sap}")
     print(f"Columnas: {list(df_final.columns)}")
     
     # Contar por concepto
     conceptos = df_final['CONCEPTO'].value_counts()
+    conceptos = conceptos[conceptos > 0]
     print("\nRESUMEN POR CONCEPTO:")
     for concepto, cantidad in conceptos.items():
         suma = df_final[df_final['CONCEPTO'] == concepto]['VALOR'].sum()
@@ -197,21 +1262,201 @@ def procesar_todo_simple():
     # Guardar archivo
     archivo_salida = os.path.join(ruta_salida, "archivo_plano.xlsx")
     try:
-        df_final.to_excel(archivo_salida, index=False)
+        salida.escribir_archivo(para_exportar(df_final), archivo_salida, "Excel (.xlsx)", formato_fecha)
         print(f"\nARCHIVO CREADO: {archivo_salida}")
         print(f"Tamaño: {os.path.getsize(archivo_salida)} bytes")
     except:
         archivo_csv = os.path.join(ruta_salida, "archivo_plano.csv")
-        df_final.to_csv(archivo_csv, index=False, encoding='utf-8-sig', sep=';')
+        salida.escribir_archivo(para_exportar(df_final), archivo_csv, "CSV (.csv)", formato_fecha)
         print(f"\nARCHIVO CREADO: {archivo_csv}")
     
     # Mostrar muestra
     print(f"\nMUESTRA DE DATOS:")
-    print(df_final.head(10).to_string(index=False))
+    print(salida.formatear_bloque(df_final.head(10), formato_fecha).to_string(index=False))
     
     print("\n" + "="*60)
     print("PROCESAMIENTO COMPLETADO")
 
+# ============ MODO LOTE (VARIOS PAQUETES) ============
+PATRON_CAJA = re.compile(r'caja', re.IGNORECASE)
+PATRON_BIG_PASS = re.compile(r'big[\s_-]*pass', re.IGNORECASE)
+EXTENSIONES_EXCEL = ('.xlsx', '.xlsm', '.xls')
+# --formato del CLI -> formato de salida
+FORMATOS_CLI = {salida.FORMATOS[formato]['extension']: formato for formato in salida.FORMATOS}
+
+
+def nombre_paquete(nombre_archivo):
+    """
+    Clave del paquete a partir del nombre del archivo, sin el tipo ni la
+    extensión: 'PAZ Y SALVOS PQT_08 JULIO 2025_caja.xlsx' y
+    'PAZ Y SALVOS PQT_08_Julio 2025_big_pass.xlsx' -> 'PAZ Y SALVOS PQT 08 JULIO 2025'
+    """
+    base = os.path.splitext(nombre_archivo)[0]
+    base = PATRON_BIG_PASS.sub(' ', PATRON_CAJA.sub(' ', base))
+    return ' '.join(re.sub(r'[^\w]+|_', ' ', base).split()).upper()
+
+
+def emparejar_paquetes(directorio):
+    """
+    Agrupa los Excel del directorio en pares CAJA/BIG PASS por paquete.
+    Retorna (pares, sin_pareja): pares es {paquete: (ruta_caja, ruta_big_pass)}.
+    """
+    encontrados = {}
+    for nombre in sorted(os.listdir(directorio)):
+        if not nombre.lower().endswith(EXTENSIONES_EXCEL) or nombre.startswith('~$'):
+            continue
+        if PATRON_BIG_PASS.search(nombre):
+            tipo = 'big_pass'
+        elif PATRON_CAJA.search(nombre):
+            tipo = 'caja'
+        else:
+            continue
+        encontrados.setdefault(nombre_paquete(nombre), {})[tipo] = os.path.join(directorio, nombre)
+
+    pares = {}
+    sin_pareja = []
+    for paquete, archivos in encontrados.items():
+        if 'caja' in archivos and 'big_pass' in archivos:
+            pares[paquete] = (archivos['caja'], archivos['big_pass'])
+        else:
+            sin_pareja.extend(archivos.values())
+    return pares, sin_pareja
+
+
+def procesar_paquete(paquete, ruta_caja, ruta_big_pass, directorio_salida, formato, consolidado=False,
+                     filas_por_parte=None, parte_por_concepto=False):
+    """
+    Procesa un par CAJA/BIG PASS y escribe su archivo plano (sumando VALOR
+    por SAP, FECHA y CONCEPTO si consolidado es True). Con filas_por_parte
+    escribe un ZIP con el archivo dividido en partes (ver salida.partes).
+    Se ejecuta en un proceso del pool; retorna el resultado y los tiempos.
+    """
+    tiempos = {'paquete': paquete}
+    inicio = time.perf_counter()
+
+    # Ya corre en un proceso del pool: las hojas se leen en secuencia
+    df_caja = leer_caja(ruta_caja, trabajadores=1)
+    df_big_pass = leer_big_pass(ruta_big_pass, trabajadores=1)
+    tiempos['lectura_s'] = time.perf_counter() - inicio
+
+    marca = time.perf_counter()
+    df_final, estadisticas = generar_archivo_plano(df_caja, df_big_pass)
+    if consolidado and df_final is not None:
+        registros_originales = len(df_final)
+        df_final, _ = consolidar(df_final)
+        estadisticas = calcular_estadisticas(df_final)
+        tiempos['combinados'] = registros_originales - len(df_final)
+    tiempos['proceso_s'] = time.perf_counter() - marca
+
+    marca = time.perf_counter()
+    ruta_salida = None
+    if df_final is not None:
+        ruta_salida = escribir_salida(
+            df_final, os.path.join(directorio_salida, f"archivo_plano_{paquete.replace(' ', '_')}"),
+            formato, filas_por_parte, parte_por_concepto
+        )
+    tiempos['escritura_s'] = time.perf_counter() - marca
+
+    tiempos['total_s'] = time.perf_counter() - inicio
+    tiempos['registros'] = 0 if df_final is None else len(df_final)
+    return df_final, estadisticas, tiempos, ruta_salida
+
+
+def escribir_salida(df, ruta_base, formato, filas_por_parte=None, parte_por_concepto=False):
+    """Escribe ruta_base.<extensión>, o ruta_base.zip dividido en partes si hay filas_por_parte"""
+    df = para_exportar(df)
+    if filas_por_parte:
+        return salida.escribir_zip(df, f"{ruta_base}.zip", formato, filas_por_parte, parte_por_concepto)
+    return salida.escribir_archivo(df, f"{ruta_base}.{salida.FORMATOS[formato]['extension']}", formato)
+
+
+def procesar_lote(directorio_entrada, directorio_salida, trabajadores=None, formato="Excel (.xlsx)", consolidado=False,
+                  filas_por_parte=None, parte_por_concepto=False):
+    """
+    Procesa todos los paquetes del directorio en un pool de procesos.
+    Escribe un archivo por paquete, un consolidado y el resumen de tiempos.
+    """
+    print("=== PROCESADOR POR LOTES - CAJA + BIG PASS ===")
+    print(f"Fecha: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    print("="*60)
+
+    os.makedirs(directorio_salida, exist_ok=True)
+    pares, sin_pareja = emparejar_paquetes(directorio_entrada)
+    for ruta in sin_pareja:
+        print(f"SIN PAREJA (omitido): {os.path.basename(ruta)}")
+    if not pares:
+        print("No se encontraron paquetes CAJA/BIG PASS para procesar")
+        return None
+
+    print(f"Paquetes encontrados: {len(pares)}")
+    inicio = time.perf_counter()
+    resultados = {}
+    resumen_tiempos = []
+
+    with ProcessPoolExecutor(max_workers=trabajadores) as pool:
+        futuros = {
+            pool.submit(procesar_paquete, paquete, ruta_caja, ruta_big_pass, directorio_salida, formato, consolidado,
+                        filas_por_parte, parte_por_concepto): paquete
+            for paquete, (ruta_caja, ruta_big_pass) in pares.items()
+        }
+        for futuro in as_completed(futuros):
+            paquete = futuros[futuro]
+            try:
+                df_final, estadisticas, tiempos, ruta_salida = futuro.result()
+            except Exception as e:
+                print(f"Error procesando {paquete}: {e}")
+                resumen_tiempos.append({'paquete': paquete, 'error': str(e)})
+                continue
+            resultados[paquete] = df_final
+            resumen_tiempos.append(tiempos)
+            print(f"{paquete}: {tiempos['registros']:,} registros en {tiempos['total_s']:.2f}s"
+                  + (f" -> {os.path.basename(ruta_salida)}" if ruta_salida else ""))
+
+    # Consolidado en el orden de los paquetes
+    bloques = []
+    for paquete in sorted(resultados):
+        if resultados[paquete] is not None:
+            bloques.append(resultados[paquete].assign(PAQUETE=paquete))
+    if bloques:
+        df_consolidado = pd.concat(bloques, ignore_index=True)
+        ruta_consolidado = escribir_salida(
+            df_consolidado, os.path.join(directorio_salida, "archivo_plano_consolidado"),
+            formato, filas_por_parte, parte_por_concepto
+        )
+        print(f"\nCONSOLIDADO: {ruta_consolidado} ({len(df_consolidado):,} registros)")
+
+    df_tiempos = pd.DataFrame(resumen_tiempos).sort_values('paquete')
+    ruta_tiempos = os.path.join(directorio_salida, "resumen_tiempos.csv")
+    df_tiempos.to_csv(ruta_tiempos, index=False, encoding='utf-8-sig', sep=';')
+
+    print("\nRESUMEN DE TIEMPOS POR PAQUETE:")
+    print(df_tiempos.to_string(index=False))
+    print(f"\nTiempo total del lote: {time.perf_counter() - inicio:.2f}s")
+    print("="*60)
+    return df_tiempos
+
+
+def main():
+    """Sin argumentos ejecuta el procesador simple; con --entrada, el modo lote"""
+    parser = argparse.ArgumentParser(description="Generación de archivos planos SAP (CAJA + BIG PASS)")
+    parser.add_argument('--entrada', help="Directorio con los archivos CAJA y BIG PASS de varios paquetes")
+    parser.add_argument('--salida', help="Directorio de salida (por defecto <entrada>/archivos_salida)")
+    parser.add_argument('--workers', type=int, default=None, help="Procesos en paralelo (por defecto, núcleos disponibles)")
+    parser.add_argument('--formato', choices=list(FORMATOS_CLI), default='xlsx', help="Formato de los archivos generados")
+    parser.add_argument('--consolidar', action='store_true', help="Suma VALOR por SAP, FECHA y CONCEPTO en cada paquete")
+    parser.add_argument('--partes', type=int, default=None, metavar='FILAS',
+                        help="Divide cada archivo en partes de a lo sumo FILAS registros, en un ZIP")
+    parser.add_argument('--por-concepto', action='store_true', help="Con --partes, una parte por concepto")
+    args = parser.parse_args()
+
+    if args.entrada is None:
+        procesar_todo_simple()
+        return
+
+    formato = FORMATOS_CLI[args.formato]
+    directorio_salida = args.salida or os.path.join(args.entrada, 'archivos_salida')
+    procesar_lote(args.entrada, directorio_salida, args.workers, formato, args.consolidar, args.partes, args.por_concepto)
+
 # Ejecutar
 if __name__ == "__main__":
-    procesar_todo_simple()
+    main()
@@ -0,0 +1,279 @@
+import argparse
+import json
+import os
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+import numpy as np
+import openpyxl
+import pandas as pd
+
+import archivo_plano
+import salida
+import validacion
+
+TAMANOS_POR_DEFECTO = [1_000, 100_000, 1_000_000]
+DIRECTORIO_DATOS = 'bench_datos'
+
+# Columnas de relleno para simular los reportes anchos de RR.HH.
+COLUMNAS_RELLENO = ['Nombre', 'Cédula', 'Tienda', 'Cargo', 'Observaciones']
+
+
+# ============ GENERADOR DE DATOS SINTÉTICOS ============
+def _fechas_mixtas(rng, n):
+    """Fechas de terminación con los formatos que llegan en los paquetes reales"""
+    base = datetime(2025, 1, 1)
+    dias = rng.integers(0, 365, n)
+    tipo = rng.integers(0, 5, n)
+    fechas = []
+    for dia, t in zip(dias.tolist(), tipo.tolist()):
+        fecha = base + timedelta(days=dia)
+        if t == 0:
+            fechas.append(fecha)                                  # fecha real de Excel
+        elif t == 1:
+            fechas.append(fecha.strftime('%d/%m/%Y'))             # texto digitado
+        elif t == 2:
+            fechas.append(fecha.strftime('%Y-%m-%d'))             # texto ISO
+        elif t == 3:
+            fechas.append((fecha - datetime(1899, 12, 30)).days)  # serial de Excel
+        else:
+            fechas.append(None)                                   # vacío
+    return fechas
+
+
+def _valores_mixtos(rng, n, maximo=500_000):
+    """Valores con ceros, vacíos, negativos, decimales y números en texto"""
+    valores = rng.integers(1, maximo, n).tolist()
+    tipo = rng.integers(0, 10, n).tolist()
+    for i, t in enumerate(tipo):
+        if t < 4:
+            valores[i] = None
+        elif t < 6:
+            valores[i] = 0
+        elif t == 6:
+            valores[i] = -valores[i]
+        elif t == 7:
+            valores[i] = valores[i] + 0.5
+        elif t == 8:
+            valores[i] = str(valores[i])
+    return valores
+
+
+def _escribir_libro(ruta, columnas, filas):
+    """Escribe el libro con openpyxl en modo solo escritura"""
+    libro = openpyxl.Workbook(write_only=True)
+    hoja = libro.create_sheet('Hoja1')
+    hoja.append(columnas)
+    for fila in filas:
+        hoja.append(fila)
+    libro.save(ruta)
+
+
+def generar_caja(ruta, n, semilla=0):
+    """Archivo CAJA sintético con las columnas reales"""
+    rng = np.random.default_rng(semilla)
+    sap = rng.integers(10_000_000, 99_999_999, n).tolist()
+    fechas = _fechas_mixtas(rng, n)
+    valores = _valores_mixtos(rng, n, maximo=200_000)
+    relleno = [f"dato {i}" for i in range(n)]
+    columnas = [archivo_plano.COLUMNA_SAP_CAJA] + COLUMNAS_RELLENO + [
+        archivo_plano.COLUMNA_FECHA_CAJA, archivo_plano.COLUMNA_DESCUADRES
+    ]
+    filas = (
+        [sap[i]] + [relleno[i]] * len(COLUMNAS_RELLENO) + [fechas[i], valores[i]]
+        for i in range(n)
+    )
+    _escribir_libro(ruta, columnas, filas)
+
+
+def generar_big_pass(ruta, n, semilla=1):
+    """Archivo BIG PASS sintético; el SAP llega como texto con espacios en parte de las filas"""
+    rng = np.random.default_rng(semilla)
+    sap = rng.integers(10_000_000, 99_999_999, n).tolist()
+    sap = [f" {v} " if v % 3 == 0 else v for v in sap]
+    fechas = _fechas_mixtas(rng, n)
+    descontar = _valores_mixtos(rng, n)
+    pagar = _valores_mixtos(rng, n)
+    people = _valores_mixtos(rng, n, maximo=50_000)
+    relleno = [f"dato {i}" for i in range(n)]
+    columnas = [archivo_plano.COLUMNA_SAP_BIG_PASS] + COLUMNAS_RELLENO + [
+        archivo_plano.COLUMNA_FECHA_BIG_PASS, 'Descontar', 'Pagar', 'PEOPLE'
+    ]
+    filas = (
+        [sap[i]] + [relleno[i]] * len(COLUMNAS_RELLENO) + [fechas[i], descontar[i], pagar[i], people[i]]
+        for i in range(n)
+    )
+    _escribir_libro(ruta, columnas, filas)
+
+
+def preparar_datos(n, directorio=DIRECTORIO_DATOS, regenerar=False):
+    """Rutas (caja, big_pass) de n filas; se generan solo si no existen"""
+    os.makedirs(directorio, exist_ok=True)
+    ruta_caja = os.path.join(directorio, f"caja_{n}.xlsx")
+    ruta_big_pass = os.path.join(directorio, f"big_pass_{n}.xlsx")
+    if regenerar or not os.path.exists(ruta_caja):
+        generar_caja(ruta_caja, n)
+    if regenerar or not os.path.exists(ruta_big_pass):
+        generar_big_pass(ruta_big_pass, n)
+    return ruta_caja, ruta_big_pass
+
+
+# ============ MEDICIÓN POR ETAPA ============
+def medir(nombre, funcion, filas, medir_memoria=True):
+    """
+    Ejecuta la etapa y retorna (resultado, métricas de tiempo, throughput y
+    memoria pico). La memoria se mide en una segunda ejecución con
+    tracemalloc, para que su sobrecarga no altere el tiempo reportado.
+    """
+    inicio = time.perf_counter()
+    resultado = funcion()
+    segundos = time.perf_counter() - inicio
+
+    pico_mb = None
+    if medir_memoria:
+        tracemalloc.start()
+        try:
+            funcion()
+            pico_mb = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+        finally:
+            tracemalloc.stop()
+
+    return resultado, {
+        'etapa': nombre,
+        'filas': filas,
+        'segundos': round(segundos, 4),
+        'filas_por_s': round(filas / segundos) if segundos > 0 else None,
+        'pico_mb': None if pico_mb is None else round(pico_mb, 1)
+    }
+
+
+def _filtrar(df_caja, df_big_pass):
+    """Máscaras valor > 0 de todos los conceptos"""
+    mascaras = {}
+    for df, fuente in [(df_caja, 'caja'), (df_big_pass, 'big_pass')]:
+        for concepto, columna, _ in archivo_plano.FUENTES[fuente][0]:
+            valores = pd.to_numeric(df[columna], errors='coerce')
+            mascaras[concepto] = df[columna].notna() & (valores > 0)
+    return mascaras
+
+
+def _convertir_fechas(df_caja, df_big_pass):
+    """Interpretación de las columnas de fecha completas"""
+    return (
+        archivo_plano.convertir_fechas(df_caja[archivo_plano.COLUMNA_FECHA_CAJA]),
+        archivo_plano.convertir_fechas(df_big_pass[archivo_plano.COLUMNA_FECHA_BIG_PASS])
+    )
+
+
+def _streaming(ruta_caja, ruta_big_pass):
+    estadisticas = archivo_plano.estadisticas_vacias()
+    return sum(len(b) for b in archivo_plano.generar_archivo_plano_streaming(ruta_caja, ruta_big_pass, estadisticas))
+
+
+def _concurrente(ruta_caja, ruta_big_pass, formato):
+    _, _, datos = archivo_plano.generar_archivo_plano_concurrente(ruta_caja, ruta_big_pass, formato)
+    return datos
+
+
+def ejecutar_benchmark(n, directorio=DIRECTORIO_DATOS, regenerar=False, medir_memoria=True, streaming=False,
+                       concurrente=False):
+    """Mide todas las etapas del procesamiento para archivos de n filas"""
+    marca = time.perf_counter()
+    ruta_caja, ruta_big_pass = preparar_datos(n, directorio, regenerar)
+    print(f"\nDatos de {n:,} filas listos en {time.perf_counter() - marca:.1f}s")
+
+    metricas = []
+    filas_entrada = 2 * n
+
+    (df_caja, df_big_pass), m = medir(
+        'lectura', lambda: (archivo_plano.leer_caja(ruta_caja), archivo_plano.leer_big_pass(ruta_big_pass)),
+        filas_entrada, medir_memoria
+    )
+    metricas.append(m)
+
+    _, m = medir('filtro', lambda: _filtrar(df_caja, df_big_pass), filas_entrada, medir_memoria)
+    metricas.append(m)
+
+    _, m = medir('fechas', lambda: _convertir_fechas(df_caja, df_big_pass), filas_entrada, medir_memoria)
+    metricas.append(m)
+
+    (df_final, _), m = medir(
+        'registros', lambda: archivo_plano.generar_archivo_plano(df_caja, df_big_pass),
+        filas_entrada, medir_memoria
+    )
+    metricas.append(m)
+
+    # Mismo armado con el reporte de validación: la diferencia es su costo
+    _, m = medir(
+        'registros_validados',
+        lambda: archivo_plano.generar_archivo_plano(df_caja, df_big_pass, reporte=validacion.ReporteValidacion()),
+        filas_entrada, medir_memoria
+    )
+    metricas.append(m)
+
+    filas_salida = 0 if df_final is None else len(df_final)
+    if df_final is not None:
+        for formato in salida.FORMATOS:
+            _, m = medir(
+                f"codificar_{salida.FORMATOS[formato]['extension']}",
+                lambda: salida.codificar(df_final, formato), filas_salida, medir_memoria
+            )
+            metricas.append(m)
+
+    if streaming:
+        _, m = medir('streaming_total', lambda: _streaming(ruta_caja, ruta_big_pass), filas_entrada, medir_memoria)
+        metricas.append(m)
+
+    if concurrente:
+        # Lectura en paralelo + codificación xlsx superpuesta, de extremo a extremo
+        _, m = medir(
+            'concurrente_total', lambda: _concurrente(ruta_caja, ruta_big_pass, "Excel (.xlsx)"),
+            filas_entrada, medir_memoria
+        )
+        metricas.append(m)
+
+    for m in metricas:
+        m['tamano'] = n
+        m['filas_salida'] = filas_salida
+    return metricas
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del procesamiento CAJA + BIG PASS")
+    parser.add_argument('--filas', type=int, nargs='+', default=TAMANOS_POR_DEFECTO,
+                        help="Tamaños a medir (filas por archivo)")
+    parser.add_argument('--directorio', default=DIRECTORIO_DATOS, help="Dónde guardar los libros sintéticos")
+    parser.add_argument('--regenerar', action='store_true', help="Vuelve a generar los libros aunque existan")
+    parser.add_argument('--sin-memoria', action='store_true',
+                        help="No mide memoria pico (evita la segunda ejecución con tracemalloc)")
+    parser.add_argument('--streaming', action='store_true', help="Incluye el modo streaming de extremo a extremo")
+    parser.add_argument('--concurrente', action='store_true',
+                        help="Incluye el grafo de etapas (lectura en paralelo y codificación xlsx superpuesta)")
+    parser.add_argument('--salida', help="Guarda los resultados en JSON")
+    args = parser.parse_args()
+
+    print("=== BENCHMARK - CAJA + BIG PASS ===")
+    print(f"Fecha: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    print("="*60)
+
+    resultados = []
+    for n in args.filas:
+        resultados.extend(ejecutar_benchmark(
+            n, args.directorio, args.regenerar, not args.sin_memoria, args.streaming, args.concurrente
+        ))
+
+    df_resultados = pd.DataFrame(resultados)[
+        ['tamano', 'etapa', 'filas', 'segundos', 'filas_por_s', 'pico_mb', 'filas_salida']
+    ]
+    print("\nRESULTADOS:")
+    print(df_resultados.to_string(index=False))
+
+    if args.salida:
+        with open(args.salida, 'w', encoding='utf-8') as archivo:
+            json.dump(resultados, archivo, indent=2, ensure_ascii=False)
+        print(f"\nResultados guardados en {args.salida}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+import hashlib
+import sys
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+# Límite por defecto del caché (bytes estimados en memoria)
+MAX_BYTES_CACHE = 256 * 1024 * 1024
+
+
+def hash_contenido(datos):
+    """SHA-256 del contenido de un archivo (bytes, bytearray o memoryview)"""
+    return hashlib.sha256(datos).hexdigest()
+
+
+def estimar_tamano(valor):
+    """Tamaño aproximado en memoria de un valor guardado en el caché"""
+    if isinstance(valor, pd.DataFrame):
+        return int(valor.memory_usage(deep=True).sum())
+    if isinstance(valor, (tuple, list)):
+        return sum(estimar_tamano(v) for v in valor)
+    if isinstance(valor, dict):
+        return sum(estimar_tamano(v) for v in valor.values())
+    return sys.getsizeof(valor)
+
+
+class CacheLRU:
+    """
+    Caché LRU acotado por tamaño para DataFrames parseados y resultados.
+    Las claves deben incluir el hash del contenido del archivo. Es seguro
+    usarlo desde los trabajos en segundo plano y el hilo de la interfaz.
+    """
+
+    def __init__(self, max_bytes=MAX_BYTES_CACHE):
+        self.max_bytes = max_bytes
+        self.entradas = OrderedDict()
+        self.tamano_bytes = 0
+        self.aciertos = 0
+        self.fallos = 0
+        self._candado = threading.RLock()
+
+    def __len__(self):
+        return len(self.entradas)
+
+    def __contains__(self, clave):
+        return clave in self.entradas
+
+    def obtener(self, clave):
+        """Valor guardado para la clave o None; cuenta acierto/fallo"""
+        with self._candado:
+            if clave not in self.entradas:
+                self.fallos += 1
+                return None
+            self.aciertos += 1
+            self.entradas.move_to_end(clave)
+            return self.entradas[clave][0]
+
+    def guardar(self, clave, valor):
+        """Guarda el valor y expulsa las entradas menos usadas si se excede el límite"""
+        tamano = estimar_tamano(valor)
+        with self._candado:
+            if clave in self.entradas:
+                self.tamano_bytes -= self.entradas.pop(clave)[1]
+            self.entradas[clave] = (valor, tamano)
+            self.tamano_bytes += tamano
+            # Siempre se conserva al menos la entrada recién guardada
+            while self.tamano_bytes > self.max_bytes and len(self.entradas) > 1:
+                _, (_, tamano_expulsado) = self.entradas.popitem(last=False)
+                self.tamano_bytes -= tamano_expulsado
+        return valor
+
+    def obtener_o_calcular(self, clave, funcion):
+        """Retorna el valor en caché o lo calcula con funcion() y lo guarda"""
+        valor = self.obtener(clave)
+        if valor is None:
+            valor = self.guardar(clave, funcion())
+        return valor
+
+    def limpiar(self):
+        """Vacía el caché sin reiniciar los contadores"""
+        with self._candado:
+            self.entradas.clear()
+            self.tamano_bytes = 0
+
+    def resumen(self):
+        """Contadores para mostrar en la interfaz"""
+        return {
+            'aciertos': self.aciertos,
+            'fallos': self.fallos,
+            'entradas': len(self.entradas),
+            'tamano_mb': self.tamano_bytes / (1024 * 1024)
+        }
@@ -0,0 +1,106 @@
+import argparse
+
+import numpy as np
+import pandas as pd
+
+import archivo_plano
+
+# Clave de cruce entre dos archivos planos
+COLUMNAS_CLAVE = ['SAP', 'CONCEPTO', 'FECHA']
+
+AGREGADO = 'agregado'
+ELIMINADO = 'eliminado'
+MODIFICADO = 'modificado'
+IGUAL = 'igual'
+ESTADOS = [AGREGADO, ELIMINADO, MODIFICADO, IGUAL]
+
+COLUMNAS_DETALLE = COLUMNAS_CLAVE + ['VALOR_ANTERIOR', 'VALOR_ACTUAL', 'DIFERENCIA', 'ESTADO']
+
+
+def _claves(df):
+    """
+    Columnas de cruce con el número de ocurrencia de cada clave, para que
+    los registros repetidos (sin consolidar) se emparejen y el cruce siga
+    siendo uno a uno. Se numeran de menor a mayor VALOR, así el orden de
+    las filas en cada archivo no genera cambios falsos.
+    """
+    claves = df[COLUMNAS_CLAVE + ['VALOR']].sort_values('VALOR', kind='stable').reset_index(drop=True)
+    claves['OCURRENCIA'] = claves.groupby(COLUMNAS_CLAVE, observed=True, dropna=False, sort=False).cumcount()
+    return claves
+
+
+def cruzar(anterior, actual):
+    """
+    Cruce completo (hash join externo por SAP, CONCEPTO, FECHA) entre el
+    archivo plano anterior y el actual, con el estado de cada registro.
+    """
+    cruce = pd.merge(
+        _claves(anterior), _claves(actual),
+        on=COLUMNAS_CLAVE + ['OCURRENCIA'], how='outer', sort=False,
+        suffixes=('_ANTERIOR', '_ACTUAL'), indicator=True
+    )
+    lado = cruce.pop('_merge')
+    anterior_valor = cruce['VALOR_ANTERIOR'].fillna(0).astype('int64')
+    actual_valor = cruce['VALOR_ACTUAL'].fillna(0).astype('int64')
+    estado = np.select(
+        [lado == 'right_only', lado == 'left_only', anterior_valor != actual_valor],
+        [AGREGADO, ELIMINADO, MODIFICADO], IGUAL
+    )
+    return pd.DataFrame({
+        'SAP': cruce['SAP'],
+        'CONCEPTO': cruce['CONCEPTO'].astype(archivo_plano.TIPO_CONCEPTO),
+        'FECHA': cruce['FECHA'],
+        'VALOR_ANTERIOR': cruce['VALOR_ANTERIOR'].astype('Int64'),
+        'VALOR_ACTUAL': cruce['VALOR_ACTUAL'].astype('Int64'),
+        'DIFERENCIA': actual_valor - anterior_valor,
+        'ESTADO': pd.Categorical(estado, categories=ESTADOS)
+    }, columns=COLUMNAS_DETALLE)
+
+
+def detalle(cruce):
+    """Registros agregados, eliminados o con valor distinto, ordenados por estado y concepto"""
+    cambios = cruce[cruce['ESTADO'] != IGUAL]
+    return cambios.sort_values(['ESTADO', 'CONCEPTO', 'SAP'], kind='stable').reset_index(drop=True)
+
+
+def resumen(cruce):
+    """Por concepto: registros y totales de cada archivo, y cuántos se agregaron, eliminaron o cambiaron"""
+    por_concepto = cruce.groupby('CONCEPTO', observed=True)
+    conteos = cruce.groupby(['CONCEPTO', 'ESTADO'], observed=False).size().unstack('ESTADO')
+    tabla = pd.DataFrame({
+        'registros_anterior': por_concepto['VALOR_ANTERIOR'].count(),
+        'registros_actual': por_concepto['VALOR_ACTUAL'].count(),
+        'agregados': conteos[AGREGADO],
+        'eliminados': conteos[ELIMINADO],
+        'modificados': conteos[MODIFICADO],
+        'total_anterior': por_concepto['VALOR_ANTERIOR'].sum(),
+        'total_actual': por_concepto['VALOR_ACTUAL'].sum(),
+        'diferencia': por_concepto['DIFERENCIA'].sum()
+    }).fillna(0).astype('int64')
+    return tabla.reset_index()
+
+
+def comparar(anterior, actual):
+    """Retorna (resumen por concepto, detalle de cambios) entre dos archivos planos"""
+    cruce = cruzar(anterior, actual)
+    return resumen(cruce), detalle(cruce)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compara dos archivos planos (xlsx, CSV, Parquet o Arrow)")
+    parser.add_argument('anterior', help="Archivo plano enviado antes")
+    parser.add_argument('actual', help="Archivo plano nuevo")
+    parser.add_argument('--detalle', help="Guarda los registros con cambios en CSV")
+    args = parser.parse_args()
+
+    tabla, cambios = comparar(archivo_plano.leer_resultado(args.anterior), archivo_plano.leer_resultado(args.actual))
+    print(tabla.to_string(index=False))
+    print(f"\n{len(cambios):,} registros con cambios")
+    if args.detalle:
+        cambios.to_csv(args.detalle, index=False, sep=';', encoding='utf-8-sig',
+                       date_format=archivo_plano.FORMATO_FECHA_SAP)
+        print(f"Detalle guardado en {args.detalle}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+from concurrent.futures import ThreadPoolExecutor
+
+
+class GrafoEtapas:
+    """
+    Grafo pequeño de etapas con dependencias. Cada etapa corre en su propio
+    hilo apenas terminan aquellas de las que depende, así que las ramas
+    independientes (p. ej. leer CAJA y leer BIG PASS) avanzan a la vez.
+    """
+
+    def __init__(self):
+        self.etapas = {}
+
+    def agregar(self, nombre, funcion, dependencias=(), flujo=()):
+        """
+        Agrega una etapa. funcion recibe los resultados de sus dependencias,
+        en orden, cuando todas terminaron. Si se indica flujo, recibe además
+        un iterador que entrega los resultados de esas etapas en ese orden a
+        medida que cada una termina, sin esperar a las demás.
+        Las dependencias deben agregarse antes que la etapa.
+        """
+        if nombre in self.etapas:
+            raise ValueError(f"La etapa {nombre} ya existe")
+        faltantes = [d for d in tuple(dependencias) + tuple(flujo) if d not in self.etapas]
+        if faltantes:
+            raise ValueError(f"La etapa {nombre} depende de etapas no definidas: {', '.join(faltantes)}")
+        self.etapas[nombre] = (funcion, tuple(dependencias), tuple(flujo))
+
+    @staticmethod
+    def _correr(funcion, dependencias, flujo):
+        argumentos = [futuro.result() for futuro in dependencias]
+        if flujo:
+            argumentos.append(futuro.result() for futuro in flujo)
+        return funcion(*argumentos)
+
+    def ejecutar(self):
+        """
+        Ejecuta el grafo y retorna {nombre: resultado}. Si una etapa falla,
+        se espera a las demás y se relanza el primer error en orden de definición.
+        """
+        futuros = {}
+        # Un hilo por etapa: las que esperan dependencias nunca bloquean a las demás
+        with ThreadPoolExecutor(max_workers=max(1, len(self.etapas)), thread_name_prefix='etapa') as pool:
+            for nombre, (funcion, dependencias, flujo) in self.etapas.items():
+                futuros[nombre] = pool.submit(
+                    self._correr, funcion,
+                    [futuros[d] for d in dependencias],
+                    [futuros[d] for d in flujo]
+                )
+        return {nombre: futuro.result() for nombre, futuro in futuros.items()}
@@ -0,0 +1,88 @@
+import functools
+import unicodedata
+
+# Encabezados aceptados para cada columna esperada, además del nombre
+# exacto. Se comparan normalizados: sin tildes, en minúsculas, sin signos
+# y con espacios simples ('N° Sap ', 'N° SAP' y 'n sap' son lo mismo).
+ALIAS_SAP = ['sap', 'n sap', 'no sap', 'nro sap', 'num sap', 'numero sap', 'codigo sap', 'sap empleado']
+ALIAS_FECHA_TERMINACION = [
+    'fecha terminacion digite', 'fecha terminacion', 'fecha de terminacion', 'terminacion',
+    'fecha retiro', 'fecha de retiro'
+]
+
+ALIAS = {
+    # CAJA
+    'SAP': ALIAS_SAP,
+    'Fecha Terminación. (Digite)': ALIAS_FECHA_TERMINACION,
+    'DESCUADRES DE CAJA PARA DESCONTAR': ['descuadres de caja', 'descuadres', 'descuadre de caja para descontar'],
+    # BIG PASS
+    'N° Sap ': ALIAS_SAP,
+    'Terminación': ALIAS_FECHA_TERMINACION,
+    'Descontar': ['descontar', 'valor descontar', 'valor a descontar'],
+    'Pagar': ['pagar', 'valor pagar', 'valor a pagar'],
+    'PEOPLE': ['people', 'valor people'],
+    # Maestro de empleados
+    'NOMBRE': ['nombre', 'nombres', 'nombre completo', 'empleado', 'nombre empleado'],
+    'CENTRO_COSTO': ['centro de costo', 'centro costo', 'centro de costos', 'ceco', 'cc'],
+    'FECHA_RETIRO': ALIAS_FECHA_TERMINACION + ['retiro'],
+}
+
+
+def normalizar(texto):
+    """Encabezado comparable: sin tildes, en minúsculas, sin signos y con espacios simples"""
+    texto = unicodedata.normalize('NFKD', str(texto))
+    texto = ''.join(c if c.isalnum() else ' ' for c in texto if not unicodedata.combining(c))
+    return ' '.join(texto.lower().split())
+
+
+@functools.lru_cache(maxsize=None)
+def _nombres_aceptados(columna):
+    return frozenset([normalizar(columna)] + [normalizar(alias) for alias in ALIAS.get(columna, [])])
+
+
+@functools.lru_cache(maxsize=None)
+def candidatos(columnas):
+    """Encabezados normalizados que pueden corresponder a alguna de las columnas (tupla)"""
+    return frozenset().union(*(_nombres_aceptados(columna) for columna in columnas))
+
+
+def es_candidato(encabezado, columnas):
+    """True si el encabezado puede ser alguna de las columnas (filtro para usecols)"""
+    return normalizar(encabezado) in candidatos(tuple(columnas))
+
+
+@functools.lru_cache(maxsize=256)
+def _resolver(encabezado, columnas):
+    mapeo = {}
+    usados = set()
+    # Primero los nombres exactos, luego los normalizados y alias, en orden del encabezado
+    for columna in columnas:
+        if columna in encabezado:
+            mapeo[columna] = columna
+            usados.add(columna)
+    normalizados = [(original, normalizar(original)) for original in encabezado if original is not None]
+    for columna in columnas:
+        if columna in mapeo:
+            continue
+        aceptados = _nombres_aceptados(columna)
+        for original, normalizado in normalizados:
+            if original not in usados and normalizado in aceptados:
+                mapeo[columna] = original
+                usados.add(original)
+                break
+    return mapeo
+
+
+def resolver(encabezado, columnas):
+    """
+    {columna esperada: encabezado del archivo} para las columnas que se
+    encuentran. El resultado queda en caché por la huella del encabezado
+    (la tupla de nombres), así que un formato ya visto se resuelve al
+    instante.
+    """
+    return dict(_resolver(tuple(encabezado), tuple(columnas)))
+
+
+def renombrados(mapeo):
+    """Solo las columnas cuyo encabezado en el archivo no es el nombre esperado"""
+    return {columna: original for columna, original in (mapeo or {}).items() if columna != original}
@@ -0,0 +1,98 @@
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+
+# Formatos de texto aceptados, siempre día antes que mes ('05/07/2025' es
+# 5 de julio). El primero que funciona en una columna se prueba primero en
+# los valores siguientes de esa columna, dentro de la misma lectura.
+FORMATOS_TEXTO = [
+    '%d/%m/%Y', '%d-%m-%Y', '%d.%m.%Y', '%Y-%m-%d', '%Y/%m/%d',
+    '%d/%m/%Y %H:%M:%S', '%Y-%m-%d %H:%M:%S', '%d/%m/%y', '%d-%m-%y'
+]
+
+# Seriales de Excel (días desde 1899-12-30) que corresponden a fechas válidas
+ORIGEN_EXCEL = pd.Timestamp('1899-12-30')
+SERIAL_MINIMO = 1
+SERIAL_MAXIMO = 2_958_465  # 31/12/9999
+
+
+def _desde_serial(numeros):
+    """Seriales de Excel (arreglo float) a datetime64[us]; fuera de rango queda NaT"""
+    validos = (numeros >= SERIAL_MINIMO) & (numeros <= SERIAL_MAXIMO)
+    dias = np.where(validos, np.floor(np.nan_to_num(numeros)), 0).astype('int64')
+    fechas = np.datetime64(ORIGEN_EXCEL, 'D') + dias.astype('timedelta64[D]')
+    return np.where(validos, fechas.astype('datetime64[us]'), np.datetime64('NaT', 'us'))
+
+
+def _desde_texto(texto, inferido):
+    """
+    Fecha de un texto, probando primero el formato inferido para la columna.
+    Retorna (fecha, formato con que se leyó); fecha None si está en blanco.
+    """
+    texto = texto.strip()
+    if not texto:
+        return None, None
+    if texto.isdigit():
+        return _desde_serial(np.array([float(texto)]))[0], None
+    for formato in ([inferido] if inferido else []) + FORMATOS_TEXTO:
+        try:
+            return np.datetime64(datetime.strptime(texto, formato), 'us'), formato
+        except ValueError:
+            continue
+    return np.datetime64('NaT', 'us'), None
+
+
+def _convertir_valor(valor, inferido):
+    """Fecha de un valor de la columna y el formato de texto con que se leyó (None si no era texto)"""
+    if isinstance(valor, (datetime, date, pd.Timestamp, np.datetime64)):
+        return np.datetime64(pd.Timestamp(valor), 'us'), None
+    if isinstance(valor, (int, float, np.integer, np.floating)) and not isinstance(valor, bool):
+        return _desde_serial(np.array([float(valor)]))[0], None
+    if isinstance(valor, str):
+        return _desde_texto(valor, inferido)
+    return np.datetime64('NaT', 'us'), None
+
+
+def convertir(serie, formatos=None):
+    """
+    Convierte una columna de fechas (fechas de Excel, seriales, texto
+    'dd/mm/aaaa', ISO...) a datetime64[us]. Cada valor distinto se
+    interpreta una sola vez y se aplica por posición. El formato de texto
+    de la columna es el del primer texto que se pudo leer y no cambia
+    aunque otros valores usen otro. Con formatos (dict por nombre de
+    columna) el formato inferido se comparte entre varias llamadas de una
+    misma lectura (p. ej. los bloques del modo streaming); sin él, cada
+    llamada infiere el suyo.
+    Retorna (fechas, rechazados): rechazados cuenta las filas con un valor
+    escrito que no se pudo interpretar (quedan como NaT, igual que las vacías).
+    """
+    if pd.api.types.is_datetime64_any_dtype(serie):
+        return serie, 0
+    if pd.api.types.is_numeric_dtype(serie) and not pd.api.types.is_bool_dtype(serie):
+        numeros = serie.to_numpy(dtype=float, na_value=np.nan)
+        fechas = _desde_serial(numeros)
+        rechazados = int((~np.isnan(numeros) & np.isnat(fechas)).sum())
+        return pd.Series(fechas, index=serie.index, name=serie.name), rechazados
+
+    codigos, unicos = pd.factorize(serie, use_na_sentinel=True)
+    inferido = None if formatos is None else formatos.get(serie.name)
+    convertidos = []
+    for valor in unicos:
+        fecha, formato = _convertir_valor(valor, inferido)
+        if inferido is None:
+            inferido = formato
+        convertidos.append(fecha)
+    if formatos is not None and inferido is not None:
+        formatos[serie.name] = inferido
+    # Texto en blanco cuenta como vacío, no como rechazado
+    vacios = np.array([valor is None for valor in convertidos], dtype=bool)
+    # El NaT agregado al final queda en la posición -1, la de los nulos en codigos
+    convertidos = np.array(
+        [np.datetime64('NaT', 'us') if valor is None else valor for valor in convertidos] + [np.datetime64('NaT', 'us')],
+        dtype='datetime64[us]'
+    )
+    fechas = convertidos[codigos]
+    rechazados_unicos = np.isnat(convertidos[:-1]) & ~vacios
+    rechazados = int(rechazados_unicos[codigos[codigos >= 0]].sum())
+    return pd.Series(fechas, index=serie.index, name=serie.name), rechazados
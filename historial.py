@@ -0,0 +1,184 @@
+import argparse
+import itertools
+import os
+import sqlite3
+from datetime import datetime
+
+import pandas as pd
+
+import archivo_plano
+
+# Base SQLite local con todos los registros emitidos en cada corrida
+RUTA_HISTORIAL = os.environ.get('NOMINA_HISTORIAL', 'historial_nomina.sqlite')
+# Filas por llamada a executemany dentro de la transacción
+TAMANO_LOTE = 50_000
+# Filas que retorna una consulta sin límite explícito
+LIMITE_CONSULTA = 100_000
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS corridas (
+    id INTEGER PRIMARY KEY,
+    fecha_corrida TEXT NOT NULL,
+    clave TEXT UNIQUE,
+    descripcion TEXT,
+    registros INTEGER NOT NULL,
+    total INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS registros (
+    corrida_id INTEGER NOT NULL REFERENCES corridas(id),
+    sap INTEGER,
+    fecha TEXT,
+    concepto TEXT NOT NULL,
+    valor INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_corridas_fecha ON corridas (fecha_corrida);
+CREATE INDEX IF NOT EXISTS idx_registros_corrida ON registros (corrida_id);
+CREATE INDEX IF NOT EXISTS idx_registros_sap ON registros (sap, corrida_id);
+CREATE INDEX IF NOT EXISTS idx_registros_concepto ON registros (concepto, corrida_id);
+"""
+
+
+class Historial:
+    """
+    Historial de los archivos planos generados en una base SQLite local.
+    Cada corrida se guarda con una sola transacción y los registros apuntan
+    a su corrida por id, así los índices por SAP, concepto y corrida (y el
+    de fecha en corridas) usan claves enteras. Cada operación abre su
+    propia conexión, así que el objeto se puede usar desde varios hilos.
+    """
+
+    def __init__(self, ruta=RUTA_HISTORIAL):
+        self.ruta = ruta
+        with self._conectar() as conexion:
+            conexion.executescript(ESQUEMA)
+
+    def _conectar(self):
+        conexion = sqlite3.connect(self.ruta, timeout=30)
+        conexion.execute('PRAGMA journal_mode=WAL')
+        return conexion
+
+    def registrar(self, df, descripcion='', clave=None):
+        """
+        Guarda los registros del archivo plano como una corrida nueva.
+        Con clave (p. ej. hashes de los archivos y opciones), una corrida ya
+        registrada con la misma clave no se vuelve a guardar. Retorna el id
+        de la corrida, o None si ya existía o no hay registros.
+        """
+        if df is None or df.empty:
+            return None
+        fecha_corrida = datetime.now().isoformat(timespec='seconds')
+        sap = df['SAP'].astype('Int64').astype(object).where(df['SAP'].notna(), None)
+        fecha = df['FECHA'].dt.strftime('%Y-%m-%d').astype(object).where(df['FECHA'].notna(), None)
+        filas = zip(sap.tolist(), fecha.tolist(), df['CONCEPTO'].astype(str).tolist(), df['VALOR'].astype('int64').tolist())
+
+        conexion = self._conectar()
+        try:
+            with conexion:
+                try:
+                    cursor = conexion.execute(
+                        "INSERT INTO corridas (fecha_corrida, clave, descripcion, registros, total) VALUES (?, ?, ?, ?, ?)",
+                        (fecha_corrida, clave, descripcion, len(df), int(df['VALOR'].sum()))
+                    )
+                except sqlite3.IntegrityError:
+                    return None
+                corrida_id = cursor.lastrowid
+                while True:
+                    lote = [
+                        (corrida_id,) + fila
+                        for fila in itertools.islice(filas, TAMANO_LOTE)
+                    ]
+                    if not lote:
+                        break
+                    conexion.executemany(
+                        "INSERT INTO registros (corrida_id, sap, fecha, concepto, valor) VALUES (?, ?, ?, ?, ?)",
+                        lote
+                    )
+            return corrida_id
+        finally:
+            conexion.close()
+
+    def consultar(self, sap=None, conceptos=None, desde=None, hasta=None, limite=LIMITE_CONSULTA):
+        """
+        Registros guardados, filtrados por SAP, conceptos y rango de fecha de
+        corrida (fechas 'aaaa-mm-dd', ambas inclusive), del más reciente al
+        más antiguo.
+        """
+        condiciones = []
+        parametros = []
+        if sap is not None:
+            condiciones.append("r.sap = ?")
+            parametros.append(int(sap))
+        if conceptos:
+            condiciones.append(f"r.concepto IN ({', '.join('?' * len(conceptos))})")
+            parametros.extend(conceptos)
+        if desde is not None:
+            condiciones.append("c.fecha_corrida >= ?")
+            parametros.append(str(desde))
+        if hasta is not None:
+            # Inclusive: hasta el inicio del día siguiente
+            condiciones.append("c.fecha_corrida < ?")
+            parametros.append((pd.Timestamp(hasta) + pd.Timedelta(days=1)).date().isoformat())
+        consulta = (
+            "SELECT c.fecha_corrida, c.descripcion, r.sap AS SAP, r.fecha AS FECHA, "
+            "r.concepto AS CONCEPTO, r.valor AS VALOR "
+            "FROM registros r JOIN corridas c ON c.id = r.corrida_id"
+            + (" WHERE " + " AND ".join(condiciones) if condiciones else "")
+            + " ORDER BY r.corrida_id DESC LIMIT ?"
+        )
+        parametros.append(int(limite))
+        conexion = self._conectar()
+        try:
+            df = pd.read_sql_query(consulta, conexion, params=parametros)
+        finally:
+            conexion.close()
+        return df.assign(
+            SAP=df['SAP'].astype('Int64'),
+            FECHA=pd.to_datetime(df['FECHA']).astype('datetime64[us]'),
+            CONCEPTO=df['CONCEPTO'].astype(archivo_plano.TIPO_CONCEPTO)
+        )
+
+    def corridas(self):
+        """Corridas registradas, de la más reciente a la más antigua"""
+        conexion = self._conectar()
+        try:
+            return pd.read_sql_query(
+                "SELECT id, fecha_corrida, descripcion, registros, total FROM corridas ORDER BY id DESC",
+                conexion
+            )
+        finally:
+            conexion.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Consulta e importación del historial de archivos planos")
+    parser.add_argument('--ruta', default=RUTA_HISTORIAL, help="Base SQLite del historial")
+    parser.add_argument('--cargar', nargs='+', metavar='ARCHIVO',
+                        help="Importa archivos planos generados antes (xlsx, CSV, Parquet o Arrow)")
+    parser.add_argument('--sap', type=int, help="Número SAP del empleado")
+    parser.add_argument('--concepto', nargs='+', help="Conceptos (Z498, Z609, Y602, Y608)")
+    parser.add_argument('--desde', help="Fecha de corrida inicial (aaaa-mm-dd)")
+    parser.add_argument('--hasta', help="Fecha de corrida final (aaaa-mm-dd)")
+    parser.add_argument('--limite', type=int, default=LIMITE_CONSULTA, help="Máximo de filas")
+    parser.add_argument('--salida', help="Guarda el resultado de la consulta en CSV")
+    args = parser.parse_args()
+
+    historial = Historial(args.ruta)
+    if args.cargar:
+        for ruta in args.cargar:
+            corrida = historial.registrar(
+                archivo_plano.leer_resultado(ruta), os.path.basename(ruta), clave=os.path.abspath(ruta)
+            )
+            print(f"{os.path.basename(ruta)}: " + ("ya estaba en el historial" if corrida is None else f"corrida {corrida}"))
+        return
+
+    df = historial.consultar(args.sap, args.concepto, args.desde, args.hasta, args.limite)
+    print(df.to_string(index=False) if not df.empty else "Sin registros")
+    if not df.empty:
+        print(f"\n{len(df):,} registros · total {int(df['VALOR'].sum()):,}")
+    if args.salida:
+        df.to_csv(args.salida, index=False, sep=';', encoding='utf-8-sig', date_format=archivo_plano.FORMATO_FECHA_SAP)
+        print(f"Consulta guardada en {args.salida}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+import contextlib
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+import pandas as pd
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+MB = 1024 * 1024
+
+
+def memoria_actual_mb():
+    """Memoria residente del proceso en MB (None si no se puede medir)"""
+    if psutil is not None:
+        return psutil.Process().memory_info().rss / MB
+    try:
+        with open('/proc/self/statm') as archivo:
+            paginas = int(archivo.read().split()[1])
+        return paginas * os.sysconf('SC_PAGE_SIZE') / MB
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+class Instrumentacion:
+    """
+    Mediciones por etapa del procesamiento: tiempo, filas de entrada/salida
+    y variación de memoria. Las etapas anidadas quedan con nivel > 0; el
+    progreso se calcula con las etapas de nivel 0 terminadas sobre las previstas.
+    Una etapa de nivel 0 cuenta como una etapa prevista entera, salvo que
+    fije medicion['avance'] con la fracción que completa (p. ej. cada bloque
+    del modo streaming). Se puede medir desde varios hilos a la vez: el
+    nivel se lleva por hilo.
+    """
+
+    def __init__(self, etapas_previstas=0, al_avanzar=None):
+        self.etapas_previstas = etapas_previstas
+        self.al_avanzar = al_avanzar
+        self.etapas = []
+        self.inicio = time.perf_counter()
+        self.fin = None
+        self.fecha = datetime.now().isoformat(timespec='seconds')
+        self._local = threading.local()
+        self._candado = threading.Lock()
+        self._terminadas = 0.0
+
+    @property
+    def _nivel(self):
+        return getattr(self._local, 'nivel', 0)
+
+    @_nivel.setter
+    def _nivel(self, valor):
+        self._local.nivel = valor
+
+    @contextlib.contextmanager
+    def etapa(self, nombre, concepto=None, filas_entrada=None):
+        """Mide el bloque; se pueden fijar medicion['filas_salida'] y medicion['avance'] dentro del with"""
+        medicion = {
+            'etapa': nombre,
+            'concepto': concepto,
+            'nivel': self._nivel,
+            'filas_entrada': filas_entrada,
+            'filas_salida': None
+        }
+        if self._nivel == 0:
+            self._avisar(f"{nombre} {concepto or ''}".strip())
+        memoria_inicial = memoria_actual_mb()
+        self._nivel += 1
+        marca = time.perf_counter()
+        try:
+            yield medicion
+        finally:
+            medicion['segundos'] = time.perf_counter() - marca
+            avance = medicion.pop('avance', 1)
+            self._nivel -= 1
+            memoria_final = memoria_actual_mb()
+            medicion['memoria_delta_mb'] = (
+                None if memoria_inicial is None or memoria_final is None
+                else memoria_final - memoria_inicial
+            )
+            with self._candado:
+                self.etapas.append(medicion)
+                if self._nivel == 0:
+                    self._terminadas += avance
+
+    def progreso(self):
+        """Fracción completada (0 a 1) según las etapas previstas"""
+        if not self.etapas_previstas:
+            return 0.0
+        return min(1.0, self._terminadas / self.etapas_previstas)
+
+    def _avisar(self, texto):
+        if self.al_avanzar is not None:
+            self.al_avanzar(self.progreso(), texto)
+
+    def terminar(self):
+        """Fija el tiempo total (p. ej. al terminar un trabajo que se muestra después)"""
+        self.fin = time.perf_counter()
+
+    def total_segundos(self):
+        return (self.fin or time.perf_counter()) - self.inicio
+
+    def resumen(self):
+        """DataFrame con una fila por etapa, en orden de término"""
+        columnas = ['etapa', 'concepto', 'nivel', 'segundos', 'filas_entrada', 'filas_salida', 'memoria_delta_mb']
+        return pd.DataFrame(self.etapas, columns=columnas)
+
+    def a_json(self):
+        """Mediciones en JSON para el monitoreo"""
+        return json.dumps({
+            'fecha': self.fecha,
+            'total_segundos': self.total_segundos(),
+            'etapas': self.etapas
+        }, indent=2, ensure_ascii=False, default=str)
+
+
+def etapa(instrumentacion, nombre, concepto=None, filas_entrada=None):
+    """Etapa medida si hay instrumentación; si no, un contexto vacío"""
+    if instrumentacion is None:
+        return contextlib.nullcontext({})
+    return instrumentacion.etapa(nombre, concepto, filas_entrada)
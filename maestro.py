@@ -0,0 +1,177 @@
+import argparse
+import io
+import json
+import os
+import threading
+from datetime import datetime
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+import archivo_plano
+import encabezados
+
+# Directorio local donde se guarda el maestro de empleados ya indexado
+DIRECTORIO_MAESTRO = os.environ.get('NOMINA_MAESTRO', 'maestro_empleados')
+
+# Columnas del maestro (los alias aceptados están en encabezados.ALIAS)
+COLUMNAS_MAESTRO = ['SAP', 'NOMBRE', 'CENTRO_COSTO', 'FECHA_RETIRO']
+COLUMNAS_ENRIQUECIMIENTO = ['NOMBRE', 'CENTRO_COSTO']
+
+
+def leer_archivo_maestro(origen):
+    """
+    Lee el maestro (CSV, xlsx o Parquet; ruta, bytes o archivo en memoria)
+    y lo deja con las columnas SAP (Int64), NOMBRE, CENTRO_COSTO y, si
+    viene, FECHA_RETIRO. El formato se detecta por el contenido.
+    """
+    origen = archivo_plano.preparar_origen(origen)
+    if hasattr(origen, 'read'):
+        firma = origen.read(4)
+        origen.seek(0)
+    else:
+        with open(origen, 'rb') as archivo:
+            firma = archivo.read(4)
+
+    if firma == b'PAR1':
+        df = pq.read_table(origen).to_pandas()
+    elif firma == b'PK\x03\x04':
+        df = pd.read_excel(origen)
+    else:
+        contenido = origen.read() if hasattr(origen, 'read') else open(origen, 'rb').read()
+        primera_linea = contenido.split(b'\n', 1)[0]
+        sep = ';' if primera_linea.count(b';') >= primera_linea.count(b',') else ','
+        df = pd.read_csv(io.BytesIO(contenido), sep=sep, encoding='utf-8-sig', dtype=str)
+
+    mapeo = encabezados.resolver(df.columns, COLUMNAS_MAESTRO)
+    df = df[list(mapeo.values())].rename(columns={original: columna for columna, original in mapeo.items()})
+    if 'SAP' not in df.columns:
+        raise ValueError("El maestro no tiene una columna de número SAP")
+
+    maestro = pd.DataFrame({'SAP': archivo_plano.normalizar_sap(df['SAP'])})
+    for columna in COLUMNAS_ENRIQUECIMIENTO:
+        maestro[columna] = df[columna].astype('string').str.strip() if columna in df.columns else pd.NA
+    if 'FECHA_RETIRO' in df.columns:
+        maestro['FECHA_RETIRO'] = archivo_plano.convertir_fechas(df['FECHA_RETIRO'])
+    return maestro
+
+
+class MaestroEmpleados:
+    """
+    Maestro de empleados indexado por SAP y guardado en disco como Parquet
+    (SAP ordenado, centro de costo como diccionario). Las búsquedas usan la
+    tabla hash del índice: una sola pasada por serie de SAP consultada.
+    """
+
+    def __init__(self, directorio=DIRECTORIO_MAESTRO):
+        self.directorio = directorio
+        self.ruta_tabla = os.path.join(directorio, 'maestro.parquet')
+        self.ruta_info = os.path.join(directorio, 'info.json')
+        self.tabla = None
+        self.info = {}
+        if os.path.exists(self.ruta_tabla):
+            self.tabla = pq.read_table(self.ruta_tabla).to_pandas().set_index('SAP')
+            if 'FECHA_RETIRO' in self.tabla.columns:
+                self.tabla['FECHA_RETIRO'] = pd.to_datetime(self.tabla['FECHA_RETIRO'])
+        if os.path.exists(self.ruta_info):
+            with open(self.ruta_info, encoding='utf-8') as archivo:
+                self.info = json.load(archivo)
+
+    def __len__(self):
+        return 0 if self.tabla is None else len(self.tabla)
+
+    @property
+    def version(self):
+        """Cambia cada vez que se carga un maestro nuevo (para las claves de caché)"""
+        return self.info.get('version', 0)
+
+    @property
+    def tiene_retiro(self):
+        return self.tabla is not None and 'FECHA_RETIRO' in self.tabla.columns
+
+    def cargar(self, origen, nombre_archivo=None):
+        """Lee el archivo maestro, lo indexa y lo guarda en disco reemplazando el anterior"""
+        df = leer_archivo_maestro(origen)
+        sin_sap = int(df['SAP'].isna().sum())
+        df = df.dropna(subset=['SAP']).drop_duplicates('SAP', keep='last').sort_values('SAP')
+        df['CENTRO_COSTO'] = df['CENTRO_COSTO'].astype('category')
+
+        os.makedirs(self.directorio, exist_ok=True)
+        tabla = pa.Table.from_pandas(df, preserve_index=False)
+        pq.write_table(tabla, self.ruta_tabla + '.tmp', compression='zstd')
+        os.replace(self.ruta_tabla + '.tmp', self.ruta_tabla)
+
+        self.tabla = df.set_index('SAP')
+        self.info = {
+            'version': self.version + 1,
+            'archivo': nombre_archivo or (origen if isinstance(origen, str) else None),
+            'fecha': datetime.now().isoformat(timespec='seconds'),
+            'empleados': len(df),
+            'filas_sin_sap': sin_sap
+        }
+        with open(self.ruta_info + '.tmp', 'w', encoding='utf-8') as archivo:
+            json.dump(self.info, archivo, indent=2, ensure_ascii=False)
+        os.replace(self.ruta_info + '.tmp', self.ruta_info)
+        return self.info
+
+    def posiciones(self, sap):
+        """Posición de cada SAP en el maestro (-1 si no existe), con una búsqueda hash"""
+        if self.tabla is None:
+            raise ValueError("No hay maestro de empleados cargado")
+        return self.tabla.index.get_indexer(sap.astype('Int64'))
+
+    def buscar(self, sap):
+        """Datos del maestro alineados con la serie de SAP (nulos si no existe)"""
+        posiciones = self.posiciones(sap)
+        datos = self.tabla.iloc[posiciones.clip(min=0)].reset_index(drop=True)
+        datos.index = sap.index
+        datos = datos.mask(pd.Series(posiciones < 0, index=sap.index), axis=0)
+        datos.insert(0, 'EXISTE', posiciones >= 0)
+        return datos
+
+    def enriquecer(self, df):
+        """Agrega NOMBRE y CENTRO_COSTO a los registros del archivo plano"""
+        datos = self.buscar(df['SAP'])
+        return df.assign(**{columna: datos[columna] for columna in COLUMNAS_ENRIQUECIMIENTO})
+
+
+_maestros = {}
+_candado = threading.Lock()
+
+
+def _modificacion_info(directorio):
+    """Fecha de modificación de info.json (se escribe al final de cada carga); None si no hay maestro"""
+    try:
+        return os.stat(os.path.join(directorio, 'info.json')).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def obtener(directorio=DIRECTORIO_MAESTRO):
+    """
+    Maestro guardado en el directorio. Se lee del disco una vez y se vuelve
+    a leer cuando cambia info.json, p. ej. si otro proceso o la línea de
+    comandos cargó un maestro nuevo.
+    """
+    modificacion = _modificacion_info(directorio)
+    with _candado:
+        guardado = _maestros.get(directorio)
+        if guardado is None or guardado[0] != modificacion:
+            guardado = (modificacion, MaestroEmpleados(directorio))
+            _maestros[directorio] = guardado
+        return guardado[1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Carga el maestro de empleados (CSV, xlsx o Parquet)")
+    parser.add_argument('archivo', help="Archivo maestro con SAP, nombre, centro de costo y fecha de retiro")
+    parser.add_argument('--directorio', default=DIRECTORIO_MAESTRO, help="Dónde guardar el maestro indexado")
+    args = parser.parse_args()
+
+    info = MaestroEmpleados(args.directorio).cargar(args.archivo, os.path.basename(args.archivo))
+    print(f"Maestro cargado: {info['empleados']:,} empleados ({info['filas_sin_sap']:,} filas sin SAP omitidas)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+import contextlib
+import json
+import os
+import tempfile
+import threading
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+import archivo_plano
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Directorio local donde se guarda el manifiesto de registros emitidos
+DIRECTORIO_MANIFIESTO = os.environ.get('NOMINA_MANIFIESTO', 'manifiesto_nomina')
+
+COLUMNAS_REGISTRO = ['SAP', 'FECHA', 'CONCEPTO']
+COLUMNAS_CLAVE = COLUMNAS_REGISTRO + ['VALOR']
+# Cómo se calculan las claves guardadas; un manifiesto de otro formato no se puede comparar
+FORMATO_CLAVES = 2
+
+# Entre hilos del mismo proceso; entre procesos se usa además flock sobre el archivo de bloqueo
+_candado = threading.Lock()
+
+
+def hash_registros(df, columnas):
+    """
+    Hash de 64 bits por fila sobre las columnas indicadas, calculado sobre
+    los valores con los tipos del resultado (SAP Int64, FECHA en segundos,
+    CONCEPTO como texto, VALOR int64): la clave no depende de la unidad de
+    la fecha ni de las categorías con que se armó cada DataFrame.
+    """
+    if df is None or df.empty:
+        return np.empty(0, dtype=np.uint64)
+    canonico = {
+        'SAP': lambda serie: serie.astype('Int64'),
+        'FECHA': lambda serie: serie.astype('datetime64[s]'),
+        'CONCEPTO': lambda serie: serie.astype(str),
+        'VALOR': lambda serie: serie.astype('int64')
+    }
+    tabla = pd.DataFrame({columna: canonico[columna](df[columna]) for columna in columnas})
+    return pd.util.hash_pandas_object(tabla, index=False).to_numpy(dtype=np.uint64)
+
+
+def claves_consolidadas(df):
+    """
+    Claves de los registros sumados por SAP, FECHA y CONCEPTO (ver
+    archivo_plano.consolidar), así una corrida consolidada y una sin
+    consolidar de los mismos datos guardan y buscan las mismas claves.
+    Retorna (claves, claves_registro, grupos): hashes por registro
+    consolidado y el registro consolidado de cada fila de df.
+    """
+    consolidado, mapa = archivo_plano.consolidar(df)
+    return (
+        hash_registros(consolidado, COLUMNAS_CLAVE),
+        hash_registros(consolidado, COLUMNAS_REGISTRO),
+        mapa['registro'].to_numpy()
+    )
+
+
+def _contiene(ordenado, claves):
+    """Búsqueda vectorizada de claves en un arreglo ordenado"""
+    if len(ordenado) == 0 or len(claves) == 0:
+        return np.zeros(len(claves), dtype=bool)
+    posiciones = np.searchsorted(ordenado, claves)
+    posiciones[posiciones == len(ordenado)] = 0
+    return ordenado[posiciones] == claves
+
+
+class Manifiesto:
+    """
+    Registro local de lo ya emitido al archivo plano: hashes de las claves
+    (SAP, FECHA, CONCEPTO, VALOR sumado, ver claves_consolidadas) en
+    arreglos ordenados de uint64 y hashes de los archivos fuente ya
+    procesados. Las escrituras toman un bloqueo
+    exclusivo, vuelven a leer el disco y combinan, así dos trabajos que
+    registran a la vez no se pisan.
+    """
+
+    def __init__(self, directorio=DIRECTORIO_MANIFIESTO):
+        self.directorio = directorio
+        self.ruta_claves = os.path.join(directorio, 'claves.npy')
+        self.ruta_registros = os.path.join(directorio, 'registros.npy')
+        self.ruta_archivos = os.path.join(directorio, 'archivos.json')
+        self.ruta_bloqueo = os.path.join(directorio, '.bloqueo')
+        self._leer()
+
+    def _leer(self):
+        """Carga el estado guardado en disco"""
+        self.claves = self._cargar_arreglo(self.ruta_claves)
+        self.registros = self._cargar_arreglo(self.ruta_registros)
+        self.archivos = {}
+        self.version = 0
+        self.formato = FORMATO_CLAVES
+        if os.path.exists(self.ruta_archivos):
+            with open(self.ruta_archivos, encoding='utf-8') as archivo:
+                datos = json.load(archivo)
+            self.archivos = datos.get('archivos', {})
+            self.version = datos.get('version', 0)
+            self.formato = datos.get('formato', 1)
+
+    def _comprobar_formato(self):
+        """Las claves de otro formato no coinciden con las actuales: se volvería a emitir todo"""
+        if self.formato != FORMATO_CLAVES and (len(self.claves) or len(self.registros)):
+            raise ValueError(
+                f"El manifiesto de {self.directorio} tiene claves de otro formato ({self.formato}); "
+                "hay que reiniciarlo antes de usar el modo incremental"
+            )
+
+    @contextlib.contextmanager
+    def _bloqueo(self):
+        """Bloqueo exclusivo del manifiesto entre hilos y procesos"""
+        os.makedirs(self.directorio, exist_ok=True)
+        with _candado, open(self.ruta_bloqueo, 'a') as archivo:
+            if fcntl is not None:
+                fcntl.flock(archivo, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(archivo, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _cargar_arreglo(ruta):
+        if os.path.exists(ruta):
+            return np.load(ruta)
+        return np.empty(0, dtype=np.uint64)
+
+    def __len__(self):
+        return len(self.claves)
+
+    def archivo_procesado(self, hash_archivo):
+        """True si el archivo (por hash de contenido) ya fue procesado"""
+        return hash_archivo in self.archivos
+
+    def filtrar_nuevos(self, df):
+        """
+        Deja solo los registros no emitidos antes. Retorna (df_nuevos, resumen);
+        'modificados' son los que ya existían para el mismo SAP/FECHA/CONCEPTO
+        con otro VALOR. Las filas con la misma clave se comparan por su suma,
+        como en el modo consolidado, y se omiten o se emiten todas juntas.
+        """
+        if df is None or df.empty:
+            return df, {'nuevos': 0, 'modificados': 0, 'omitidos': 0}
+        self._comprobar_formato()
+
+        claves, claves_registro, grupos = claves_consolidadas(df)
+        emitido = _contiene(self.claves, claves)
+        modificado = ~emitido & _contiene(self.registros, claves_registro)
+        ya_emitidos = emitido[grupos]
+        df_nuevos = df[~ya_emitidos].reset_index(drop=True)
+        modificados = int(modificado[grupos].sum())
+        return df_nuevos, {
+            'nuevos': len(df_nuevos) - modificados,
+            'modificados': modificados,
+            'omitidos': int(ya_emitidos.sum())
+        }
+
+    def registrar(self, df, hashes_archivos):
+        """
+        Agrega los registros emitidos y los archivos fuente a lo que hay en
+        disco (incluido lo registrado por otros trabajos) y guarda
+        """
+        with self._bloqueo():
+            self._leer()
+            self._registrar(df, hashes_archivos)
+
+    def _registrar(self, df, hashes_archivos):
+        self._comprobar_formato()
+        if df is not None and not df.empty:
+            claves, claves_registro, _ = claves_consolidadas(df)
+            self.claves = np.union1d(self.claves, claves)
+            self.registros = np.union1d(self.registros, claves_registro)
+        self.formato = FORMATO_CLAVES
+        fecha = datetime.now().isoformat(timespec='seconds')
+        for hash_archivo in hashes_archivos:
+            if hash_archivo is not None:
+                self.archivos.setdefault(hash_archivo, fecha)
+        self.version += 1
+        self._guardar()
+
+    def guardar(self):
+        """Guarda el estado en memoria con el bloqueo tomado"""
+        with self._bloqueo():
+            self._guardar()
+
+    def _temporal(self):
+        """Archivo temporal propio en el directorio del manifiesto (mismo sistema de archivos)"""
+        descriptor, ruta = tempfile.mkstemp(dir=self.directorio, suffix='.tmp')
+        os.close(descriptor)
+        # mkstemp crea el archivo solo para el dueño; el manifiesto conserva los permisos habituales
+        os.chmod(ruta, 0o644)
+        return ruta
+
+    def _guardar(self):
+        """Escritura atómica: cada archivo se escribe en un temporal único y luego se reemplaza"""
+        os.makedirs(self.directorio, exist_ok=True)
+        for ruta, arreglo in [(self.ruta_claves, self.claves), (self.ruta_registros, self.registros)]:
+            temporal = self._temporal()
+            with open(temporal, 'wb') as archivo:
+                np.save(archivo, arreglo)
+            os.replace(temporal, ruta)
+        temporal = self._temporal()
+        with open(temporal, 'w', encoding='utf-8') as archivo:
+            json.dump({'version': self.version, 'formato': self.formato, 'archivos': self.archivos}, archivo, indent=2)
+        os.replace(temporal, self.ruta_archivos)
+
+    def reiniciar(self):
+        """Olvida todo lo emitido"""
+        with self._bloqueo():
+            self._leer()
+            self.claves = np.empty(0, dtype=np.uint64)
+            self.registros = np.empty(0, dtype=np.uint64)
+            self.archivos = {}
+            self.formato = FORMATO_CLAVES
+            self.version += 1
+            self._guardar()
@@ -0,0 +1,216 @@
+import pandas as pd
+
+import archivo_plano
+import historial
+import instrumentacion
+import manifiesto
+import salida
+import validacion
+
+
+def calcular_procesamiento(trabajo, archivo_caja, archivo_big_pass, claves, formato_salida, modo_streaming, modo_incremental, cache,
+                           maestro_empleados=None, modo_enriquecer=False, modo_consolidar=False, modo_historial=False,
+                           filas_por_parte=0, parte_por_concepto=False, codificar_salida=True):
+    """
+    Procesamiento completo dentro del trabajo: lectura, reglas, filtro
+    incremental y codificación. No usa Streamlit; retorna lo necesario
+    para mostrar el resultado. Con maestro_empleados se validan los SAP
+    contra el maestro y, con modo_enriquecer, se agregan nombre y centro
+    de costo a cada registro. Con modo_consolidar se suma VALOR por SAP,
+    FECHA y CONCEPTO antes del filtro incremental; el filtro no registra
+    nada en el manifiesto (eso se hace al confirmar el envío, en
+    app.marcar_enviado o en el servicio HTTP, así una corrida se puede
+    volver a emitir). Con modo_historial los
+    registros emitidos se guardan en el historial local. Con filas_por_parte
+    se revisa además la división en partes; el ZIP se arma al descargarlo
+    (ver empaquetar_partes). Con
+    codificar_salida=False no se arman los bytes del archivo plano: quien
+    llama lo codifica por bloques al enviarlo (p. ej. el servicio HTTP).
+    """
+    resultado = {
+        'df_resultado': None,
+        'estadisticas': None,
+        'datos_salida': None,
+        'formato_salida': formato_salida,
+        'resumen_incremental': None,
+        'archivos_incremental': None,
+        'archivos_omitidos': False,
+        'medicion': None,
+        'validacion': None,
+        'consolidacion': None,
+        'encabezados': {},
+        'corrida_historial': None,
+        'partes': None
+    }
+
+    if modo_incremental:
+        # Un archivo ya procesado con el mismo contenido no se vuelve a leer
+        registro_emitidos = manifiesto.Manifiesto()
+        if registro_emitidos.archivo_procesado(claves[0]):
+            archivo_caja = None
+        if registro_emitidos.archivo_procesado(claves[1]):
+            archivo_big_pass = None
+        claves = tuple(None if archivo is None else clave for archivo, clave in zip((archivo_caja, archivo_big_pass), claves))
+        resultado['archivos_omitidos'] = None in claves
+
+    # Etapas previstas: lectura y reglas de cada archivo (en streaming, una sola
+    # etapa por archivo que avanza con las filas leídas), la codificación y las opcionales
+    etapas_lectura = 0
+    if archivo_caja is not None:
+        etapas_lectura += 1 if modo_streaming else 1 + len(archivo_plano.CONCEPTOS_CAJA)
+    if archivo_big_pass is not None:
+        etapas_lectura += 1 if modo_streaming else 1 + len(archivo_plano.CONCEPTOS_BIG_PASS)
+    etapas_salida = int(codificar_salida) + sum([
+        modo_consolidar, modo_historial, modo_enriquecer and maestro_empleados is not None, bool(filas_por_parte)
+    ])
+    medicion = instrumentacion.Instrumentacion(etapas_lectura + etapas_salida, trabajo.avanzar)
+    resultado['medicion'] = medicion
+
+    # Resultado en caché por contenido de ambos archivos (y versión del maestro, que cambia la validación)
+    version_maestro = None if maestro_empleados is None else maestro_empleados.version
+    clave_resultado = ('resultado',) + claves + (modo_streaming, version_maestro)
+    en_cache = cache.obtener(clave_resultado)
+
+    if en_cache is not None:
+        df_resultado, estadisticas, resultado['validacion'], resultado['encabezados'] = en_cache
+        medicion.etapas_previstas = etapas_salida
+    else:
+        # Sin filtro incremental ni columnas del maestro la salida se codifica mientras se calculan los conceptos
+        # El modo streaming descarta filas al leer, así que no se valida
+        reporte = None if modo_streaming else validacion.ReporteValidacion(maestro_empleados)
+        df_resultado, estadisticas, datos_salida = procesar_con_archivo_plano(
+            archivo_caja, archivo_big_pass, modo_streaming, claves, medicion, cache,
+            None if modo_incremental or modo_enriquecer or modo_consolidar or not codificar_salida else formato_salida,
+            reporte,
+            resultado['encabezados']
+        )
+        if reporte is not None:
+            resultado['validacion'] = reporte.detalle()
+        cache.guardar(clave_resultado, (df_resultado, estadisticas, resultado['validacion'], resultado['encabezados']))
+        if datos_salida is not None:
+            resultado['datos_salida'] = cache.guardar(('salida',) + clave_resultado[1:] + (formato_salida,), datos_salida)
+
+    if modo_consolidar and df_resultado is not None:
+        registros_originales = len(df_resultado)
+        with medicion.etapa('consolidacion', None, registros_originales) as etapa_consolidacion:
+            df_resultado, mapa = cache.obtener_o_calcular(
+                clave_resultado + ('consolidado',), lambda: archivo_plano.consolidar(df_resultado)
+            )
+            etapa_consolidacion['filas_salida'] = len(df_resultado)
+        estadisticas = archivo_plano.calcular_estadisticas(df_resultado)
+        resultado['consolidacion'] = {
+            'originales': registros_originales,
+            'consolidados': len(df_resultado),
+            'mapa': mapa
+        }
+        clave_resultado = clave_resultado + ('consolidado',)
+
+    if modo_incremental:
+        df_resultado, resultado['resumen_incremental'] = registro_emitidos.filtrar_nuevos(df_resultado)
+        estadisticas = archivo_plano.calcular_estadisticas(df_resultado)
+        # El manifiesto no se toca aquí: se registra al marcar el archivo como enviado
+        resultado['archivos_incremental'] = claves
+        # El resultado filtrado depende del estado del manifiesto
+        clave_resultado = clave_resultado + ('incremental', registro_emitidos.version)
+
+    if modo_historial and df_resultado is not None and not df_resultado.empty:
+        # Una corrida idéntica (mismos archivos y opciones) no se registra dos veces
+        with medicion.etapa('historial', None, len(df_resultado)):
+            resultado['corrida_historial'] = historial.Historial().registrar(
+                df_resultado, trabajo.descripcion, clave='|'.join(map(str, clave_resultado))
+            )
+
+    if modo_enriquecer and maestro_empleados is not None and df_resultado is not None:
+        # Un solo cruce por SAP con el índice del maestro
+        with medicion.etapa('maestro', 'enriquecer', len(df_resultado)):
+            df_resultado = maestro_empleados.enriquecer(df_resultado)
+        clave_resultado = clave_resultado + ('enriquecido',)
+
+    resultado['df_resultado'] = df_resultado
+    resultado['estadisticas'] = estadisticas
+
+    if codificar_salida and resultado['datos_salida'] is None and df_resultado is not None and not df_resultado.empty:
+        # Bytes codificados en caché por resultado y formato
+        with medicion.etapa('codificacion', formato_salida, len(df_resultado)) as etapa_codificacion:
+            resultado['datos_salida'] = cache.obtener_o_calcular(
+                ('salida',) + clave_resultado[1:] + (formato_salida,),
+                lambda: salida.codificar(archivo_plano.para_exportar(df_resultado), formato_salida)
+            )
+            etapa_codificacion['filas_salida'] = len(df_resultado)
+
+    if filas_por_parte and df_resultado is not None and not df_resultado.empty:
+        with medicion.etapa('partes', formato_salida, len(df_resultado)):
+            resultado['partes'] = dividir_partes(df_resultado, filas_por_parte, parte_por_concepto)
+
+    medicion.terminar()
+    return resultado
+
+
+def dividir_partes(df_resultado, filas_por_parte, parte_por_concepto):
+    """
+    Revisa la división en partes sin codificarlas. Retorna {'cantidad',
+    'error', 'filas_por_parte', 'parte_por_concepto'}; error si un empleado
+    no cabe en una parte.
+    """
+    partes = {'cantidad': 0, 'error': None, 'filas_por_parte': filas_por_parte, 'parte_por_concepto': parte_por_concepto}
+    try:
+        partes['cantidad'] = sum(1 for _ in salida.partes(df_resultado, filas_por_parte, parte_por_concepto))
+    except ValueError as e:
+        partes['error'] = str(e)
+    return partes
+
+
+def empaquetar_partes(df_resultado, formato_salida, filas_por_parte, parte_por_concepto):
+    """
+    ZIP con la salida dividida en partes, entregado por bloques a medida
+    que se codifica cada parte (ver salida.bloques_zip). No se guarda en
+    caché: se vuelve a generar en cada descarga.
+    """
+    return salida.bloques_zip(
+        salida.partes(archivo_plano.para_exportar(df_resultado), filas_por_parte, parte_por_concepto),
+        formato_salida, 'nomina_2025'
+    )
+
+
+def leer_con_cache(archivo, clave, fuente, lector, medicion=None, cache=None):
+    """DataFrame parseado del archivo (None si se omite), desde el caché si hay clave"""
+    if archivo is None:
+        return None
+    with instrumentacion.etapa(medicion, 'lectura', fuente) as etapa_lectura:
+        if clave is None or cache is None:
+            df = lector(archivo)
+        else:
+            df = cache.obtener_o_calcular((fuente, clave), lambda: lector(archivo))
+        etapa_lectura['filas_salida'] = len(df)
+    return df
+
+
+def procesar_con_archivo_plano(archivo_caja, archivo_big_pass, streaming=False, claves=None, medicion=None, cache=None, formato_salida=None, reporte=None,
+                               mapeo_encabezados=None):
+    """
+    Función de procesamiento - operaciones por columna sobre archivo_plano.
+    Acepta rutas, bytes/memoryview o archivos en memoria como los subidos.
+    Con claves (hash CAJA, hash BIG PASS) y cache, los DataFrames parseados
+    se toman del caché. Fuera del modo streaming ambos archivos se leen a la
+    vez y, con formato_salida, la salida se codifica mientras se calcula;
+    con reporte (ReporteValidacion) se registran las incidencias y en
+    mapeo_encabezados (dict) los encabezados reconocidos de cada archivo y hoja.
+    Retorna (df, estadisticas, datos_salida); los errores se propagan al
+    trabajo que la ejecuta.
+    """
+    if streaming:
+        estadisticas = archivo_plano.estadisticas_vacias()
+        bloques = list(archivo_plano.generar_archivo_plano_streaming(
+            archivo_caja, archivo_big_pass, estadisticas, instrumentacion=medicion,
+            mapeo_encabezados=mapeo_encabezados
+        ))
+        if not bloques:
+            return None, estadisticas, None
+        return archivo_plano.ordenar_por_concepto(pd.concat(bloques, ignore_index=True)), estadisticas, None
+
+    claves_fuente = dict(zip(['caja', 'big_pass'], claves or (None, None)))
+    return archivo_plano.generar_archivo_plano_concurrente(
+        archivo_caja, archivo_big_pass, formato_salida, medicion,
+        leer_con=lambda fuente, archivo, lector: leer_con_cache(archivo, claves_fuente[fuente], fuente, lector, cache=cache),
+        reporte=reporte, mapeo_encabezados=mapeo_encabezados
+    )
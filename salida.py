@@ -0,0 +1,320 @@
+import codecs
+import itertools
+import os
+import tempfile
+import zipfile
+
+import numpy as np
+import openpyxl
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Border, Font, Side
+
+# Filas por bloque al codificar
+TAMANO_BLOQUE_SALIDA = 50_000
+# Bytes por bloque al entregar el xlsx ya comprimido
+TAMANO_LECTURA_XLSX = 1024 * 1024
+# El xlsx se arma en memoria hasta este tamaño y luego pasa a disco
+MAX_MEMORIA_XLSX = 32 * 1024 * 1024
+# Compresión de las columnas en Parquet
+COMPRESION_PARQUET = 'zstd'
+# Las fechas del resultado se guardan como fecha y se formatean al escribir
+FORMATO_FECHA_SAP = '%d.%m.%Y'
+
+
+def formatear_bloque(bloque, formato_fecha=FORMATO_FECHA_SAP):
+    """Bloque listo para escribir: las columnas de fecha pasan a texto ('' si no hay fecha)"""
+    columnas_fecha = [
+        columna for columna in bloque.columns
+        if pd.api.types.is_datetime64_any_dtype(bloque[columna])
+    ]
+    if not columnas_fecha:
+        return bloque
+    return bloque.assign(**{
+        columna: bloque[columna].dt.strftime(formato_fecha).fillna('')
+        for columna in columnas_fecha
+    })
+
+
+def partir(datos, tamano_bloque=TAMANO_BLOQUE_SALIDA):
+    """
+    Bloques de a lo sumo tamano_bloque filas. datos puede ser un DataFrame o
+    un iterable de DataFrames con las mismas columnas (p. ej. los registros
+    de cada concepto a medida que se calculan). Un DataFrame vacío se
+    entrega tal cual para conservar su encabezado.
+    """
+    for df in ([datos] if isinstance(datos, pd.DataFrame) else datos):
+        if df.empty:
+            yield df
+        for inicio in range(0, len(df), tamano_bloque):
+            yield df.iloc[inicio:inicio + tamano_bloque]
+
+
+def bloques_csv(datos, tamano_bloque=TAMANO_BLOQUE_SALIDA, sep=';', formato_fecha=FORMATO_FECHA_SAP):
+    """
+    Codifica el DataFrame (o los bloques de DataFrames) a CSV utf-8 con BOM.
+    El resultado concatenado es idéntico a df.to_csv(encoding='utf-8-sig').
+    """
+    yield codecs.BOM_UTF8
+    for i, bloque in enumerate(partir(datos, tamano_bloque)):
+        bloque = formatear_bloque(bloque, formato_fecha)
+        yield bloque.to_csv(index=False, header=i == 0, sep=sep).encode('utf-8')
+
+
+def _celdas_encabezado(hoja, columnas):
+    """Encabezado con el mismo estilo que usa pandas en to_excel"""
+    borde = Side(style='thin')
+    celdas = []
+    for columna in columnas:
+        celda = WriteOnlyCell(hoja, value=str(columna))
+        celda.font = Font(bold=True)
+        celda.border = Border(left=borde, right=borde, top=borde, bottom=borde)
+        celda.alignment = Alignment(horizontal='center', vertical='top')
+        celdas.append(celda)
+    return celdas
+
+
+def bloques_xlsx(datos, tamano_bloque=TAMANO_BLOQUE_SALIDA, nombre_hoja='Sheet1', formato_fecha=FORMATO_FECHA_SAP):
+    """
+    Codifica el DataFrame (o los bloques de DataFrames) a xlsx con un libro
+    de solo escritura (las filas no se guardan como celdas en memoria) y
+    entrega el archivo por bloques.
+    """
+    libro = openpyxl.Workbook(write_only=True)
+    hoja = libro.create_sheet(nombre_hoja)
+    bloques = partir(datos, tamano_bloque)
+    primero = next(bloques, None)
+    if primero is not None:
+        hoja.append(_celdas_encabezado(hoja, primero.columns))
+        bloques = itertools.chain([primero], bloques)
+
+    for bloque in bloques:
+        bloque = formatear_bloque(bloque, formato_fecha).astype(object)
+        bloque = bloque.where(bloque.notna(), None)
+        for fila in bloque.itertuples(index=False, name=None):
+            hoja.append(fila)
+
+    with tempfile.SpooledTemporaryFile(max_size=MAX_MEMORIA_XLSX) as destino:
+        libro.save(destino)
+        yield from _entregar(destino)
+
+
+def _entregar(destino):
+    """Entrega por bloques un archivo temporal ya escrito"""
+    destino.seek(0)
+    while True:
+        datos = destino.read(TAMANO_LECTURA_XLSX)
+        if not datos:
+            break
+        yield datos
+
+
+def tabla_arrow(bloque):
+    """
+    Tabla Arrow con los tipos del resultado: las columnas de fecha se
+    guardan como date32 (sin hora) y las categóricas como diccionario.
+    """
+    if bloque.attrs:
+        # Los attrs son datos del procesamiento (encabezados de origen), no del archivo
+        bloque = bloque.copy(deep=False)
+        bloque.attrs = {}
+    tabla = pa.Table.from_pandas(bloque, preserve_index=False)
+    for i, campo in enumerate(tabla.schema):
+        if pa.types.is_timestamp(campo.type):
+            tabla = tabla.set_column(i, campo.name, tabla.column(i).cast(pa.date32(), safe=False))
+    return tabla
+
+
+def _bloques_arrow(datos, tamano_bloque, crear_escritor):
+    """Escribe los datos por bloques con el escritor Arrow indicado y entrega los bytes"""
+    bloques = partir(datos, tamano_bloque)
+    primero = next(bloques, None)
+    if primero is None:
+        return
+    esquema = tabla_arrow(primero.iloc[:0]).schema
+    with tempfile.SpooledTemporaryFile(max_size=MAX_MEMORIA_XLSX) as destino:
+        with crear_escritor(destino, esquema) as escritor:
+            for bloque in itertools.chain([primero], bloques):
+                if len(bloque):
+                    escritor.write_table(tabla_arrow(bloque).cast(esquema))
+        yield from _entregar(destino)
+
+
+def bloques_parquet(datos, tamano_bloque=TAMANO_BLOQUE_SALIDA, formato_fecha=None):
+    """
+    Codifica los datos a Parquet conservando los tipos; cada bloque es un
+    row group con estadísticas (mín/máx/nulos) en el footer. Las fechas no
+    se formatean: formato_fecha se acepta solo por compatibilidad.
+    """
+    return _bloques_arrow(datos, tamano_bloque, lambda destino, esquema: pq.ParquetWriter(
+        destino, esquema, compression=COMPRESION_PARQUET, write_statistics=True
+    ))
+
+
+def bloques_arrow_ipc(datos, tamano_bloque=TAMANO_BLOQUE_SALIDA, formato_fecha=None):
+    """Codifica los datos a Arrow IPC (formato archivo) conservando los tipos"""
+    return _bloques_arrow(datos, tamano_bloque, pa.ipc.new_file)
+
+
+def leer_tabla(origen):
+    """
+    Lee un resultado exportado en Parquet o Arrow IPC (ruta, bytes o archivo
+    en memoria) como tabla Arrow; el formato se detecta por la firma.
+    """
+    if isinstance(origen, (bytes, bytearray, memoryview)):
+        origen = pa.BufferReader(origen)
+    elif hasattr(origen, 'read'):
+        origen.seek(0)
+        origen = pa.BufferReader(origen.read())
+    else:
+        origen = pa.memory_map(origen)
+    firma = origen.read(6)
+    origen.seek(0)
+    if firma == b'ARROW1':
+        return pa.ipc.open_file(origen).read_all()
+    if firma[:4] == b'PAR1':
+        return pq.read_table(origen)
+    raise ValueError("El archivo no es un resultado Parquet ni Arrow IPC")
+
+
+def partes(df, max_filas, por_concepto=False):
+    """
+    Divide el resultado en partes de a lo sumo max_filas registros sin
+    repartir los registros de un empleado (SAP) entre dos partes; con
+    por_concepto, además, cada parte tiene un solo concepto. Genera
+    (etiqueta, DataFrame) con las filas agrupadas por SAP y ordenadas por
+    concepto dentro de la parte. Las filas sin SAP se reparten libremente.
+    Lanza ValueError si un empleado tiene más de max_filas registros.
+    """
+    if max_filas < 1:
+        raise ValueError("El tamaño de parte debe ser de al menos un registro")
+    grupos = df.groupby('CONCEPTO', observed=True, sort=True) if por_concepto else [(None, df)]
+    for concepto, grupo in grupos:
+        numero = 0
+        # Los registros de cada empleado quedan seguidos, en su orden original
+        grupo = grupo.sort_values('SAP', kind='stable', na_position='last')
+        nulos = grupo['SAP'].isna().to_numpy()
+        sap = grupo['SAP'].to_numpy(dtype='int64', na_value=-1)
+        nuevo = np.ones(len(grupo), dtype=bool)
+        nuevo[1:] = (sap[1:] != sap[:-1]) | nulos[1:]
+        inicios = np.flatnonzero(nuevo)
+
+        inicio = 0
+        while inicio < len(grupo):
+            fin = inicio + max_filas
+            if fin < len(grupo):
+                # Se corta en el último empleado que empieza antes del límite
+                fin = inicios[np.searchsorted(inicios, fin, side='right') - 1]
+                if fin <= inicio:
+                    raise ValueError(
+                        f"El SAP {sap[inicio]} tiene más de {max_filas:,} registros"
+                        + (f" en {concepto}" if concepto is not None else "")
+                        + "; aumenta el tamaño de parte"
+                    )
+            numero += 1
+            etiqueta = f"{concepto}_parte{numero:03d}" if concepto is not None else f"parte{numero:03d}"
+            yield etiqueta, grupo.iloc[inicio:fin].sort_values('CONCEPTO', kind='stable')
+            inicio = fin
+
+
+class _DestinoZip:
+    """Destino sin seek para zipfile: guarda lo escrito hasta que se entrega"""
+
+    def __init__(self):
+        self._bloques = []
+
+    def write(self, datos):
+        self._bloques.append(bytes(datos))
+        return len(datos)
+
+    def flush(self):
+        pass
+
+    def vaciar(self):
+        datos = b''.join(self._bloques)
+        self._bloques.clear()
+        return datos
+
+
+def bloques_zip(partes_resultado, formato, nombre_base, formato_fecha=FORMATO_FECHA_SAP):
+    """
+    ZIP con un archivo por parte ((etiqueta, DataFrame), ver partes) en el
+    formato indicado, entregado por bloques a medida que se codifica: solo
+    la parte que se está escribiendo está en memoria.
+    """
+    destino = _DestinoZip()
+    extension = FORMATOS[formato]['extension']
+    # xlsx, Parquet y Arrow ya van comprimidos; solo el CSV gana con deflate
+    compresion = zipfile.ZIP_DEFLATED if extension == 'csv' else zipfile.ZIP_STORED
+    with zipfile.ZipFile(destino, 'w', compression=compresion) as archivo_zip:
+        for etiqueta, parte in partes_resultado:
+            with archivo_zip.open(f"{nombre_base}_{etiqueta}.{extension}", 'w') as entrada:
+                for datos in bloques_salida(parte, formato, formato_fecha):
+                    entrada.write(datos)
+                    bloque = destino.vaciar()
+                    if bloque:
+                        yield bloque
+    bloque = destino.vaciar()
+    if bloque:
+        yield bloque
+
+
+# formato_salida de la interfaz -> cómo se codifica y se descarga
+FORMATOS = {
+    "Excel (.xlsx)": {
+        'extension': 'xlsx',
+        'etiqueta': 'Excel',
+        'mime': "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        'codificador': bloques_xlsx
+    },
+    "CSV (.csv)": {
+        'extension': 'csv',
+        'etiqueta': 'CSV',
+        'mime': "text/csv",
+        'codificador': bloques_csv
+    },
+    "Parquet (.parquet)": {
+        'extension': 'parquet',
+        'etiqueta': 'Parquet',
+        'mime': "application/vnd.apache.parquet",
+        'codificador': bloques_parquet
+    },
+    "Arrow IPC (.arrow)": {
+        'extension': 'arrow',
+        'etiqueta': 'Arrow',
+        'mime': "application/vnd.apache.arrow.file",
+        'codificador': bloques_arrow_ipc
+    }
+}
+
+
+def bloques_salida(datos, formato, formato_fecha=FORMATO_FECHA_SAP):
+    """
+    Genera los bytes del archivo en el formato indicado, bloque a bloque.
+    datos es un DataFrame o un iterable de DataFrames (ver partir).
+    """
+    return FORMATOS[formato]['codificador'](datos, formato_fecha=formato_fecha)
+
+
+def codificar(datos, formato, formato_fecha=FORMATO_FECHA_SAP):
+    """Bytes completos del archivo en el formato indicado"""
+    return b''.join(bloques_salida(datos, formato, formato_fecha))
+
+
+def escribir_archivo(df, ruta, formato, formato_fecha=FORMATO_FECHA_SAP):
+    """Escribe el archivo a disco sin armarlo completo en memoria"""
+    with open(ruta, 'wb') as destino:
+        for datos in bloques_salida(df, formato, formato_fecha):
+            destino.write(datos)
+    return ruta
+
+
+def escribir_zip(df, ruta, formato, max_filas, por_concepto=False, formato_fecha=FORMATO_FECHA_SAP):
+    """Escribe a disco el ZIP con el resultado dividido en partes (ver partes)"""
+    nombre_base = os.path.splitext(os.path.basename(ruta))[0]
+    with open(ruta, 'wb') as destino:
+        for datos in bloques_zip(partes(df, max_filas, por_concepto), formato, nombre_base, formato_fecha):
+            destino.write(datos)
+    return ruta
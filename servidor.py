@@ -0,0 +1,320 @@
+import argparse
+import json
+import os
+import re
+import threading
+import time
+from datetime import datetime
+from email.message import Message
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import archivo_plano
+import cache_archivos
+import maestro
+import manifiesto
+import procesamiento
+import salida
+import trabajos
+
+# Dirección del servicio; por defecto solo acepta conexiones locales
+HOST = os.environ.get('NOMINA_HOST', '127.0.0.1')
+PUERTO = int(os.environ.get('NOMINA_PUERTO', '8502'))
+# Solicitudes que pueden esperar turno además de las que se procesan (NOMINA_TRABAJADORES)
+MAX_EN_COLA = int(os.environ.get('NOMINA_COLA', '8'))
+# Tamaño máximo del cuerpo de una solicitud (ambos Excel juntos)
+MAX_BYTES_SOLICITUD = int(os.environ.get('NOMINA_MAX_MB', '200')) * 1024 * 1024
+
+# Formatos por extensión, como en la línea de comandos de archivo_plano.py
+FORMATOS_EXTENSION = {datos['extension']: nombre for nombre, datos in salida.FORMATOS.items()}
+OPCIONES = ['streaming', 'incremental', 'consolidar', 'enriquecer', 'historial']
+
+# Caché compartido por todas las solicitudes: un archivo repetido no se vuelve a parsear
+_cache = cache_archivos.CacheLRU()
+# Cupos de procesamiento y espera; sin cupo la solicitud se rechaza con 503
+_cupos = threading.BoundedSemaphore(trabajos.MAX_TRABAJADORES + MAX_EN_COLA)
+_candado = threading.Lock()
+_en_curso = 0
+
+
+class ErrorSolicitud(Exception):
+    """Solicitud que no se puede procesar; lleva el código HTTP de la respuesta"""
+
+    def __init__(self, estado, mensaje):
+        super().__init__(mensaje)
+        self.estado = estado
+
+
+def partes_multipart(cuerpo, tipo_contenido):
+    """{nombre del campo: bytes} de un cuerpo multipart/form-data"""
+    encabezado = Message()
+    encabezado['Content-Type'] = tipo_contenido
+    limite = encabezado.get_param('boundary')
+    if encabezado.get_content_type() != 'multipart/form-data' or not limite:
+        raise ErrorSolicitud(HTTPStatus.UNSUPPORTED_MEDIA_TYPE, "Se espera multipart/form-data")
+
+    partes = {}
+    separador = b'--' + limite.encode()
+    for parte in cuerpo.split(separador)[1:]:
+        if parte.startswith(b'--'):
+            break
+        cabeceras, _, datos = parte.partition(b'\r\n\r\n')
+        disposicion = Message()
+        for linea in cabeceras.decode('utf-8', 'replace').split('\r\n'):
+            nombre, _, valor = linea.partition(':')
+            if nombre.strip():
+                disposicion[nombre.strip()] = valor.strip()
+        campo = disposicion.get_param('name', header='content-disposition')
+        if campo:
+            # Cada parte termina con el salto de línea que precede al separador
+            partes[campo] = datos[:-2] if datos.endswith(b'\r\n') else datos
+    return partes
+
+
+def leer_opciones(consulta):
+    """Formato de salida y opciones (1/0, true/false) de la consulta de la URL"""
+    parametros = {clave: valores[-1] for clave, valores in parse_qs(consulta).items()}
+    extension = parametros.get('formato', 'xlsx').lower().lstrip('.')
+    if extension not in FORMATOS_EXTENSION:
+        raise ErrorSolicitud(
+            HTTPStatus.BAD_REQUEST,
+            f"Formato no soportado: {extension} (usa {', '.join(FORMATOS_EXTENSION)})"
+        )
+    opciones = {
+        opcion: parametros.get(opcion, '0').lower() in ('1', 'true', 'si', 'sí')
+        for opcion in OPCIONES
+    }
+    return FORMATOS_EXTENSION[extension], opciones
+
+
+def procesar(archivo_caja, archivo_big_pass, formato_salida, opciones, descripcion=''):
+    """
+    Procesa los dos archivos en el pool de trabajos, con el mismo núcleo que
+    la aplicación, y espera el resultado. El archivo plano no se codifica
+    aquí: se codifica por bloques al enviarlo. Retorna el Trabajo terminado.
+    """
+    maestro_empleados = maestro.obtener()
+    claves = (cache_archivos.hash_contenido(archivo_caja), cache_archivos.hash_contenido(archivo_big_pass))
+    id_trabajo = trabajos.enviar(
+        procesamiento.calcular_procesamiento,
+        archivo_caja, archivo_big_pass, claves, formato_salida,
+        opciones['streaming'], opciones['incremental'], _cache,
+        maestro_empleados if len(maestro_empleados) else None,
+        opciones['enriquecer'], opciones['consolidar'], opciones['historial'],
+        codificar_salida=False,
+        # Dos solicitudes iguales a la vez comparten el mismo trabajo
+        clave=claves + (formato_salida, maestro_empleados.version) + tuple(opciones[opcion] for opcion in OPCIONES),
+        descripcion=descripcion
+    )
+    trabajo = trabajos.obtener(id_trabajo)
+    if trabajo is None:
+        raise ErrorSolicitud(HTTPStatus.SERVICE_UNAVAILABLE, "El trabajo se descartó antes de terminar; reintenta")
+    trabajo.futuro.result()
+    return trabajo
+
+
+def nombre_metrica(etapa, concepto):
+    """
+    Nombre de la etapa como token válido de Server-Timing: minúsculas,
+    sin el detalle entre paréntesis y con guiones ('codificacion-csv')
+    """
+    texto = f"{etapa} {re.sub(r'[(].*?[)]', '', concepto or '')}"
+    return re.sub(r'[^a-z0-9_]+', '-', texto.lower()).strip('-')
+
+
+def encabezados_tiempo(trabajo, inicio_solicitud):
+    """
+    Tiempos de la solicitud: espera en cola, proceso, total y cada etapa
+    (Server-Timing). Las etapas repetidas, como los bloques del modo
+    streaming, se suman en una sola métrica.
+    """
+    medicion = trabajo.resultado['medicion']
+    duraciones = {}
+    for etapa in medicion.etapas:
+        if etapa['nivel'] == 0:
+            clave = (etapa['etapa'], etapa['concepto'])
+            duraciones[clave] = duraciones.get(clave, 0.0) + etapa['segundos']
+    metricas = []
+    for (etapa, concepto), segundos in duraciones.items():
+        descripcion = f"{etapa} {concepto}" if concepto else etapa
+        descripcion = descripcion.replace('\\', '\\\\').replace('"', '\\"')
+        metricas.append(f'{nombre_metrica(etapa, concepto)};dur={segundos * 1000:.1f};desc="{descripcion}"')
+    return {
+        'X-Tiempo-Cola': f"{max(0.0, (trabajo.inicio or trabajo.creado) - trabajo.creado):.3f}",
+        'X-Tiempo-Proceso': f"{trabajo.segundos():.3f}",
+        'X-Tiempo-Total': f"{time.perf_counter() - inicio_solicitud:.3f}",
+        'Server-Timing': ', '.join(metricas)
+    }
+
+
+class ManejadorNomina(BaseHTTPRequestHandler):
+    """
+    POST /procesar?formato=xlsx con los campos 'caja' y 'big_pass' en
+    multipart/form-data; responde el archivo plano. GET /estado informa los
+    cupos del servicio.
+    """
+
+    server_version = 'NominaHTTP/1.0'
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        if urlparse(self.path).path != '/estado':
+            self._responder_json(HTTPStatus.NOT_FOUND, {'error': "Ruta no encontrada"})
+            return
+        self._responder_json(HTTPStatus.OK, {
+            'trabajadores': trabajos.MAX_TRABAJADORES,
+            'max_en_cola': MAX_EN_COLA,
+            'en_curso': _en_curso,
+            'formatos': list(FORMATOS_EXTENSION)
+        })
+
+    def do_POST(self):
+        global _en_curso
+        inicio = time.perf_counter()
+        self._cupo_tomado = False
+        self._respuesta_iniciada = False
+        url = urlparse(self.path)
+        if url.path != '/procesar':
+            self._responder_json(HTTPStatus.NOT_FOUND, {'error': "Ruta no encontrada"})
+            return
+        if not _cupos.acquire(blocking=False):
+            self._responder_json(
+                HTTPStatus.SERVICE_UNAVAILABLE, {'error': "Servicio ocupado, reintenta más tarde"},
+                {'Retry-After': '5'}
+            )
+            return
+        with _candado:
+            _en_curso += 1
+        self._cupo_tomado = True
+        try:
+            try:
+                formato_salida, opciones = leer_opciones(url.query)
+                partes = partes_multipart(self._leer_cuerpo(), self.headers.get('Content-Type', ''))
+            except ErrorSolicitud:
+                raise
+            except Exception as e:
+                raise ErrorSolicitud(HTTPStatus.BAD_REQUEST, f"Solicitud inválida: {e}") from e
+            faltantes = [campo for campo in ('caja', 'big_pass') if not partes.get(campo)]
+            if faltantes:
+                raise ErrorSolicitud(HTTPStatus.BAD_REQUEST, f"Faltan los archivos: {', '.join(faltantes)}")
+
+            trabajo = procesar(
+                partes['caja'], partes['big_pass'], formato_salida, opciones,
+                descripcion=f"HTTP {self.client_address[0]}"
+            )
+            if trabajo.estado != trabajos.TERMINADO:
+                raise ErrorSolicitud(HTTPStatus.INTERNAL_SERVER_ERROR, trabajo.error or f"Trabajo {trabajo.estado}")
+            resultado = trabajo.resultado
+            if resultado['df_resultado'] is None or resultado['df_resultado'].empty:
+                raise ErrorSolicitud(HTTPStatus.UNPROCESSABLE_ENTITY, "No se generaron datos válidos")
+            tiempos = encabezados_tiempo(trabajo, inicio)
+            # El procesamiento terminó: enviar el archivo a un cliente lento no ocupa cupo
+            self._liberar_cupo()
+            self._responder_archivo(resultado, formato_salida, tiempos)
+            if resultado['archivos_incremental'] is not None:
+                # Se registra como emitido solo lo que se terminó de enviar al cliente
+                manifiesto.Manifiesto().registrar(resultado['df_resultado'], resultado['archivos_incremental'])
+        except ErrorSolicitud as e:
+            self._liberar_cupo()
+            self._responder_error(e.estado, str(e))
+        except Exception as e:
+            # Cualquier otro error (procesamiento, cliente que se desconecta) también recibe respuesta
+            self._liberar_cupo()
+            self.log_error("Error en %s: %r", self.path, e)
+            self._responder_error(HTTPStatus.INTERNAL_SERVER_ERROR, f"Error interno: {e}")
+        finally:
+            self._liberar_cupo()
+
+    def _liberar_cupo(self):
+        """Devuelve el cupo de la solicitud (una sola vez)"""
+        global _en_curso
+        if not self._cupo_tomado:
+            return
+        self._cupo_tomado = False
+        with _candado:
+            _en_curso -= 1
+        _cupos.release()
+
+    def _leer_cuerpo(self):
+        try:
+            longitud = int(self.headers.get('Content-Length', ''))
+        except ValueError:
+            raise ErrorSolicitud(HTTPStatus.LENGTH_REQUIRED, "Falta Content-Length")
+        if longitud < 0:
+            raise ErrorSolicitud(HTTPStatus.BAD_REQUEST, "Content-Length inválido")
+        if longitud > MAX_BYTES_SOLICITUD:
+            raise ErrorSolicitud(
+                HTTPStatus.REQUEST_ENTITY_TOO_LARGE,
+                f"La solicitud supera {MAX_BYTES_SOLICITUD // (1024 * 1024)} MB"
+            )
+        return self.rfile.read(longitud)
+
+    def _responder_archivo(self, resultado, formato_salida, tiempos):
+        """
+        Envía el archivo plano codificándolo por bloques (salida.bloques_salida)
+        con Transfer-Encoding: chunked, sin armarlo completo en memoria. Si
+        falla a mitad de camino la respuesta queda sin el bloque final, así
+        el cliente la ve incompleta.
+        """
+        formato = salida.FORMATOS[formato_salida]
+        df = archivo_plano.para_exportar(resultado['df_resultado'])
+        nombre_archivo = f"nomina_2025{datetime.now().strftime('_%Y%m%d_%H%M%S')}.{formato['extension']}"
+        self.send_response(HTTPStatus.OK)
+        self.send_header('Content-Type', formato['mime'])
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.send_header('Content-Disposition', f'attachment; filename="{nombre_archivo}"')
+        self.send_header('X-Registros', str(len(resultado['df_resultado'])))
+        self.send_header('X-Registros-Sin-SAP', str(sum(valores['sin_sap'] for valores in resultado['estadisticas'].values())))
+        for nombre, valor in tiempos.items():
+            self.send_header(nombre, valor)
+        self.end_headers()
+        self._respuesta_iniciada = True
+        for datos in salida.bloques_salida(df, formato_salida):
+            if datos:
+                self.wfile.write(f"{len(datos):x}\r\n".encode('ascii'))
+                self.wfile.write(datos)
+                self.wfile.write(b"\r\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _responder_error(self, estado, mensaje):
+        """Error en JSON; si el archivo ya se empezó a enviar solo se corta la conexión"""
+        if self._respuesta_iniciada:
+            self.close_connection = True
+            return
+        self._responder_json(estado, {'error': mensaje})
+
+    def _responder_json(self, estado, contenido, encabezados=None):
+        datos = json.dumps(contenido, ensure_ascii=False).encode('utf-8')
+        self.send_response(estado)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(datos)))
+        if estado >= 400:
+            # El cuerpo de la solicitud puede haber quedado sin leer
+            self.send_header('Connection', 'close')
+            self.close_connection = True
+        for nombre, valor in (encabezados or {}).items():
+            self.send_header(nombre, valor)
+        self.end_headers()
+        self.wfile.write(datos)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servicio HTTP local para generar el archivo plano")
+    parser.add_argument('--host', default=HOST, help="Dirección en la que escucha")
+    parser.add_argument('--puerto', type=int, default=PUERTO, help="Puerto")
+    args = parser.parse_args()
+
+    servidor = ThreadingHTTPServer((args.host, args.puerto), ManejadorNomina)
+    print(f"Escuchando en http://{args.host}:{args.puerto} "
+          f"({trabajos.MAX_TRABAJADORES} trabajadores, {MAX_EN_COLA} en cola)")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
+
+
+if __name__ == "__main__":
+    main()
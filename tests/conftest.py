@@ -0,0 +1,35 @@
+import openpyxl
+import pandas as pd
+import pytest
+
+import archivo_plano
+
+
+@pytest.fixture
+def registros():
+    """Arma un resultado con el esquema de salida a partir de filas [SAP, FECHA, CONCEPTO, VALOR]"""
+    def armar(filas):
+        df = pd.DataFrame(filas, columns=archivo_plano.COLUMNAS_SALIDA)
+        return df.assign(
+            SAP=df['SAP'].astype('Int64'),
+            FECHA=pd.to_datetime(df['FECHA']).astype('datetime64[us]'),
+            CONCEPTO=df['CONCEPTO'].astype(archivo_plano.TIPO_CONCEPTO),
+            VALOR=df['VALOR'].astype('int64')
+        )
+    return armar
+
+
+@pytest.fixture
+def libro(tmp_path):
+    """Escribe un xlsx con las hojas indicadas ({hoja: [encabezado, *filas]}) y retorna su ruta"""
+    def escribir(nombre, hojas):
+        archivo = openpyxl.Workbook()
+        archivo.remove(archivo.active)
+        for hoja, filas in hojas.items():
+            destino = archivo.create_sheet(hoja)
+            for fila in filas:
+                destino.append(fila)
+        ruta = tmp_path / nombre
+        archivo.save(ruta)
+        return str(ruta)
+    return escribir
@@ -0,0 +1,76 @@
+import pandas as pd
+
+import archivo_plano
+
+
+def test_suma_por_clave_en_orden_de_primera_aparicion(registros):
+    df = registros([
+        [20, '2025-07-31', 'Y602', 5],
+        [10, '2025-07-31', 'Z498', 100],
+        [20, '2025-07-31', 'Y602', 7],
+        [10, '2025-07-30', 'Z498', 1],
+        [10, '2025-07-31', 'Z498', 50],
+    ])
+    consolidado, mapa = archivo_plano.consolidar(df)
+
+    assert consolidado[['SAP', 'CONCEPTO', 'VALOR']].values.tolist() == [
+        [20, 'Y602', 12], [10, 'Z498', 150], [10, 'Z498', 1]
+    ]
+    assert list(consolidado['FECHA'].dt.day) == [31, 31, 30]
+    assert list(consolidado.columns) == archivo_plano.COLUMNAS_SALIDA
+    assert consolidado['CONCEPTO'].dtype == archivo_plano.TIPO_CONCEPTO
+    # Una fila del mapa por registro original, con el consolidado en que quedó
+    assert list(mapa['registro']) == [0, 1, 0, 2, 1]
+    assert int(consolidado['VALOR'].sum()) == int(df['VALOR'].sum())
+
+
+def test_filas_sin_sap_no_se_combinan(registros):
+    df = registros([
+        [None, '2025-07-31', 'Z498', 10],
+        [10, '2025-07-31', 'Z498', 1],
+        [None, '2025-07-31', 'Z498', 20],
+        [10, '2025-07-31', 'Z498', 2],
+    ])
+    consolidado, mapa = archivo_plano.consolidar(df)
+
+    assert consolidado['SAP'].isna().tolist() == [True, False, True]
+    assert list(consolidado['VALOR']) == [10, 3, 20]
+    assert list(mapa['registro']) == [0, 1, 2, 1]
+
+
+def test_origen_solo_queda_en_el_mapa(registros):
+    df = registros([
+        [10, '2025-07-31', 'Z498', 1], [10, '2025-07-31', 'Z498', 2], [10, '2025-07-31', 'Y602', 4]
+    ]).assign(HOJA=['A', 'B', 'Hoja1'], FILA=[7, 3, 12])
+    consolidado, mapa = archivo_plano.consolidar(df)
+
+    assert list(consolidado.columns) == archivo_plano.COLUMNAS_SALIDA
+    assert list(consolidado['VALOR']) == [3, 4]
+    # Cada registro original apunta a su archivo, hoja y fila del Excel
+    assert mapa[['registro', 'ARCHIVO', 'HOJA', 'FILA']].values.tolist() == [
+        [0, 'caja', 'A', 7], [0, 'caja', 'B', 3], [1, 'big_pass', 'Hoja1', 12]
+    ]
+
+
+def test_fila_del_excel_desde_la_lectura():
+    # Índices como los de un libro leído: la primera fila de datos es la fila 2 del Excel
+    df = pd.DataFrame({
+        archivo_plano.COLUMNA_SAP_CAJA: [10, 20, 30],
+        archivo_plano.COLUMNA_FECHA_CAJA: ['31/07/2025'] * 3,
+        archivo_plano.COLUMNA_DESCUADRES: [5, 0, 7]
+    })
+    bloque = archivo_plano.registros_concepto(
+        df, 'Z498', archivo_plano.COLUMNA_DESCUADRES, archivo_plano.COLUMNA_SAP_CAJA, archivo_plano.COLUMNA_FECHA_CAJA
+    )
+    _, mapa = archivo_plano.consolidar(bloque.reset_index(drop=True))
+
+    assert list(mapa['FILA']) == [2, 4]
+    assert list(archivo_plano.para_exportar(bloque).columns) == archivo_plano.COLUMNAS_SALIDA
+
+
+def test_vacio(registros):
+    df = registros([])
+    consolidado, mapa = archivo_plano.consolidar(df)
+    assert consolidado.empty
+    assert mapa.empty
+    assert list(mapa.columns) == archivo_plano.COLUMNAS_MAPA
@@ -0,0 +1,69 @@
+import pandas as pd
+
+import diferencias
+
+
+def estados(cruce):
+    return cruce['ESTADO'].value_counts().to_dict()
+
+
+def test_duplicados_en_otro_orden_son_iguales(registros):
+    anterior = registros([
+        [10, '2025-07-31', 'Z498', 100],
+        [10, '2025-07-31', 'Z498', 200],
+        [20, '2025-07-31', 'Y602', 5],
+    ])
+    actual = anterior.iloc[[2, 1, 0]].reset_index(drop=True)
+    cruce = diferencias.cruzar(anterior, actual)
+
+    assert len(cruce) == 3
+    assert estados(cruce)[diferencias.IGUAL] == 3
+    assert diferencias.detalle(cruce).empty
+
+
+def test_duplicado_de_menos_es_un_eliminado(registros):
+    anterior = registros([
+        [10, '2025-07-31', 'Z498', 100],
+        [10, '2025-07-31', 'Z498', 100],
+    ])
+    actual = registros([
+        [10, '2025-07-31', 'Z498', 100],
+    ])
+    cambios = diferencias.detalle(diferencias.cruzar(anterior, actual))
+
+    assert len(cambios) == 1
+    assert cambios.loc[0, 'ESTADO'] == diferencias.ELIMINADO
+    assert cambios.loc[0, 'VALOR_ANTERIOR'] == 100
+    assert pd.isna(cambios.loc[0, 'VALOR_ACTUAL'])
+    assert cambios.loc[0, 'DIFERENCIA'] == -100
+
+
+def test_duplicados_se_emparejan_por_valor(registros):
+    anterior = registros([
+        [10, '2025-07-31', 'Z498', 300],
+        [10, '2025-07-31', 'Z498', 100],
+    ])
+    actual = registros([
+        [10, '2025-07-31', 'Z498', 100],
+        [10, '2025-07-31', 'Z498', 350],
+        [10, '2025-07-31', 'Z498', 1],
+    ])
+    cruce = diferencias.cruzar(anterior, actual)
+
+    # Uno a uno por ocurrencia: 100↔1, 300↔100, y 350 queda como agregado
+    assert len(cruce) == 3
+    assert estados(cruce) == {diferencias.MODIFICADO: 2, diferencias.AGREGADO: 1, diferencias.ELIMINADO: 0, diferencias.IGUAL: 0}
+    assert int(cruce['DIFERENCIA'].sum()) == 451 - 400
+
+
+def test_resumen_por_concepto(registros):
+    anterior = registros([[10, '2025-07-31', 'Z498', 100], [20, '2025-07-31', 'Y602', 5]])
+    actual = registros([[10, '2025-07-31', 'Z498', 150], [30, '2025-07-31', 'Y602', 7]])
+    tabla, _ = diferencias.comparar(anterior, actual)
+    tabla = tabla.set_index('CONCEPTO')
+
+    assert tabla.loc['Z498', 'modificados'] == 1
+    assert tabla.loc['Z498', 'diferencia'] == 50
+    assert tabla.loc['Y602', 'agregados'] == 1
+    assert tabla.loc['Y602', 'eliminados'] == 1
+    assert tabla.loc['Y602', 'total_actual'] == 7
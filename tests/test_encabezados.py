@@ -0,0 +1,36 @@
+import pytest
+
+import archivo_plano
+import encabezados
+
+
+@pytest.mark.parametrize('original', ['N° Sap ', 'N° SAP', 'n sap', 'Nro. Sap', 'NUMERO SAP', '  Número   SAP  '])
+def test_variantes_del_sap_de_big_pass(original):
+    mapeo = encabezados.resolver([original, 'Terminación'], archivo_plano.COLUMNAS_BIG_PASS)
+    assert mapeo == {'N° Sap ': original, 'Terminación': 'Terminación'}
+
+
+def test_nombre_exacto_antes_que_alias():
+    # 'Fecha Retiro' también es alias de la fecha, pero el nombre exacto gana
+    mapeo = encabezados.resolver(['Fecha Retiro', 'Terminación'], ['Terminación'])
+    assert mapeo == {'Terminación': 'Terminación'}
+
+
+def test_cada_encabezado_se_usa_una_sola_vez():
+    # CAJA y BIG PASS comparten los alias de SAP y fecha
+    mapeo = encabezados.resolver(['sap', 'Fecha de terminación'], ['SAP', 'N° Sap ', 'Terminación'])
+    assert mapeo == {'SAP': 'sap', 'Terminación': 'Fecha de terminación'}
+
+
+def test_columnas_que_faltan_no_aparecen():
+    assert encabezados.resolver(['Nombre', None, 'Otra'], archivo_plano.COLUMNAS_CAJA) == {}
+
+
+def test_filtro_de_columnas_para_la_lectura():
+    assert encabezados.es_candidato('DESCUADRES', archivo_plano.COLUMNAS_CAJA)
+    assert not encabezados.es_candidato('Nombre', archivo_plano.COLUMNAS_CAJA)
+
+
+def test_solo_se_informan_los_renombrados():
+    assert encabezados.renombrados({'SAP': 'SAP', 'N° Sap ': 'N° SAP'}) == {'N° Sap ': 'N° SAP'}
+    assert encabezados.renombrados(None) == {}
@@ -0,0 +1,81 @@
+import numpy as np
+import pandas as pd
+
+import fechas
+
+
+def test_texto_dia_antes_que_mes():
+    serie, rechazados = fechas.convertir(pd.Series(['05/07/2025', '31/07/2025'], name='Terminación'))
+    assert list(serie) == [pd.Timestamp('2025-07-05'), pd.Timestamp('2025-07-31')]
+    assert rechazados == 0
+
+
+def test_iso_en_columna_con_formato_dia_primero():
+    # La columna infiere dd/mm/aaaa, pero el ISO sigue leyéndose año-mes-día
+    serie, rechazados = fechas.convertir(pd.Series(['05/07/2025', '2025-07-31', '2025-01-02'], name='Terminación'))
+    assert list(serie) == [pd.Timestamp('2025-07-05'), pd.Timestamp('2025-07-31'), pd.Timestamp('2025-01-02')]
+    assert rechazados == 0
+
+
+def test_formato_inferido_queda_por_columna_en_la_lectura():
+    formatos = {}
+    fechas.convertir(pd.Series(['2025-07-31'], name='ISO'), formatos)
+    fechas.convertir(pd.Series(['31-07-2025'], name='Guiones'), formatos)
+    assert formatos == {'ISO': '%Y-%m-%d', 'Guiones': '%d-%m-%Y'}
+
+
+def test_formato_inferido_no_cambia_con_valores_mezclados():
+    formatos = {}
+    serie, _ = fechas.convertir(pd.Series(['31-07-2025', '2025-07-30', '01-08-2025'], name='Mezcla'), formatos)
+    fechas.convertir(pd.Series(['2025-08-02'], name='Mezcla'), formatos)
+
+    assert formatos == {'Mezcla': '%d-%m-%Y'}
+    assert list(serie.dt.day) == [31, 30, 1]
+
+
+def test_sin_formatos_cada_llamada_infiere_el_suyo():
+    fechas.convertir(pd.Series(['2025-07-31'], name='Terminación'))
+    serie, rechazados = fechas.convertir(pd.Series(['05/07/2025'], name='Terminación'))
+    assert serie[0] == pd.Timestamp('2025-07-05')
+    assert rechazados == 0
+    assert not hasattr(fechas, '_formatos_columna')
+
+
+def test_seriales_de_excel_en_los_limites():
+    serie, rechazados = fechas.convertir(pd.Series(
+        [fechas.SERIAL_MINIMO - 1, fechas.SERIAL_MINIMO, 45000, fechas.SERIAL_MAXIMO, fechas.SERIAL_MAXIMO + 1, np.nan],
+        name='Fecha'
+    ))
+    assert serie.dtype == 'datetime64[us]'
+    assert pd.isna(serie[0])
+    assert serie[1] == pd.Timestamp('1899-12-31')
+    assert serie[2] == pd.Timestamp('2023-03-15')
+    assert serie[3] == pd.Timestamp('9999-12-31')
+    assert pd.isna(serie[4])
+    assert pd.isna(serie[5])
+    # Fuera de rango se rechaza; el vacío no
+    assert rechazados == 2
+
+
+def test_serial_en_texto_y_mezcla_de_tipos():
+    serie, rechazados = fechas.convertir(pd.Series(
+        ['45000', 45000, pd.Timestamp('2023-03-15'), '15/03/2023'], dtype=object, name='Mezcla'
+    ))
+    assert (serie == pd.Timestamp('2023-03-15')).all()
+    assert rechazados == 0
+
+
+def test_rechazados_cuenta_filas_y_no_vacios():
+    serie, rechazados = fechas.convertir(pd.Series(
+        ['no es fecha', '31/02/2025', 'no es fecha', '   ', None, '01/02/2025'], name='Terminación'
+    ))
+    assert serie.isna().tolist() == [True, True, True, True, True, False]
+    # Cada fila con un valor escrito ilegible cuenta, aunque el valor se repita
+    assert rechazados == 3
+
+
+def test_columna_ya_en_fechas_no_se_toca():
+    original = pd.Series(pd.to_datetime(['2025-07-31', None]), name='Fecha')
+    serie, rechazados = fechas.convertir(original)
+    assert serie is original
+    assert rechazados == 0
@@ -0,0 +1,57 @@
+from datetime import datetime
+
+import pandas as pd
+import pytest
+
+import archivo_plano
+
+
+@pytest.fixture
+def caja_multi(libro):
+    fecha = datetime(2025, 7, 31)
+    return libro('caja.xlsx', {
+        'Tienda 1': [['SAP', 'Fecha Terminación. (Digite)', 'DESCUADRES DE CAJA PARA DESCONTAR'],
+                     [1, fecha, 10], [2, fecha, 0], [3, fecha, 30]],
+        'Notas': [['Comentario'], ['sin datos']],
+        'Tienda 2': [['N° SAP', 'Fecha Terminacion', 'Descuadres'], [4, fecha, 40], [5, fecha, 50]],
+    })
+
+
+def test_lee_las_hojas_con_el_encabezado_esperado(caja_multi):
+    df = archivo_plano.leer_caja(caja_multi, trabajadores=1)
+
+    assert list(df['HOJA']) == ['Tienda 1'] * 3 + ['Tienda 2'] * 2
+    assert list(df['SAP']) == [1, 2, 3, 4, 5]
+    # Encabezados por hoja: la segunda usa otros nombres
+    assert df.attrs['encabezados']['Tienda 1']['SAP'] == 'SAP'
+    assert df.attrs['encabezados']['Tienda 2']['SAP'] == 'N° SAP'
+    assert 'Notas' not in df.attrs['encabezados']
+
+
+def test_filas_del_excel_por_hoja(caja_multi):
+    registros = archivo_plano.registros_concepto(
+        archivo_plano.leer_caja(caja_multi, trabajadores=1), 'Z498', archivo_plano.COLUMNA_DESCUADRES,
+        archivo_plano.COLUMNA_SAP_CAJA, archivo_plano.COLUMNA_FECHA_CAJA
+    )
+
+    assert registros[['HOJA', 'FILA']].values.tolist() == [['Tienda 1', 2], ['Tienda 1', 4], ['Tienda 2', 2], ['Tienda 2', 3]]
+    assert list(archivo_plano.para_exportar(registros).columns) == archivo_plano.COLUMNAS_SALIDA
+
+
+def test_libro_de_una_hoja_sin_columna_hoja(libro):
+    ruta = libro('una.xlsx', {'Hoja1': [['SAP', 'Fecha Terminación. (Digite)', 'DESCUADRES DE CAJA PARA DESCONTAR'], [1, None, 5]]})
+    df = archivo_plano.leer_caja(ruta)
+
+    assert 'HOJA' not in df.columns
+    assert list(df.attrs['encabezados']) == ['Hoja1']
+
+
+@pytest.mark.parametrize('como', [str, lambda ruta: open(ruta, 'rb').read()])
+def test_en_el_pool_de_procesos_igual_que_en_este_proceso(caja_multi, como):
+    if archivo_plano.pool_procesos() is None:
+        pytest.skip("sin pool de procesos")
+    en_proceso = archivo_plano.leer_caja(caja_multi, trabajadores=1)
+    en_pool = archivo_plano.leer_caja(como(caja_multi), trabajadores=2, en_pool=True)
+
+    pd.testing.assert_frame_equal(en_pool, en_proceso)
+    assert en_pool.attrs == en_proceso.attrs
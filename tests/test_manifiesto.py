@@ -0,0 +1,80 @@
+import json
+
+import pytest
+
+import archivo_plano
+import manifiesto
+
+
+@pytest.fixture
+def resultado(registros):
+    return registros([
+        [10, '2025-07-31', 'Z498', 100],
+        [10, '2025-07-31', 'Z498', 50],
+        [20, '2025-07-31', 'Y602', 5],
+        [None, '2025-07-31', 'Y608', 7],
+    ])
+
+
+def test_lo_registrado_no_se_vuelve_a_emitir(tmp_path, resultado):
+    manifiesto.Manifiesto(tmp_path).registrar(resultado, ['caja', None])
+
+    registro = manifiesto.Manifiesto(tmp_path)
+    nuevos, resumen = registro.filtrar_nuevos(resultado)
+    assert nuevos.empty
+    assert resumen == {'nuevos': 0, 'modificados': 0, 'omitidos': 4}
+    assert registro.archivo_procesado('caja')
+    assert registro.version == 1
+
+
+def test_consolidado_y_sin_consolidar_comparten_claves(tmp_path, resultado):
+    consolidado, _ = archivo_plano.consolidar(resultado)
+    manifiesto.Manifiesto(tmp_path).registrar(consolidado, [])
+
+    # La misma corrida sin consolidar no se emite otra vez, y al revés tampoco
+    nuevos, resumen = manifiesto.Manifiesto(tmp_path).filtrar_nuevos(resultado)
+    assert nuevos.empty
+    assert resumen['omitidos'] == 4
+
+    otro = tmp_path / 'otro'
+    manifiesto.Manifiesto(otro).registrar(resultado, [])
+    nuevos, _ = manifiesto.Manifiesto(otro).filtrar_nuevos(consolidado)
+    assert nuevos.empty
+
+
+def test_valor_modificado_se_emite_con_todas_sus_filas(tmp_path, registros, resultado):
+    manifiesto.Manifiesto(tmp_path).registrar(resultado, [])
+    actual = registros([
+        [10, '2025-07-31', 'Z498', 100],
+        [10, '2025-07-31', 'Z498', 60],
+        [20, '2025-07-31', 'Y602', 5],
+        [30, '2025-07-31', 'Y602', 1],
+    ])
+
+    nuevos, resumen = manifiesto.Manifiesto(tmp_path).filtrar_nuevos(actual)
+    assert list(nuevos['VALOR']) == [100, 60, 1]
+    assert resumen == {'nuevos': 1, 'modificados': 2, 'omitidos': 1}
+
+
+def test_clave_no_depende_de_los_tipos_de_lectura(resultado):
+    otra_forma = resultado.assign(
+        FECHA=resultado['FECHA'].astype('datetime64[ns]'),
+        CONCEPTO=resultado['CONCEPTO'].astype(str),
+        SAP=resultado['SAP'].astype('float64')
+    )
+    columnas = manifiesto.COLUMNAS_CLAVE
+    assert (manifiesto.hash_registros(resultado, columnas) == manifiesto.hash_registros(otra_forma, columnas)).all()
+
+
+def test_manifiesto_de_otro_formato_no_se_usa(tmp_path, resultado):
+    manifiesto.Manifiesto(tmp_path).registrar(resultado, [])
+    ruta = tmp_path / 'archivos.json'
+    datos = json.loads(ruta.read_text(encoding='utf-8'))
+    del datos['formato']
+    ruta.write_text(json.dumps(datos), encoding='utf-8')
+
+    with pytest.raises(ValueError, match='otro formato'):
+        manifiesto.Manifiesto(tmp_path).filtrar_nuevos(resultado)
+    registro = manifiesto.Manifiesto(tmp_path)
+    registro.reiniciar()
+    assert len(manifiesto.Manifiesto(tmp_path)) == 0
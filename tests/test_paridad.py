@@ -0,0 +1,82 @@
+from datetime import datetime
+
+import pandas as pd
+import pytest
+
+import archivo_plano
+import salida
+
+
+def registros_linea_base(df_caja, df_big_pass):
+    """Los registros como los armaba el procesador original, fila por fila con iterrows"""
+    def fecha_texto(valor):
+        fecha = pd.to_datetime(valor, errors='coerce') if pd.notna(valor) else pd.NaT
+        return fecha.strftime('%d/%m/%Y') if pd.notna(fecha) else ''
+
+    registros = []
+    for df, conceptos, columna_sap, columna_fecha in [
+        (df_caja, [('Z498', 'DESCUADRES DE CAJA PARA DESCONTAR')], 'SAP', 'Fecha Terminación. (Digite)'),
+        (df_big_pass, [('Z609', 'Descontar'), ('Y602', 'Pagar'), ('Y608', 'PEOPLE')], 'N° Sap ', 'Terminación'),
+    ]:
+        for concepto, columna in conceptos:
+            filtrado = df[df[columna].notna() & (pd.to_numeric(df[columna], errors='coerce') > 0)]
+            for _, fila in filtrado.iterrows():
+                registros.append([
+                    str(fila[columna_sap]).strip(), fecha_texto(fila[columna_fecha]),
+                    concepto, str(int(pd.to_numeric(fila[columna], errors='coerce')))
+                ])
+    return registros
+
+
+@pytest.fixture
+def paquete(libro):
+    fecha = datetime(2025, 7, 31)
+    caja = libro('caja.xlsx', {'Hoja1': [
+        ['SAP', 'Nombre', 'Fecha Terminación. (Digite)', 'DESCUADRES DE CAJA PARA DESCONTAR'],
+        [1001, 'A', fecha, 1500],
+        [1002, 'B', None, 0],
+        [1003, 'C', datetime(2025, 7, 1), 2500.0],
+        [1004, 'D', fecha, -10],
+        [1005, 'E', fecha, 'N/A'],
+        [1006, 'F', fecha, '300'],
+    ]})
+    big_pass = libro('big_pass.xlsx', {'Hoja1': [
+        ['N° Sap ', 'Terminación', 'Descontar', 'Pagar', 'PEOPLE', 'Otra'],
+        [2001, fecha, 100, None, 0, 'x'],
+        [2002, None, None, 200, 10, 'x'],
+        [2003, datetime(2025, 6, 30), 50, 0, None, 'x'],
+        [2004, fecha, 0, 0, 0, 'x'],
+        [2005, fecha, 75, 25, 5, 'x'],
+    ]})
+    return caja, big_pass
+
+
+def esperado(caja, big_pass):
+    return registros_linea_base(pd.read_excel(caja), pd.read_excel(big_pass))
+
+
+def como_filas(df):
+    texto = salida.formatear_bloque(archivo_plano.para_exportar(df), '%d/%m/%Y')
+    return texto.astype(str).replace({'<NA>': ''}).values.tolist()
+
+
+def test_mismos_registros_que_la_linea_base(paquete):
+    caja, big_pass = paquete
+    df, _ = archivo_plano.generar_archivo_plano(archivo_plano.leer_caja(caja), archivo_plano.leer_big_pass(big_pass))
+
+    assert como_filas(df) == esperado(caja, big_pass)
+
+
+def test_concurrente_igual_a_la_linea_base(paquete):
+    caja, big_pass = paquete
+    df, estadisticas, datos = archivo_plano.generar_archivo_plano_concurrente(
+        caja, big_pass, "CSV (.csv)", formato_fecha='%d/%m/%Y'
+    )
+
+    assert como_filas(df) == esperado(caja, big_pass)
+    lineas = datos.decode('utf-8-sig').splitlines()
+    assert lineas[0] == 'SAP;FECHA;CONCEPTO;VALOR'
+    assert [linea.split(';') for linea in lineas[1:]] == esperado(caja, big_pass)
+    assert {clave: valores['registros'] for clave, valores in estadisticas.items()} == {
+        'caja': 3, 'descontar': 3, 'pagar': 2, 'people': 2
+    }
@@ -0,0 +1,59 @@
+import pandas as pd
+
+import archivo_plano
+import salida
+import validacion
+
+
+def caja(filas):
+    """DataFrame como el leído de CAJA a partir de filas [SAP, fecha, descuadre]"""
+    return pd.DataFrame(filas, columns=archivo_plano.COLUMNAS_CAJA)
+
+
+def registros_caja(df, reporte=None):
+    return archivo_plano.registros_concepto(
+        df, 'Z498', archivo_plano.COLUMNA_DESCUADRES, archivo_plano.COLUMNA_SAP_CAJA,
+        archivo_plano.COLUMNA_FECHA_CAJA, reporte=reporte
+    )
+
+
+def test_esquema_del_resultado():
+    registros = registros_caja(caja([[1001.0, '31/07/2025', 500], [' 1002 ', '31/07/2025', '250']]))
+
+    assert registros[archivo_plano.COLUMNAS_SALIDA].dtypes.astype(str).tolist() == [
+        'Int64', 'datetime64[us]', 'category', 'int64'
+    ]
+    assert registros['CONCEPTO'].dtype == archivo_plano.TIPO_CONCEPTO
+    assert list(registros['SAP']) == [1001, 1002]
+
+
+def test_filas_sin_sap_valido_se_emiten_y_se_reportan():
+    df = caja([
+        [1001, '31/07/2025', 500],
+        [None, '31/07/2025', 300],
+        ['ABC', '31/07/2025', 200],
+        [1003.5, '31/07/2025', 100],
+        [1004, '31/07/2025', 0],
+    ])
+    reporte = validacion.ReporteValidacion()
+    registros = registros_caja(df, reporte)
+
+    # Solo se descarta la fila con valor 0, como antes
+    assert len(registros) == 4
+    assert registros['SAP'].isna().tolist() == [False, True, True, True]
+    detalle = reporte.detalle()
+    assert detalle[['regla', 'fila']].astype(str).values.tolist() == [
+        ['sap_vacio', '3'], ['sap_invalido', '4'], ['sap_invalido', '5']
+    ]
+
+    estadisticas = archivo_plano.estadisticas_vacias()
+    archivo_plano.acumular_estadisticas(estadisticas, 'caja', registros)
+    assert estadisticas['caja'] == {'registros': 4, 'total': 1100, 'sin_sap': 3}
+    assert archivo_plano.calcular_estadisticas(registros)['caja'] == estadisticas['caja']
+
+
+def test_csv_con_sap_entero_y_vacio_si_no_es_valido():
+    registros = registros_caja(caja([[1001.0, '31/07/2025', 500], [None, '31/07/2025', 300]]))
+    csv = salida.codificar(archivo_plano.para_exportar(registros), "CSV (.csv)").decode('utf-8-sig')
+
+    assert csv.splitlines() == ['SAP;FECHA;CONCEPTO;VALOR', '1001;31.07.2025;Z498;500', ';31.07.2025;Z498;300']
@@ -0,0 +1,36 @@
+import pandas as pd
+import pytest
+
+import archivo_plano
+import salida
+
+
+@pytest.fixture
+def resultado(registros):
+    return registros([
+        [1001, '2025-07-05', 'Z498', 500],
+        [None, '2025-07-31', 'Y602', 20],
+        [1002, None, 'Y608', 7],
+    ])
+
+
+@pytest.mark.parametrize('formato, formato_fecha', [
+    ("CSV (.csv)", salida.FORMATO_FECHA_SAP),
+    # Formato de procesar_todo_simple
+    ("CSV (.csv)", '%d/%m/%Y'),
+    ("Excel (.xlsx)", salida.FORMATO_FECHA_SAP),
+    ("Excel (.xlsx)", '%d/%m/%Y'),
+    ("Parquet (.parquet)", salida.FORMATO_FECHA_SAP),
+    ("Arrow IPC (.arrow)", salida.FORMATO_FECHA_SAP),
+])
+def test_leer_resultado_recupera_lo_exportado(resultado, formato, formato_fecha):
+    datos = salida.codificar(resultado, formato, formato_fecha)
+
+    pd.testing.assert_frame_equal(archivo_plano.leer_resultado(datos), resultado)
+
+
+def test_fecha_no_interpretable_falla(resultado):
+    datos = salida.codificar(resultado, "CSV (.csv)").replace(b'05.07.2025', b'julio 5')
+
+    with pytest.raises(ValueError, match='1 fechas'):
+        archivo_plano.leer_resultado(datos)
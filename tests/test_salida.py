@@ -0,0 +1,63 @@
+import pandas as pd
+import pytest
+
+import salida
+
+
+@pytest.fixture
+def resultado(registros):
+    # Empleados con 1 a 3 registros, intercalados entre conceptos
+    filas = []
+    for sap, cantidad in [(1, 3), (2, 1), (3, 2), (4, 3), (5, 1), (6, 2)]:
+        for numero in range(cantidad):
+            concepto = ['Z498', 'Y602'][(sap + numero) % 2]
+            filas.append([sap, '2025-07-31', concepto, sap * 10 + numero])
+    return registros(filas[::-1])
+
+
+def test_ningun_sap_queda_en_dos_partes(resultado):
+    partes = list(salida.partes(resultado, 4))
+
+    assert [etiqueta for etiqueta, _ in partes] == [f"parte{n:03d}" for n in range(1, len(partes) + 1)]
+    assert all(len(parte) <= 4 for _, parte in partes)
+    vistos = set()
+    for _, parte in partes:
+        saps = set(parte['SAP'])
+        assert not saps & vistos
+        vistos |= saps
+    assert sum(len(parte) for _, parte in partes) == len(resultado)
+    assert sorted(pd.concat(parte for _, parte in partes)['VALOR']) == sorted(resultado['VALOR'])
+
+
+def test_por_concepto(resultado):
+    partes = list(salida.partes(resultado, 2, por_concepto=True))
+
+    for etiqueta, parte in partes:
+        assert parte['CONCEPTO'].nunique() == 1
+        assert etiqueta.startswith(f"{parte['CONCEPTO'].iloc[0]}_parte")
+        assert len(parte) <= 2
+    for concepto in ['Z498', 'Y602']:
+        vistos = set()
+        for _, parte in partes:
+            if parte['CONCEPTO'].iloc[0] == concepto:
+                assert not set(parte['SAP']) & vistos
+                vistos |= set(parte['SAP'])
+
+
+def test_filas_sin_sap_se_reparten(registros):
+    df = registros([[None, '2025-07-31', 'Z498', n] for n in range(5)] + [[1, '2025-07-31', 'Z498', 9]])
+    partes = list(salida.partes(df, 2))
+
+    assert [len(parte) for _, parte in partes] == [2, 2, 2]
+
+
+def test_empleado_con_mas_registros_que_el_tamano_de_parte(registros, resultado):
+    with pytest.raises(ValueError, match="El SAP 1 tiene más de 2 registros"):
+        list(salida.partes(resultado, 2))
+    with pytest.raises(ValueError, match="en Z498"):
+        list(salida.partes(registros([[7, '2025-07-31', 'Z498', n] for n in range(3)]), 2, por_concepto=True))
+
+
+def test_tamano_de_parte_invalido(resultado):
+    with pytest.raises(ValueError, match="al menos un registro"):
+        list(salida.partes(resultado, 0))
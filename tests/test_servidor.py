@@ -0,0 +1,120 @@
+import http.client
+import json
+import threading
+import time
+import uuid
+from datetime import datetime
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+import archivo_plano
+import manifiesto
+import salida
+import servidor
+
+
+@pytest.fixture
+def puerto(tmp_path, monkeypatch):
+    # Manifiesto y maestro por defecto quedan en un directorio propio de la prueba
+    monkeypatch.chdir(tmp_path)
+    http_servidor = ThreadingHTTPServer(('127.0.0.1', 0), servidor.ManejadorNomina)
+    hilo = threading.Thread(target=http_servidor.serve_forever, daemon=True)
+    hilo.start()
+    yield http_servidor.server_address[1]
+    http_servidor.shutdown()
+    http_servidor.server_close()
+
+
+@pytest.fixture
+def paquete(libro):
+    fecha = datetime(2025, 7, 31)
+    caja = libro('caja.xlsx', {'Hoja1': [
+        ['SAP', 'Fecha Terminación. (Digite)', 'DESCUADRES DE CAJA PARA DESCONTAR'], [1001, fecha, 1500], [1002, fecha, 0]
+    ]})
+    big_pass = libro('big_pass.xlsx', {'Hoja1': [
+        ['N° Sap ', 'Terminación', 'Descontar', 'Pagar', 'PEOPLE'], [2001, fecha, 100, 20, 0], [None, fecha, 5, 0, 0]
+    ]})
+    return {'caja': open(caja, 'rb').read(), 'big_pass': open(big_pass, 'rb').read()}
+
+
+def solicitar(puerto, metodo, ruta, cuerpo=b'', encabezados=None):
+    conexion = http.client.HTTPConnection('127.0.0.1', puerto, timeout=60)
+    try:
+        conexion.putrequest(metodo, ruta)
+        for nombre, valor in (encabezados or {}).items():
+            conexion.putheader(nombre, valor)
+        conexion.endheaders(cuerpo)
+        respuesta = conexion.getresponse()
+        return respuesta.status, dict(respuesta.getheaders()), respuesta.read()
+    finally:
+        conexion.close()
+
+
+def enviar(puerto, campos, consulta='formato=csv'):
+    limite = uuid.uuid4().hex
+    cuerpo = b''.join(
+        f'--{limite}\r\nContent-Disposition: form-data; name="{campo}"; filename="{campo}.xlsx"\r\n\r\n'.encode()
+        + datos + b'\r\n'
+        for campo, datos in campos.items()
+    ) + f'--{limite}--\r\n'.encode()
+    return solicitar(puerto, 'POST', f'/procesar?{consulta}', cuerpo, {
+        'Content-Type': f'multipart/form-data; boundary={limite}', 'Content-Length': str(len(cuerpo))
+    })
+
+
+def test_responde_el_archivo_plano_por_bloques(puerto, paquete):
+    estado, encabezados, cuerpo = enviar(puerto, paquete)
+
+    assert estado == 200
+    assert encabezados['Transfer-Encoding'] == 'chunked'
+    assert encabezados['X-Registros'] == '4'
+    assert encabezados['X-Registros-Sin-SAP'] == '1'
+    assert 'Server-Timing' in encabezados
+    df, _, _ = archivo_plano.generar_archivo_plano_concurrente(paquete['caja'], paquete['big_pass'])
+    assert cuerpo == salida.codificar(archivo_plano.para_exportar(df), "CSV (.csv)")
+
+
+def test_incremental_no_vuelve_a_emitir(puerto, paquete):
+    assert enviar(puerto, paquete, 'formato=parquet&incremental=1')[0] == 200
+    # El manifiesto se registra recién después de enviar la respuesta completa
+    limite = time.monotonic() + 10
+    while not manifiesto.Manifiesto().version and time.monotonic() < limite:
+        time.sleep(0.05)
+    estado, _, cuerpo = enviar(puerto, paquete, 'formato=parquet&incremental=1')
+    assert estado == 422
+    assert 'error' in json.loads(cuerpo)
+
+
+@pytest.mark.parametrize('campos, consulta, estado_esperado', [
+    ({'caja': b'x'}, 'formato=csv', 400),
+    ('completo', 'formato=doc', 400),
+    ({'caja': b'no es excel', 'big_pass': b'tampoco'}, 'formato=csv', 500),
+])
+def test_errores_en_json(puerto, paquete, campos, consulta, estado_esperado):
+    estado, encabezados, cuerpo = enviar(puerto, paquete if campos == 'completo' else campos, consulta)
+
+    assert estado == estado_esperado
+    assert encabezados['Content-Type'].startswith('application/json')
+    assert json.loads(cuerpo)['error']
+
+
+@pytest.mark.parametrize('cuerpo, encabezados, estado_esperado', [
+    (b'abc', {'Content-Type': 'text/plain', 'Content-Length': '3'}, 415),
+    (b'', {'Content-Type': 'multipart/form-data; boundary=x', 'Content-Length': '-5'}, 400),
+    (b'', {'Content-Type': 'multipart/form-data; boundary=x'}, 411),
+])
+def test_solicitudes_mal_formadas(puerto, cuerpo, encabezados, estado_esperado):
+    estado, _, cuerpo = solicitar(puerto, 'POST', '/procesar', cuerpo, encabezados)
+
+    assert estado == estado_esperado
+    assert json.loads(cuerpo)['error']
+    # Los cupos se liberan aunque la solicitud falle
+    assert servidor._en_curso == 0
+
+
+def test_estado_y_rutas(puerto):
+    estado, _, cuerpo = solicitar(puerto, 'GET', '/estado')
+    assert estado == 200
+    assert json.loads(cuerpo)['formatos'] == list(servidor.FORMATOS_EXTENSION)
+    assert solicitar(puerto, 'GET', '/otra')[0] == 404
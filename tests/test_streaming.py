@@ -0,0 +1,52 @@
+from datetime import datetime
+
+import pandas as pd
+import pytest
+
+import archivo_plano
+
+
+@pytest.fixture
+def paquete(libro):
+    encabezado_caja = ['SAP', 'Fecha Terminación. (Digite)', 'DESCUADRES DE CAJA PARA DESCONTAR']
+    filas_caja = [
+        [1000 + n, datetime(2025, 7, 1 + n % 28) if n % 3 else f"{1 + n % 28:02d}/07/2025", [0, 150, None, '80'][n % 4]]
+        for n in range(40)
+    ]
+    caja = libro('caja.xlsx', {
+        'Tienda 1': [encabezado_caja] + filas_caja[:25],
+        'Resumen': [['Total'], [1234]],
+        'Tienda 2': [encabezado_caja] + filas_caja[25:],
+    })
+    big_pass = libro('big_pass.xlsx', {'Hoja1': [['N° Sap ', 'Terminación', 'Descontar', 'Pagar', 'PEOPLE']] + [
+        [None if n == 7 else 2000 + n, f"{1 + n % 28:02d}-07-2025", n % 5, (n * 7) % 4, 'x' if n == 3 else n % 2]
+        for n in range(30)
+    ]})
+    return caja, big_pass
+
+
+@pytest.mark.parametrize('tamano_bloque', [4, archivo_plano.TAMANO_BLOQUE_STREAMING])
+def test_streaming_igual_al_modo_normal(paquete, tamano_bloque):
+    caja, big_pass = paquete
+    normal, estadisticas_normal, _ = archivo_plano.generar_archivo_plano_concurrente(caja, big_pass)
+
+    estadisticas = archivo_plano.estadisticas_vacias()
+    bloques = list(archivo_plano.generar_archivo_plano_streaming(caja, big_pass, estadisticas, tamano_bloque))
+    streaming = archivo_plano.ordenar_por_concepto(pd.concat(bloques, ignore_index=True))
+
+    pd.testing.assert_frame_equal(streaming, normal)
+    assert estadisticas == estadisticas_normal
+    assert set(streaming['HOJA'].dropna()) == {'Tienda 1', 'Tienda 2'}
+
+
+def test_mapeo_de_encabezados_igual_al_modo_normal(paquete, libro):
+    caja, _ = paquete
+    big_pass = libro('alias.xlsx', {'Hoja1': [['N° SAP', 'TERMINACION', 'Valor a descontar'], [1, '31/07/2025', 10]]})
+    normal = {}
+    archivo_plano.generar_archivo_plano_concurrente(caja, big_pass, mapeo_encabezados=normal)
+    streaming = {}
+    list(archivo_plano.generar_archivo_plano_streaming(caja, big_pass, archivo_plano.estadisticas_vacias(),
+                                                       mapeo_encabezados=streaming))
+
+    assert streaming == normal
+    assert normal['big_pass']['Hoja1']['N° Sap '] == 'N° SAP'
@@ -0,0 +1,136 @@
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+# Procesamientos simultáneos en el servidor (compartidos por todas las sesiones)
+MAX_TRABAJADORES = int(os.environ.get('NOMINA_TRABAJADORES', '2'))
+# Trabajos terminados que se conservan en memoria para recuperar su resultado
+MAX_TRABAJOS_TERMINADOS = 10
+
+EN_COLA = 'en_cola'
+EJECUTANDO = 'ejecutando'
+TERMINADO = 'terminado'
+ERROR = 'error'
+CANCELADO = 'cancelado'
+ESTADOS_FINALES = (TERMINADO, ERROR, CANCELADO)
+
+
+class Cancelado(Exception):
+    """Se lanza dentro del trabajo cuando se pidió cancelarlo"""
+
+
+class Trabajo:
+    """
+    Procesamiento en segundo plano. La función del trabajo recibe el propio
+    Trabajo y reporta su avance con avanzar(); ahí se revisa si se pidió
+    cancelar, así que la cancelación ocurre entre etapas.
+    """
+
+    def __init__(self, clave=None, descripcion=''):
+        self.id = uuid.uuid4().hex[:12]
+        self.clave = clave
+        self.descripcion = descripcion
+        self.estado = EN_COLA
+        self.progreso = 0.0
+        self.texto = 'En cola'
+        self.resultado = None
+        self.error = None
+        self.creado = time.time()
+        self.inicio = None
+        self.fin = None
+        self.futuro = None
+        self._cancelar = threading.Event()
+
+    @property
+    def terminado(self):
+        return self.estado in ESTADOS_FINALES
+
+    def avanzar(self, fraccion, texto):
+        """Actualiza el avance; lanza Cancelado si se pidió cancelar"""
+        if self._cancelar.is_set():
+            raise Cancelado()
+        self.progreso = fraccion
+        self.texto = texto
+
+    def cancelar(self):
+        """Pide cancelar; si aún no empezó, se descarta de la cola"""
+        self._cancelar.set()
+        if self.futuro is not None and self.futuro.cancel():
+            self.estado = CANCELADO
+            self.fin = time.time()
+
+    def segundos(self):
+        """Tiempo de ejecución hasta ahora (o total si ya terminó)"""
+        if self.inicio is None:
+            return 0.0
+        return (self.fin or time.time()) - self.inicio
+
+
+_pool = ThreadPoolExecutor(max_workers=MAX_TRABAJADORES, thread_name_prefix='nomina')
+_trabajos = {}
+_candado = threading.Lock()
+
+
+def _ejecutar(trabajo, funcion, args, kwargs):
+    if trabajo._cancelar.is_set():
+        trabajo.estado = CANCELADO
+        trabajo.fin = time.time()
+        return
+    trabajo.estado = EJECUTANDO
+    trabajo.inicio = time.time()
+    try:
+        trabajo.resultado = funcion(trabajo, *args, **kwargs)
+        trabajo.progreso = 1.0
+        trabajo.estado = TERMINADO
+    except Cancelado:
+        trabajo.estado = CANCELADO
+    except Exception as e:
+        trabajo.error = str(e)
+        trabajo.estado = ERROR
+    finally:
+        trabajo.fin = time.time()
+
+
+def _depurar():
+    """Descarta los trabajos terminados más antiguos por encima del límite"""
+    terminados = sorted(
+        (t for t in _trabajos.values() if t.terminado),
+        key=lambda t: t.fin or t.creado
+    )
+    for trabajo in terminados[:max(0, len(terminados) - MAX_TRABAJOS_TERMINADOS)]:
+        del _trabajos[trabajo.id]
+
+
+def enviar(funcion, *args, clave=None, descripcion='', **kwargs):
+    """
+    Encola funcion(trabajo, *args, **kwargs) y retorna el id del trabajo.
+    Si ya hay un trabajo activo con la misma clave, retorna ese id en vez
+    de duplicar el procesamiento.
+    """
+    with _candado:
+        if clave is not None:
+            for trabajo in _trabajos.values():
+                if trabajo.clave == clave and not trabajo.terminado:
+                    return trabajo.id
+        _depurar()
+        trabajo = Trabajo(clave, descripcion)
+        _trabajos[trabajo.id] = trabajo
+        trabajo.futuro = _pool.submit(_ejecutar, trabajo, funcion, args, kwargs)
+        return trabajo.id
+
+
+def obtener(id_trabajo):
+    """Trabajo con ese id, o None si no existe o ya fue descartado"""
+    with _candado:
+        return _trabajos.get(id_trabajo)
+
+
+def cancelar(id_trabajo):
+    """Pide cancelar el trabajo; True si existía y no había terminado"""
+    trabajo = obtener(id_trabajo)
+    if trabajo is None or trabajo.terminado:
+        return False
+    trabajo.cancelar()
+    return True
@@ -0,0 +1,71 @@
+import threading
+
+import pandas as pd
+
+# Reglas de validación, en el orden en que se reportan
+REGLAS = {
+    'sap_vacio': "SAP vacío",
+    'sap_invalido': "SAP no numérico o con decimales (queda vacío)",
+    'fecha_vacia': "Fecha vacía",
+    'fecha_invalida': "Fecha no interpretable (queda vacía)",
+    'valor_no_numerico': "Valor no numérico (fila descartada)",
+    'valor_no_entero': "Valor con decimales (se trunca a entero)",
+    'duplicado': "SAP repetido en el mismo concepto",
+    'sap_desconocido': "SAP que no está en el maestro de empleados",
+    'sin_retiro': "Empleado sin fecha de retiro en el maestro",
+    'fecha_retiro_distinta': "Fecha distinta a la de retiro del maestro"
+}
+
+COLUMNAS_DETALLE = ['regla', 'concepto', 'hoja', 'fila', 'columna', 'valor']
+
+
+class ReporteValidacion:
+    """
+    Incidencias encontradas al generar el archivo plano. Cada regla se
+    evalúa con máscaras sobre columnas completas y se agrega de una vez con
+    todas sus filas; fila es el número de fila en el Excel de origen y valor
+    el dato original tal cual. Con maestro (MaestroEmpleados) se revisa
+    además que cada SAP exista y que el empleado figure como retirado.
+    """
+
+    def __init__(self, maestro=None):
+        self.maestro = maestro
+        self.partes = []
+        self._candado = threading.Lock()
+
+    def agregar(self, regla, concepto, columna, filas, valores, hojas=None):
+        """Registra las filas (arreglos alineados) que no cumplen la regla"""
+        if len(filas) == 0:
+            return
+        parte = pd.DataFrame({
+            'regla': regla,
+            'concepto': concepto,
+            'hoja': hojas,
+            'fila': filas,
+            'columna': columna,
+            'valor': valores
+        }, columns=COLUMNAS_DETALLE)
+        with self._candado:
+            self.partes.append(parte)
+
+    def detalle(self):
+        """DataFrame con una fila por incidencia, ordenado por regla, concepto y fila"""
+        if not self.partes:
+            return pd.DataFrame(columns=COLUMNAS_DETALLE)
+        detalle = pd.concat(self.partes, ignore_index=True)
+        detalle['regla'] = pd.Categorical(detalle['regla'], categories=list(REGLAS))
+        return detalle.sort_values(['regla', 'concepto', 'hoja', 'fila'], kind='stable').reset_index(drop=True)
+
+
+def resumen(detalle):
+    """Cantidad de filas por regla y concepto, con la descripción de la regla"""
+    if detalle is None or detalle.empty:
+        return pd.DataFrame(columns=['regla', 'descripcion', 'concepto', 'filas'])
+    conteo = detalle.groupby(['regla', 'concepto'], observed=True).size().reset_index(name='filas')
+    conteo.insert(1, 'descripcion', conteo['regla'].map(REGLAS).astype(str))
+    return conteo
+
+
+def a_csv(detalle):
+    """Detalle en CSV (utf-8 con BOM, separado por ';') para descargar"""
+    return detalle.to_csv(index=False, sep=';').encode('utf-8-sig')